@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import asyncpg
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import archive
+import db
+import migrate
+import repository
+import search
+
+logger = logging.getLogger(__name__)
+
+# Бенчмарк запросов бота на синтетическом каталоге. Данные создаются в
+# отдельной базе (по умолчанию itmo_eve_bench) на сервере из database.ini,
+# запросы берутся из тех же модулей, что использует бот.
+
+TITLE_WORDS = ['Лекция', 'Хакатон', 'Концерт', 'Workshop', 'Meetup', 'Турнир', 'Семинар', 'Conference']
+TOPIC_WORDS = ['по машинному обучению', 'по Python', 'о базах данных', 'robotics', 'design', 'по шахматам',
+               'startup', 'по физике']
+LOCATIONS = ['Кронверкский 49', 'Ломоносова 9', 'Биржевая линия 14', 'Гривцова 14', 'online']
+SEARCH_TERMS = ['хакатон', 'python', 'robotics', 'шахматы', 'лекция физика', 'Кронверкский', 'design startup']
+# Срок хранения прошедших мероприятий в каталоге, как ARCHIVE_AFTER_DAYS по умолчанию
+ARCHIVE_AFTER = timedelta(days=30)
+# Мероприятий на странице списка, как EVENT_LIST_PAGE_SIZE по умолчанию
+LIST_PAGE_SIZE = 10
+
+SEED_USERS = "INSERT INTO users (user_id) SELECT g FROM generate_series(1, $1) g"
+# Организаторами выступает каждый двадцатый пользователь; даты разбросаны на год
+# назад и вперёд и не совпадают с порядком event_id
+SEED_EVENTS = """
+    INSERT INTO events (user_id, title, description, event_date, location, useful_links)
+    SELECT 1 + ((g * 7919) % $2) * 20,
+           ($4::text[])[1 + g % 8] || ' ' || ($5::text[])[1 + (g / 8) % 8] || ' #' || g,
+           'Описание мероприятия номер ' || g,
+           $3::timestamp + (g * 7907 % 730) * interval '1 day' + (g % 24) * interval '1 hour',
+           ($6::text[])[1 + g % 5],
+           'https://itmo.ru/events/' || g
+    FROM generate_series(1, $1) g
+"""
+# Уникальные пары (event_id, user_id): для каждого мероприятия участники идут
+# подряд по кругу пользователей со своим сдвигом
+SEED_PARTICIPANTS = """
+    INSERT INTO participants (event_id, user_id)
+    SELECT 1 + g % $2, 1 + (g / $2 + (g % $2) * 31) % $3
+    FROM generate_series(0, $1 - 1) g
+"""
+SEED_STATS = (
+    "INSERT INTO event_stats (event_id, participants_count)"
+    " SELECT event_id, count(*) FROM participants GROUP BY event_id"
+)
+
+def count_rows(result):
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        # Статус команды: "INSERT 0 1", "DELETE 1", "UPDATE 3"
+        last = result.rsplit(' ', 1)[-1]
+        return int(last) if last.isdigit() else 0
+    return 0 if result is None else 1
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.rows = defaultdict(int)
+        self.recording = True
+
+    async def call(self, name, method, query, *args):
+        start = time.perf_counter()
+        result = await method(query, *args)
+        elapsed = time.perf_counter() - start
+        if self.recording:
+            self.samples[name].append(elapsed)
+            self.rows[name] += count_rows(result)
+        return result
+
+    def report(self):
+        results = {}
+        for name, samples in self.samples.items():
+            results[name] = {
+                'calls': len(samples),
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p95_ms': percentile(samples, 0.95) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'rows_per_call': self.rows[name] / len(samples),
+            }
+        return results
+
+async def prepare_database(config, name, reset):
+    admin = await asyncpg.connect(**dict(config, database='postgres'))
+    try:
+        exists = await admin.fetchval("SELECT EXISTS (SELECT 1 FROM pg_database WHERE datname = $1)", name)
+        if exists and reset:
+            await admin.execute(f'DROP DATABASE "{name}"')
+            exists = False
+        if not exists:
+            await admin.execute(f'CREATE DATABASE "{name}" TEMPLATE template0 ENCODING \'UTF8\'')
+            logger.info("Создана база %s", name)
+    finally:
+        await admin.close()
+
+async def seed(conn, users, events, participants):
+    if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM events)"):
+        logger.info("База уже заполнена, используются существующие данные (--reset для пересоздания)")
+        return
+    if participants > events * users:
+        raise ValueError('Участников больше, чем возможных пар (мероприятие, пользователь)')
+    organizers = max(1, users // 20)
+    start = time.perf_counter()
+    async with conn.transaction():
+        # Уведомления об изменении мероприятий при загрузке не нужны
+        await conn.execute("ALTER TABLE events DISABLE TRIGGER events_changed_notify")
+        await conn.execute(SEED_USERS, users)
+        await conn.execute(
+            SEED_EVENTS, events, organizers, datetime.now() - timedelta(days=365),
+            TITLE_WORDS, TOPIC_WORDS, LOCATIONS
+        )
+        await conn.execute(SEED_PARTICIPANTS, participants, events, users)
+        await conn.execute(SEED_STATS)
+        # Как в работающем боте: давно прошедшие мероприятия уже в архиве
+        archived = await archive.archive_events(conn, datetime.now() - ARCHIVE_AFTER, batch_size=events)
+        await conn.execute("ALTER TABLE events ENABLE TRIGGER events_changed_notify")
+    await conn.execute("VACUUM ANALYZE")
+    logger.info(
+        "Загружено %s пользователей, %s мероприятий (%s в архиве), %s подписок за %.1f с",
+        users, events, archived, participants, time.perf_counter() - start
+    )
+
+# Один проход по сценариям бота. Пишущие сценарии возвращают данные в
+# исходное состояние, поэтому прогоны можно повторять на той же базе.
+async def run_iteration(conn, recorder, rng, sample, users, spare_user, archived_sample):
+    event_id, owner_id = rng.choice(sample)
+    archived_id = rng.choice(archived_sample) if archived_sample else None
+    user_id = rng.randint(1, users)
+
+    await recorder.call('catalog_order', conn.fetch, repository.ORDER_QUERY, datetime.now())
+    await recorder.call('catalog_event', conn.fetchrow, repository.EVENT_QUERY, event_id)
+    await recorder.call('catalog_event_state', conn.fetchrow, repository.EVENT_STATE_QUERY, event_id, user_id)
+    await recorder.call('events_popular', conn.fetch, repository.POPULAR_QUERY, 10, datetime.now())
+    # Каталог без кэша (нет подписки на уведомления)
+    await recorder.call('catalog_page_next', conn.fetchrow, repository.CATALOG_PAGE['next'], datetime.now(), event_id)
+    await recorder.call(
+        'catalog_list_next', conn.fetch, repository.CATALOG_LIST['next'], datetime.now(), LIST_PAGE_SIZE, event_id
+    )
+
+    page_ids = [page_event_id for page_event_id, _ in rng.sample(sample, min(LIST_PAGE_SIZE, len(sample)))]
+    await recorder.call('catalog_events', conn.fetch, repository.EVENTS_QUERY, page_ids)
+    await recorder.call('catalog_list_state', conn.fetch, repository.LIST_STATE_QUERY, user_id, page_ids)
+
+    await recorder.call('personal_page_first', conn.fetchrow, repository.PERSONAL_PAGE['first'], owner_id)
+    for direction in ('current', 'next', 'prev'):
+        await recorder.call(f'personal_page_{direction}', conn.fetchrow, repository.PERSONAL_PAGE[direction], owner_id, event_id)
+    await recorder.call('personal_list_first', conn.fetch, repository.PERSONAL_LIST['first'], owner_id, LIST_PAGE_SIZE)
+    await recorder.call(
+        'personal_list_next', conn.fetch, repository.PERSONAL_LIST['next'], owner_id, LIST_PAGE_SIZE, event_id
+    )
+
+    await recorder.call('archive_page_first', conn.fetchrow, repository.ARCHIVE_PAGE['first'])
+    if archived_id is not None:
+        await recorder.call('archive_page_next', conn.fetchrow, repository.ARCHIVE_PAGE['next'], archived_id)
+
+    await recorder.call(
+        'search_fulltext', conn.fetch, search.FULLTEXT_QUERY,
+        rng.choice(SEARCH_TERMS), search.PAGE_SIZE + 1, 0
+    )
+
+    await recorder.call('participant_insert', conn.execute, repository.SUBSCRIBE, event_id, spare_user)
+    await recorder.call('participant_delete', conn.execute, repository.UNSUBSCRIBE, event_id, spare_user)
+
+    event_date = datetime.now() + timedelta(days=rng.randint(1, 365))
+    new_id = await recorder.call(
+        'event_insert', conn.fetchval, repository.INSERT_EVENT,
+        owner_id, 'Бенчмарк', 'Мероприятие бенчмарка', event_date, 'online', 'https://itmo.ru'
+    )
+    await recorder.call(
+        'event_update', conn.fetchval, repository.UPDATE_EVENT,
+        'Бенчмарк', 'Изменённое мероприятие', event_date + timedelta(hours=1), 'online', 'https://itmo.ru',
+        new_id, owner_id
+    )
+    async with conn.transaction():
+        await recorder.call('event_lock_own', conn.fetchval, repository.LOCK_OWN_EVENT, new_id, owner_id)
+        await recorder.call('event_delete', conn.execute, repository.DELETE_EVENT, new_id)
+
+async def load_sample(conn, size, rng):
+    rows = await conn.fetch("SELECT event_id, user_id FROM events ORDER BY event_id")
+    events = [(row['event_id'], row['user_id']) for row in rows]
+    return rng.sample(events, min(size, len(events)))
+
+async def load_archived_sample(conn, size, rng):
+    rows = await conn.fetch("SELECT event_id FROM events_archive")
+    return rng.sample([row['event_id'] for row in rows], min(size, len(rows)))
+
+def print_report(results):
+    print(f"{'запрос':<28}{'вызовов':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'строк/вызов':>13}")
+    for name, result in results.items():
+        print(
+            f"{name:<28}{result['calls']:>9}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+            f"{result['p99_ms']:>10.2f}{result['rows_per_call']:>13.1f}"
+        )
+
+async def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк запросов бота itmo.eve на синтетическом каталоге')
+    parser.add_argument('--database', default='itmo_eve_bench', help='имя базы для бенчмарка (создаётся при необходимости)')
+    parser.add_argument('--reset', action='store_true', help='пересоздать базу и загрузить данные заново')
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--events', type=int, default=100_000)
+    parser.add_argument('--participants', type=int, default=1_000_000)
+    parser.add_argument('--iterations', type=int, default=300, help='проходов по сценариям')
+    parser.add_argument('--warmup', type=int, default=20, help='проходов без учёта времени')
+    parser.add_argument('--seed', type=int, default=42, help='зерно генератора случайных параметров')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    args = parser.parse_args()
+
+    config = db.load_config()
+    if args.database == config.get('database'):
+        parser.error('бенчмарк нельзя запускать на рабочей базе бота')
+
+    await prepare_database(config, args.database, args.reset)
+    conn = await asyncpg.connect(**dict(config, database=args.database))
+    try:
+        await migrate.apply_migrations(conn)
+        await seed(conn, args.users, args.events, args.participants)
+
+        rng = random.Random(args.seed)
+        sample = await load_sample(conn, max(args.iterations + args.warmup, 1000), rng)
+        archived_sample = await load_archived_sample(conn, 1000, rng)
+        users = await conn.fetchval("SELECT max(user_id) FROM users WHERE user_id <= $1", args.users)
+        # Пользователь без подписок для сценария подписки и отписки
+        spare_user = args.users + 1
+        await conn.execute(repository.INSERT_USER, spare_user)
+
+        recorder = Recorder()
+        recorder.recording = False
+        for _ in range(args.warmup):
+            await run_iteration(conn, recorder, rng, sample, users, spare_user, archived_sample)
+        recorder.recording = True
+        for _ in range(args.iterations):
+            await run_iteration(conn, recorder, rng, sample, users, spare_user, archived_sample)
+    finally:
+        await conn.close()
+
+    results = recorder.report()
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    asyncio.run(main())
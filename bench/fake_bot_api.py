@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Локальная замена Bot API для нагрузочного теста (load_test.py). Бот
+# обращается к ней через TELEGRAM_API_URL, как к api.telegram.org: обновления
+# отдаются через getUpdates, ответы бота принимаются и передаются стенду.
+# Задержка каждого ответа и доля ответов 429 настраиваются.
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'itmo.eve', 'username': 'itmo_eve_load_bot'}
+# Методы, которыми бот показывает экран или отвечает на нажатие
+SCREEN_METHODS = {'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendDocument'}
+REPLY_METHODS = SCREEN_METHODS | {'answerCallbackQuery', 'deleteMessage'}
+# Long polling getUpdates держит запрос не дольше этого времени
+MAX_POLL_TIMEOUT = 5
+
+# Ответ бота, полученный стендом: метод, параметры и время получения
+class ApiCall:
+    __slots__ = ('method', 'params', 'received_at', 'message')
+
+    def __init__(self, method, params, received_at, message=None):
+        self.method = method
+        self.params = params
+        self.received_at = received_at
+        self.message = message
+
+def decode_params(params):
+    decoded = {}
+    for key, value in params.items():
+        if isinstance(value, str) and key in ('reply_markup', 'allowed_updates', 'entities'):
+            value = json.loads(value)
+        decoded[key] = value
+    return decoded
+
+class FakeBotApi:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.rejected = Counter()
+        # Все ответы бота по чатам, включая отклонённые с 429
+        self.chat_calls = Counter()
+        self.updates = asyncio.Queue()
+        self._update_id = 0
+        self._message_ids = defaultdict(int)
+        self._messages = defaultdict(dict)
+        self._listeners = {}
+        self._runner = None
+
+    # ---- Обновления для бота ----
+
+    def next_update_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    def push_update(self, update):
+        self.updates.put_nowait(update)
+
+    # Пользователь стенда получает ответы бота в свою очередь
+    def listen(self, chat_id):
+        queue = asyncio.Queue()
+        self._listeners[chat_id] = queue
+        return queue
+
+    def forget(self, chat_id):
+        self._listeners.pop(chat_id, None)
+        self.chat_calls.pop(chat_id, None)
+        self._messages.pop(chat_id, None)
+        self._message_ids.pop(chat_id, None)
+
+    # ---- Сообщения ----
+
+    def store_message(self, chat_id, text=None, reply_markup=None, message_id=None):
+        if message_id is None:
+            self._message_ids[chat_id] += 1
+            message_id = self._message_ids[chat_id]
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if text is not None:
+            message['text'] = text
+        if reply_markup:
+            message['reply_markup'] = reply_markup
+        self._messages[chat_id][message_id] = message
+        return message
+
+    def user_message(self, chat_id, text):
+        self._message_ids[chat_id] += 1
+        return {
+            'message_id': self._message_ids[chat_id],
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+            'text': text,
+        }
+
+    # ---- Методы Bot API ----
+
+    def chat_of(self, method, params):
+        if method == 'answerCallbackQuery':
+            # id нажатия стенд формирует как "<user_id>-<номер>"
+            return int(params['callback_query_id'].partition('-')[0])
+        chat_id = params.get('chat_id')
+        return int(chat_id) if chat_id is not None else None
+
+    def result(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'sendDocument'):
+            return self.store_message(int(params['chat_id']), params.get('text'), params.get('reply_markup'))
+        if method in ('editMessageText', 'editMessageReplyMarkup'):
+            chat_id, message_id = int(params['chat_id']), int(params['message_id'])
+            previous = self._messages[chat_id].get(message_id, {})
+            text = params.get('text', previous.get('text'))
+            return self.store_message(chat_id, text, params.get('reply_markup'), message_id)
+        if method == 'deleteMessage':
+            self._messages[int(params['chat_id'])].pop(int(params['message_id']), None)
+        return True
+
+    async def get_updates(self, params):
+        timeout = min(float(params.get('timeout') or 0), MAX_POLL_TIMEOUT)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout) if timeout else self.updates.get_nowait())
+        except (asyncio.TimeoutError, asyncio.QueueEmpty):
+            return []
+        limit = int(params.get('limit') or 100)
+        while len(updates) < limit and not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = decode_params(dict(await request.post()))
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self.get_updates(params)})
+
+        chat_id = self.chat_of(method, params) if method in REPLY_METHODS else None
+        if chat_id is not None:
+            self.chat_calls[chat_id] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        if chat_id is not None and self.rng.random() < self.error_rate:
+            self.rejected[method] += 1
+            return web.json_response({
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+
+        result = self.result(method, params)
+        if chat_id is not None:
+            listener = self._listeners.get(chat_id)
+            if listener is not None:
+                message = result if isinstance(result, dict) else None
+                listener.put_nowait(ApiCall(method, params, time.perf_counter(), message))
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application(client_max_size=20 * 1024 ** 2)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        logger.info("Заглушка Bot API слушает http://%s:%s", host, port)
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
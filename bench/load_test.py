@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import aiohttp
+import asyncpg
+from dotenv import load_dotenv
+
+from db_bench import prepare_database, seed, percentile
+from fake_bot_api import FakeBotApi, SCREEN_METHODS
+
+import db
+import migrate
+
+logger = logging.getLogger(__name__)
+
+# Нагрузочный тест бота целиком: бот запускается отдельным процессом с
+# TELEGRAM_API_URL, указывающим на локальную заглушку Bot API (fake_bot_api.py),
+# а виртуальные пользователи проходят сценарии — /start, создание мероприятия,
+# листание каталога, подписка и отписка — с заданной частотой запуска.
+# Задержка шага — от передачи обновления боту до ответа бота в заглушку.
+
+BOT_TOKEN = '123456:load-test'
+WEBHOOK_SECRET = 'load-test-secret'
+# id виртуальных пользователей не пересекаются с пользователями из db_bench.seed,
+# а каждый прогон продолжает id после пользователей прошлых прогонов
+FIRST_USER_ID = 10_000_000
+READY_TIMEOUT = 60
+BOT_STOP_TIMEOUT = 60
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# Шаг сценария: сообщение с текстом или нажатие кнопки, в тексте которой есть
+# value. Шаг завершён, когда бот показал экран с expect в тексте или на кнопках
+# (без expect — любой экран или ответ на нажатие).
+class Step:
+    __slots__ = ('kind', 'value', 'expect', 'label')
+
+    def __init__(self, kind, value, expect=None, label=None):
+        self.kind = kind
+        self.value = value
+        self.expect = expect
+        self.label = f"{kind}:{label or value}"
+
+def text(value, expect=None, label=None):
+    return Step('text', value, expect, label)
+
+def press(button, expect=None):
+    return Step('press', button, expect)
+
+def event_date_text():
+    return (datetime.now() + timedelta(days=30)).strftime('%d.%m.%Y %H:%M')
+
+JOURNEYS = {
+    'browse': lambda: [
+        text('/start', 'Привет'),
+        press('Показать команды', 'список мероприятий'),
+        press('список мероприятий', 'Предстоящие'),
+        press('Следующие', 'Предстоящие'),
+        press('Следующие', 'Предстоящие'),
+        press('1', 'Название'),
+        press('Следующее', 'Название'),
+        press('Домой', 'Привет'),
+    ],
+    'subscribe': lambda: [
+        text('/start', 'Привет'),
+        text('/list', 'Предстоящие'),
+        press('2', 'Записаться'),
+        press('Записаться', 'Отписаться'),
+        press('К списку', '✅'),
+        press('1', 'Отписаться'),
+        press('Отписаться', 'Записаться'),
+    ],
+    'create': lambda: [
+        text('/start', 'Привет'),
+        text('/create', 'название'),
+        text('Нагрузочный тест', 'описание'),
+        text('Мероприятие нагрузочного теста', 'дату'),
+        text(event_date_text(), 'место', label='<дата>'),
+        text('online', 'ссылку'),
+        text('https://itmo.ru', 'Привет'),
+    ],
+}
+
+class JourneyFailed(Exception):
+    pass
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in JOURNEYS:
+            raise argparse.ArgumentTypeError(f'неизвестный сценарий: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+def buttons(message):
+    markup = (message or {}).get('reply_markup') or {}
+    return [button for row in markup.get('inline_keyboard', []) for button in row]
+
+def shows(call, expect):
+    if expect is None:
+        return True
+    if call.method not in SCREEN_METHODS or call.message is None:
+        return False
+    return expect in (call.message.get('text') or '') or any(expect in button['text'] for button in buttons(call.message))
+
+class Results:
+    def __init__(self):
+        self.step_latency = defaultdict(list)
+        self.journey_latency = defaultdict(list)
+        self.journey_calls = defaultdict(list)
+        self.completed = Counter()
+        self.failed = Counter()
+        self.updates = 0
+
+    def report(self, elapsed, api):
+        def summary(samples):
+            return {
+                'count': len(samples),
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p95_ms': percentile(samples, 0.95) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+            }
+        all_steps = [sample for samples in self.step_latency.values() for sample in samples]
+        return {
+            'elapsed_s': elapsed,
+            'updates': self.updates,
+            'updates_per_s': self.updates / elapsed if elapsed else 0.0,
+            'journeys_completed': dict(self.completed),
+            'journeys_failed': dict(self.failed),
+            'latency': summary(all_steps) if all_steps else None,
+            'steps': {label: summary(samples) for label, samples in self.step_latency.items()},
+            'journeys': {
+                name: dict(summary(self.journey_latency[name]), api_calls=sum(calls) / len(calls))
+                for name, calls in self.journey_calls.items()
+            },
+            'api_calls': dict(api.calls),
+            'api_rejected_429': dict(api.rejected),
+        }
+
+# Виртуальный пользователь: отправляет обновления от своего имени и ждёт ответы
+# бота в свою очередь заглушки. Кнопки берутся из последнего экрана с клавиатурой.
+class VirtualUser:
+    def __init__(self, api, deliver, user_id, step_timeout):
+        self.api = api
+        self.deliver = deliver
+        self.user_id = user_id
+        self.step_timeout = step_timeout
+        self.replies = api.listen(user_id)
+        self.screen = None
+        self.presses = 0
+
+    def user(self):
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f'user{self.user_id}'}
+
+    def build_update(self, step):
+        update = {'update_id': self.api.next_update_id()}
+        if step.kind == 'text':
+            update['message'] = self.api.user_message(self.user_id, step.value)
+            return update
+        button = next((button for button in buttons(self.screen) if step.value in button['text']), None)
+        if button is None or 'callback_data' not in button:
+            raise JourneyFailed(f'нет кнопки «{step.value}»')
+        self.presses += 1
+        update['callback_query'] = {
+            'id': f'{self.user_id}-{self.presses}',
+            'from': self.user(),
+            'chat_instance': str(self.user_id),
+            'message': self.screen,
+            'data': button['callback_data'],
+        }
+        return update
+
+    async def run_step(self, step):
+        update = self.build_update(step)
+        sent_at = time.perf_counter()
+        await self.deliver(update)
+        deadline = sent_at + self.step_timeout
+        while True:
+            try:
+                call = await asyncio.wait_for(self.replies.get(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                raise JourneyFailed('нет ответа')
+            if call.message is not None and buttons(call.message):
+                self.screen = call.message
+            if call.method == 'answerCallbackQuery' and call.params.get('show_alert') in (True, 'true'):
+                raise JourneyFailed(f"ошибка: {call.params.get('text')}")
+            if shows(call, step.expect):
+                return call.received_at - sent_at
+
+async def run_journey(api, deliver, results, name, user_id, step_timeout):
+    user = VirtualUser(api, deliver, user_id, step_timeout)
+    started = time.perf_counter()
+    try:
+        for step in JOURNEYS[name]():
+            latency = await user.run_step(step)
+            results.updates += 1
+            results.step_latency[step.label].append(latency)
+    except JourneyFailed as e:
+        results.failed[f'{name}: {e}'] += 1
+        return
+    finally:
+        calls = api.chat_calls[user_id]
+        api.forget(user_id)
+    results.completed[name] += 1
+    results.journey_calls[name].append(calls)
+    results.journey_latency[name].append(time.perf_counter() - started)
+
+# Сценарии запускаются с частотой rate в секунду в течение duration секунд;
+# затем тест дожидается уже начатых сценариев
+async def run_load(api, deliver, mix, rate, duration, step_timeout, rng, first_user_id):
+    results = Results()
+    names, weights = list(mix), list(mix.values())
+    tasks = set()
+    started = time.perf_counter()
+    user_id = first_user_id
+    while time.perf_counter() - started < duration:
+        name = rng.choices(names, weights)[0]
+        task = asyncio.get_running_loop().create_task(run_journey(api, deliver, results, name, user_id, step_timeout))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        user_id += 1
+        await asyncio.sleep(rng.expovariate(rate))
+    if tasks:
+        await asyncio.wait(set(tasks))
+    return results, time.perf_counter() - started
+
+class WebhookDelivery:
+    def __init__(self, url):
+        self.url = url
+        self.session = aiohttp.ClientSession(headers={'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET})
+        self.errors = 0
+
+    async def __call__(self, update):
+        async with self.session.post(self.url, json=update) as response:
+            if response.status != 200:
+                self.errors += 1
+
+    async def close(self):
+        await self.session.close()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_bot(api_url, args, webhook_port, log_file):
+    env = dict(
+        os.environ,
+        TOKEN=BOT_TOKEN,
+        TELEGRAM_API_URL=api_url,
+        DATABASE_NAME=args.database,
+        DB_MIGRATE_ON_STARTUP='0',
+        METRICS_PORT='0',
+        WEBHOOK_SECRET=WEBHOOK_SECRET,
+        WEBHOOK_HOST='127.0.0.1',
+        WEBHOOK_PORT=str(webhook_port),
+        WEBHOOK_PATH='/webhook',
+        WEBHOOK_URL='',
+    )
+    command = [sys.executable, os.path.join(SRC_DIR, 'main.py'), '--mode', args.mode, '--workers', str(args.workers)]
+    return subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+async def wait_ready(api, args, webhook_port, bot_process):
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if bot_process is not None and bot_process.poll() is not None:
+            raise RuntimeError(f'бот завершился с кодом {bot_process.returncode}, см. {args.bot_log}')
+        if args.mode == 'polling' and api.calls['getUpdates']:
+            return
+        if args.mode == 'webhook':
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', webhook_port)
+                writer.close()
+                return
+            except OSError:
+                pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError('бот не начал принимать обновления')
+
+# Рабочие процессы (--workers) поднимаются после того, как основной процесс начал
+# принимать обновления, поэтому до замеров каждый из них отвечает на /start.
+# Рабочий процесс выбирается по user_id, и подряд идущие id попадают во все.
+async def warm_up(api, deliver, workers, first_user_id):
+    users = [VirtualUser(api, deliver, first_user_id + shard, READY_TIMEOUT) for shard in range(max(workers, 1))]
+    try:
+        await asyncio.gather(*(user.run_step(text('/start', 'Привет')) for user in users))
+    except JourneyFailed as e:
+        raise RuntimeError(f'бот не ответил на /start при прогреве: {e}')
+    finally:
+        for user in users:
+            api.forget(user.user_id)
+
+def stop_bot(bot_process):
+    bot_process.terminate()
+    try:
+        bot_process.wait(BOT_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        bot_process.kill()
+        bot_process.wait()
+
+async def prepare(args):
+    config = db.load_config()
+    if args.database == config.get('database'):
+        raise ValueError('нагрузочный тест нельзя запускать на рабочей базе бота')
+    await prepare_database(config, args.database, args.reset)
+    conn = await asyncpg.connect(**dict(config, database=args.database))
+    try:
+        await migrate.apply_migrations(conn)
+        await seed(conn, args.users, args.events, args.participants)
+        return max(FIRST_USER_ID, await conn.fetchval("SELECT max(user_id) + 1 FROM users"))
+    finally:
+        await conn.close()
+
+def print_report(report):
+    print(f"Длительность {report['elapsed_s']:.1f} с, обновлений {report['updates']} "
+          f"({report['updates_per_s']:.1f}/с)")
+    print(f"Сценарии: завершено {report['journeys_completed']}, не завершено {report['journeys_failed']}")
+    print(f"{'шаг':<40}{'шагов':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    rows = list(report['steps'].items())
+    if report['latency']:
+        rows.append(('все шаги', report['latency']))
+    for label, summary in rows:
+        print(f"{label:<40}{summary['count']:>8}{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}")
+    print(f"{'сценарий':<40}{'прошло':>8}{'p50, мс':>10}{'p95, мс':>10}{'вызовов API':>14}")
+    for name, summary in report['journeys'].items():
+        print(f"{name:<40}{summary['count']:>8}{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}{summary['api_calls']:>14.1f}")
+    print(f"Вызовы API: {report['api_calls']}")
+    print(f"Отклонено с 429: {report['api_rejected_429']}")
+
+async def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота itmo.eve с заглушкой Bot API')
+    parser.add_argument('--database', default='itmo_eve_load', help='имя базы для теста (создаётся при необходимости)')
+    parser.add_argument('--reset', action='store_true', help='пересоздать базу и загрузить данные заново')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--events', type=int, default=2_000)
+    parser.add_argument('--participants', type=int, default=20_000)
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling', help='доставка обновлений боту')
+    parser.add_argument('--workers', type=int, default=0, help='рабочие процессы бота (--workers в main.py)')
+    parser.add_argument('--rate', type=float, default=10, help='запусков сценариев в секунду')
+    parser.add_argument('--duration', type=float, default=60, help='секунд запуска новых сценариев')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('browse=3,subscribe=2,create=1'),
+                        help='доли сценариев, например browse=3,subscribe=2,create=1')
+    parser.add_argument('--step-timeout', type=float, default=10, help='секунд ожидания ответа на шаг')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответов заглушки Bot API, с')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, до N с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 429 на методы отправки')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after в ответах 429')
+    parser.add_argument('--port', type=int, default=0, help='порт заглушки Bot API (0 — любой свободный)')
+    parser.add_argument('--no-bot', action='store_true',
+                        help='не запускать бота: он запущен отдельно с TELEGRAM_API_URL на заглушку (polling)')
+    parser.add_argument('--bot-log', default='load_test_bot.log', help='файл для вывода процесса бота')
+    parser.add_argument('--seed', type=int, default=42, help='зерно генератора сценариев и ошибок')
+    parser.add_argument('--json', help='сохранить результаты в файл')
+    args = parser.parse_args()
+    if args.no_bot and args.mode != 'polling':
+        parser.error('--no-bot поддерживается только в режиме polling')
+
+    first_user_id = FIRST_USER_ID if args.no_bot else await prepare(args)
+    rng = random.Random(args.seed)
+    api = FakeBotApi(args.latency, args.jitter, args.error_rate, args.retry_after, seed=args.seed)
+    api_url = await api.start(port=args.port)
+    webhook_port = free_port()
+    bot_process = None
+    webhook = None
+    try:
+        if not args.no_bot:
+            with open(args.bot_log, 'w') as log_file:
+                bot_process = start_bot(api_url, args, webhook_port, log_file)
+        else:
+            logger.info("Запустите бота с TELEGRAM_API_URL=%s", api_url)
+        await wait_ready(api, args, webhook_port, bot_process)
+        if args.mode == 'webhook':
+            webhook = WebhookDelivery(f'http://127.0.0.1:{webhook_port}/webhook')
+            deliver = webhook
+        else:
+            async def deliver(update):
+                api.push_update(update)
+        await warm_up(api, deliver, args.workers, first_user_id)
+        first_user_id += max(args.workers, 1)
+        logger.info("Бот готов, нагрузка %s/с в течение %s с", args.rate, args.duration)
+        results, elapsed = await run_load(api, deliver, args.mix, args.rate, args.duration, args.step_timeout, rng, first_user_id)
+    finally:
+        if webhook is not None:
+            await webhook.close()
+        if bot_process is not None:
+            await asyncio.get_running_loop().run_in_executor(None, stop_bot, bot_process)
+        await api.stop()
+
+    report = results.report(elapsed, api)
+    if webhook is not None:
+        report['webhook_errors'] = webhook.errors
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': {**vars(args), 'mix': args.mix}, 'results': report}, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    asyncio.run(main())
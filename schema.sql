@@ -1,4 +1,11 @@
-CREATE TABLE events (
+-- Базовая схема базы данных. Индексы и последующие изменения схемы
+-- применяются миграциями из src/migrations (python src/migrate.py).
+CREATE TABLE IF NOT EXISTS users (
+    user_id BIGINT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS events (
     event_id SERIAL PRIMARY KEY,
     user_id BIGINT REFERENCES users(user_id),
     title TEXT NOT NULL,
@@ -9,15 +16,10 @@ CREATE TABLE events (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE users (
-    user_id BIGINT PRIMARY KEY,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-
-CREATE TABLE participants (
+CREATE TABLE IF NOT EXISTS participants (
     participant_id SERIAL PRIMARY KEY,
     event_id INT NOT NULL,
     user_id BIGINT NOT NULL,
     FOREIGN KEY (event_id) REFERENCES events(event_id),
     FOREIGN KEY (user_id) REFERENCES users(user_id)
-);
\ No newline at end of file
+);
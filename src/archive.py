@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Перенос прошедших мероприятий в архив (events_archive и participants_archive,
+# миграция 0010). Чем меньше строк в events, тем дешевле каталог, поиск и личные
+# списки: каталог читает только предстоящие мероприятия по индексу
+# events_date_idx, а архивные доступны отдельной каруселью (repository.archive_page).
+# Задания уведомлений мероприятия удаляются тем же запросом (внешнего ключа
+# на events у них нет), а опросы с голосами — каскадом и в архив не переносятся.
+
+# Ключ advisory lock: при нескольких экземплярах бота архивирует один из них
+ARCHIVE_LOCK_KEY = 0x6172636876
+ARCHIVE_LOCK_QUERY = db.named('archive_lock', "SELECT pg_try_advisory_xact_lock($1)")
+
+CANDIDATES_QUERY = db.named(
+    'archive_candidates',
+    "SELECT event_id, event_date FROM events WHERE event_date < $1"
+    " ORDER BY event_date, event_id LIMIT $2 FOR UPDATE"
+)
+
+# Все части запроса видят один снимок, поэтому подписки копируются до того,
+# как их удалит каскад от удаления мероприятия
+MOVE_QUERY = db.named('archive_move', """
+    WITH moved AS (
+        DELETE FROM events WHERE event_id = ANY($1::int[])
+        RETURNING event_id, user_id, title, description, event_date, location, useful_links, created_at, version
+    ), archived AS (
+        INSERT INTO events_archive (event_id, user_id, title, description, event_date, location, useful_links,
+                                    created_at, version, participants_count)
+        SELECT m.event_id, m.user_id, m.title, m.description, m.event_date, m.location, m.useful_links,
+               m.created_at, m.version, COALESCE(s.participants_count, 0)
+        FROM moved m
+        LEFT JOIN event_stats s ON s.event_id = m.event_id
+        RETURNING event_id
+    ), archived_participants AS (
+        INSERT INTO participants_archive (event_id, event_date, user_id)
+        SELECT p.event_id, m.event_date, p.user_id
+        FROM participants p
+        JOIN moved m ON m.event_id = p.event_id
+    ), dropped_jobs AS (
+        DELETE FROM notification_jobs j
+        USING moved m WHERE j.event_id = m.event_id
+    )
+    SELECT count(*) FROM archived
+""")
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+# Секции архива помесячные: events_archive_2024_05, participants_archive_2024_05
+async def ensure_partitions(conn, month):
+    suffix = f"{month.year:04d}_{month.month:02d}"
+    bounds = f"FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+    for table in ('events_archive', 'participants_archive'):
+        await conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_{suffix} PARTITION OF {table} FOR VALUES {bounds}")
+
+# Переносит до batch_size мероприятий, прошедших до before, одной транзакцией.
+# Возвращает число перенесённых мероприятий или None, если архивирует другой экземпляр.
+async def archive_batch(conn, before, batch_size):
+    async with conn.transaction():
+        if not await conn.fetchval(ARCHIVE_LOCK_QUERY, ARCHIVE_LOCK_KEY):
+            return None
+        rows = await conn.fetch(CANDIDATES_QUERY, before, batch_size)
+        if not rows:
+            return 0
+        for month in sorted({month_start(row['event_date']) for row in rows}):
+            await ensure_partitions(conn, month)
+        return await conn.fetchval(MOVE_QUERY, [row['event_id'] for row in rows])
+
+async def archive_events(conn, before, batch_size=500):
+    total = 0
+    while True:
+        moved = await archive_batch(conn, before, batch_size)
+        if not moved:
+            return total
+        total += moved
+        if moved < batch_size:
+            return total
+
+class Archiver:
+    def __init__(self, retention, interval=3600.0, batch_size=500):
+        self.retention = retention
+        self.interval = interval
+        self.batch_size = batch_size
+        self.archived = 0
+        self._task = None
+
+    async def run_once(self):
+        async with db.acquire() as conn:
+            moved = await archive_events(conn, datetime.now() - self.retention, self.batch_size)
+        if moved:
+            self.archived += moved
+            logger.info("В архив перенесено мероприятий: %s", moved)
+        return moved
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except db.DB_ERRORS as e:
+                logger.error("Ошибка при архивации мероприятий: %s", e)
+            await asyncio.sleep(self.interval)
+
+archiver = None
+
+# ARCHIVE_INTERVAL=0 выключает архивацию в этом экземпляре бота
+async def start():
+    global archiver
+    interval = float(os.getenv('ARCHIVE_INTERVAL', '3600'))
+    if interval <= 0:
+        return
+    archiver = Archiver(
+        retention=timedelta(days=float(os.getenv('ARCHIVE_AFTER_DAYS', '30'))),
+        interval=interval,
+        batch_size=int(os.getenv('ARCHIVE_BATCH', '500')),
+    )
+    archiver.start()
+
+async def stop():
+    if archiver is not None:
+        await archiver.stop()
+        logger.info("Мероприятий перенесено в архив: %s", archiver.archived)
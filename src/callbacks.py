@@ -0,0 +1,231 @@
+import dataclasses
+import logging
+import re
+import typing
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на размер callback_data
+MAX_CALLBACK_DATA = 64
+SEPARATOR = ':'
+INT_RE = re.compile(r'^[0-9a-z]{1,13}$')
+MAX_INT = 2 ** 63 - 1
+
+class CallbackDataError(ValueError):
+    pass
+
+# Схема данных инлайн-кнопок. Каждый тип кнопки объявляется замороженным
+# датаклассом с коротким префиксом; поля могут быть неотрицательными int
+# (кодируются в base36) или строками из фиксированного набора (Literal).
+# Пример: EventNav(direction='n', event_id=100) -> "e:n:2s".
+PAYLOADS = {}
+
+def payload(prefix):
+    def decorator(cls):
+        if SEPARATOR in prefix or prefix in PAYLOADS:
+            raise ValueError(f'Некорректный или повторяющийся префикс callback_data: {prefix}')
+        cls = dataclasses.dataclass(frozen=True, slots=True)(cls)
+        hints = typing.get_type_hints(cls)
+        cls.prefix = prefix
+        cls.codecs = tuple((field.name, hints[field.name]) for field in dataclasses.fields(cls))
+        PAYLOADS[prefix] = cls
+        return cls
+    return decorator
+
+def encode_int(value):
+    if value < 0 or value > MAX_INT:
+        raise CallbackDataError(f'Значение вне допустимого диапазона: {value}')
+    digits = ''
+    while True:
+        value, rest = divmod(value, 36)
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'[rest] + digits
+        if value == 0:
+            return digits
+
+def encode_field(field_type, value):
+    if field_type is int:
+        return encode_int(value)
+    if value not in typing.get_args(field_type):
+        raise CallbackDataError(f'Недопустимое значение поля: {value}')
+    return value
+
+def decode_field(field_type, raw):
+    if field_type is int:
+        # Ведущие нули запрещены: у каждого числа одна запись, и одна кнопка
+        # не может прийти под разными callback_data
+        if not INT_RE.match(raw) or (raw[0] == '0' and raw != '0'):
+            raise CallbackDataError(f'Некорректное число: {raw!r}')
+        value = int(raw, 36)
+        if value > MAX_INT:
+            raise CallbackDataError(f'Значение вне допустимого диапазона: {raw!r}')
+        return value
+    if raw not in typing.get_args(field_type):
+        raise CallbackDataError(f'Недопустимое значение поля: {raw!r}')
+    return raw
+
+def pack(data):
+    parts = [data.prefix]
+    for name, field_type in data.codecs:
+        parts.append(encode_field(field_type, getattr(data, name)))
+    packed = SEPARATOR.join(parts)
+    if len(packed.encode()) > MAX_CALLBACK_DATA:
+        raise CallbackDataError(f'callback_data длиннее {MAX_CALLBACK_DATA} байт: {packed}')
+    return packed
+
+def unpack(packed):
+    if not packed or len(packed) > MAX_CALLBACK_DATA:
+        raise CallbackDataError('Пустая или слишком длинная callback_data')
+    parts = packed.split(SEPARATOR)
+    cls = PAYLOADS.get(parts[0])
+    if cls is None:
+        raise CallbackDataError(f'Неизвестный префикс callback_data: {parts[0]!r}')
+    if len(parts) - 1 != len(cls.codecs):
+        raise CallbackDataError(f'Неверное число полей в callback_data: {packed!r}')
+    values = [decode_field(field_type, raw) for (_, field_type), raw in zip(cls.codecs, parts[1:])]
+    return cls(*values)
+
+# Направления перехода в каруселях
+Direction = typing.Literal['p', 'n', 'c']
+DIRECTIONS = {'p': 'prev', 'n': 'next', 'c': 'current'}
+
+@payload('c')
+class ShowCommands:
+    pass
+
+@payload('h')
+class Home:
+    pass
+
+@payload('a')
+class CreateEvent:
+    pass
+
+@payload('l')
+class ListEvents:
+    pass
+
+@payload('m')
+class PersonalList:
+    pass
+
+@payload('e')
+class EventNav:
+    direction: Direction
+    event_id: int
+
+@payload('pe')
+class PersonalNav:
+    direction: Direction
+    event_id: int
+
+# Страницы списков: 'p'/'n' — перед первым/после последнего мероприятия
+# страницы, 'c' — страница, начинающаяся с мероприятия
+@payload('ln')
+class ListNav:
+    direction: Direction
+    event_id: int
+
+@payload('mn')
+class PersonalListNav:
+    direction: Direction
+    event_id: int
+
+@payload('s')
+class Subscribe:
+    event_id: int
+
+@payload('u')
+class Unsubscribe:
+    event_id: int
+
+@payload('ed')
+class EditEvent:
+    event_id: int
+
+@payload('d')
+class DeleteEvent:
+    event_id: int
+
+@payload('f')
+class Search:
+    pass
+
+@payload('fp')
+class SearchPage:
+    page: int
+
+@payload('r')
+class Popular:
+    pass
+
+@payload('ar')
+class Archive:
+    pass
+
+@payload('an')
+class ArchiveNav:
+    direction: Direction
+    event_id: int
+
+@payload('ep')
+class EventPolls:
+    event_id: int
+
+@payload('ap')
+class AddPoll:
+    event_id: int
+
+@payload('o')
+class OpenPoll:
+    poll_id: int
+
+@payload('v')
+class Vote:
+    poll_id: int
+    option_no: int
+
+@payload('xp')
+class ExportParticipants:
+    event_id: int
+
+# Маршрутизация нажатий: один обработчик callback_query на роутере, который
+# разбирает данные кнопки и находит обработчик по типу одним обращением к словарю.
+# Обработчики вызываются как handler(callback_query, data, state).
+class CallbackDispatcher:
+    def __init__(self):
+        self.handlers = {}
+        self.limits = {}
+
+    # limit — ограничение частоты нажатий для этого типа кнопок (throttling.Limit)
+    def handler(self, payload_cls, limit=None):
+        def decorator(func):
+            if payload_cls in self.handlers:
+                raise ValueError(f'Обработчик для {payload_cls.__name__} уже зарегистрирован')
+            self.handlers[payload_cls] = func
+            if limit is not None:
+                self.limits[payload_cls] = limit
+            return func
+        return decorator
+
+    # Имя обработчика для метрик без полного разбора данных кнопки
+    def label(self, callback_query):
+        handler = self.handlers.get(PAYLOADS.get((callback_query.data or '').partition(SEPARATOR)[0]))
+        return handler.__name__ if handler is not None else 'rejected'
+
+    # Тип кнопки и её ограничение частоты для ThrottlingMiddleware, тоже без разбора данных
+    def limit(self, callback_query):
+        payload_cls = PAYLOADS.get((callback_query.data or '').partition(SEPARATOR)[0])
+        return payload_cls, self.limits.get(payload_cls)
+
+    def resolve(self, packed):
+        data = unpack(packed)
+        return self.handlers[type(data)], data
+
+    async def dispatch(self, callback_query, state):
+        try:
+            handler, data = self.resolve(callback_query.data)
+        except (CallbackDataError, KeyError) as e:
+            logger.warning("Отклонена callback_data от пользователя %s: %s", callback_query.from_user.id, e)
+            await callback_query.answer("Кнопка устарела. Откройте меню заново.", show_alert=True)
+            return
+        await handler(callback_query, data, state)
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import asyncpg
+
+import db
+import repository
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'events_changed'
+LISTENER_RETRY_DELAY = 5
+
+# Кэш общего каталога мероприятий: строки мероприятий (LRU с TTL) и
+# упорядоченный по (event_date, event_id) список id предстоящих мероприятий
+# для навигации. Начавшиеся мероприятия пропадают из списка не позже чем
+# через CATALOG_CACHE_TTL секунд. Пока кэш выключен, каталог читается
+# запросами по ключу (event_date, event_id), без чтения всего порядка.
+class EventCache:
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        # Пока нет подписки на уведомления, кэш не используется
+        self.enabled = False
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._rows = OrderedDict()
+        self._order = None
+        self._order_expires = 0.0
+
+    def get_row(self, event_id):
+        entry = self._rows.get(event_id) if self.enabled else None
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._rows.move_to_end(event_id)
+        self.hits += 1
+        return entry[1]
+
+    def put_row(self, row, generation):
+        if not self.enabled or generation != self.generation:
+            return
+        self._rows[row.event_id] = (time.monotonic() + self.ttl, row)
+        self._rows.move_to_end(row.event_id)
+        while len(self._rows) > self.max_size:
+            self._rows.popitem(last=False)
+
+    def get_order(self):
+        if not self.enabled or self._order is None or self._order_expires < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._order
+
+    def put_order(self, event_ids, generation):
+        order = (event_ids, {event_id: index for index, event_id in enumerate(event_ids)})
+        if self.enabled and generation == self.generation:
+            self._order = order
+            self._order_expires = time.monotonic() + self.ttl
+        return order
+
+    # Строка изменённого мероприятия сбрасывается всегда, а список id — только
+    # если изменился состав или порядок каталога (reorder): новое или удалённое
+    # мероприятие, другая дата
+    def invalidate(self, event_id=None, reorder=True):
+        self.generation += 1
+        self.invalidations += 1
+        if reorder:
+            self._order = None
+        if event_id is not None:
+            self._rows.pop(event_id, None)
+
+    def clear(self):
+        self.generation += 1
+        self._rows.clear()
+        self._order = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'invalidations': self.invalidations,
+            'rows': len(self._rows),
+        }
+
+cache = EventCache(
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', '60')),
+    max_size=int(os.getenv('CATALOG_CACHE_SIZE', '1000')),
+)
+
+listener_conn = None
+listener_task = None
+
+async def load_order(conn):
+    order = cache.get_order()
+    if order is None:
+        generation = cache.generation
+        order = cache.put_order(await repository.event_order(conn, datetime.now()), generation)
+    return order
+
+async def load_event(conn, event_id):
+    row = cache.get_row(event_id)
+    if row is None:
+        generation = cache.generation
+        row = await repository.get_event(conn, event_id)
+        if row is not None:
+            cache.put_row(row, generation)
+    return row
+
+# Строки в порядке event_ids: из кэша, а недостающие — одним запросом.
+# Удалённые мероприятия пропускаются.
+async def load_events(conn, event_ids):
+    rows = {event_id: cache.get_row(event_id) for event_id in event_ids}
+    missing = [event_id for event_id, row in rows.items() if row is None]
+    if missing:
+        generation = cache.generation
+        for row in await repository.get_events(conn, missing):
+            rows[row.event_id] = row
+            cache.put_row(row, generation)
+    return [rows[event_id] for event_id in event_ids if rows[event_id] is not None]
+
+# Карточка общего каталога относительно мероприятия-якоря. Возвращает None,
+# если якоря нет в каталоге или в этом направлении мероприятий больше нет.
+# Прошедшее, но ещё не архивированное мероприятие (из поиска или опросов)
+# показывается по 'current' без соседей.
+async def fetch_page(user_id, direction='first', anchor_id=None):
+    if not cache.enabled:
+        return await fetch_page_uncached(user_id, direction, anchor_id)
+    async with db.acquire() as conn:
+        event_ids, positions = await load_order(conn)
+        if direction == 'first':
+            index = 0
+        else:
+            position = positions.get(anchor_id)
+            if position is None:
+                return await fetch_unlisted(conn, user_id, anchor_id) if direction == 'current' else None
+            index = position + {'prev': -1, 'current': 0, 'next': 1}[direction]
+        if not 0 <= index < len(event_ids):
+            return None
+
+        event = await load_event(conn, event_ids[index])
+        if event is None:
+            return None
+        # Подписка и счётчик участников меняются часто и читаются при каждом показе
+        is_subscribed, participants_count = await repository.event_state(conn, event.event_id, user_id)
+
+    return repository.EventPage(event, index > 0, index < len(event_ids) - 1, is_subscribed, participants_count)
+
+async def fetch_page_uncached(user_id, direction, anchor_id):
+    async with db.acquire() as conn:
+        page = await repository.catalog_page(conn, datetime.now(), direction, anchor_id)
+        if page is None:
+            return await fetch_unlisted(conn, user_id, anchor_id) if direction == 'current' else None
+        is_subscribed, participants_count = await repository.event_state(conn, page.event.event_id, user_id)
+    return repository.EventPage(page.event, page.has_prev, page.has_next, is_subscribed, participants_count)
+
+async def fetch_unlisted(conn, user_id, event_id):
+    event = await load_event(conn, event_id)
+    if event is None:
+        return None
+    is_subscribed, participants_count = await repository.event_state(conn, event_id, user_id)
+    return repository.EventPage(event, False, False, is_subscribed, participants_count)
+
+# Страница списка общего каталога: до size мероприятий подряд из кэшированного
+# порядка — после якоря ('next'), перед ним ('prev') или начиная с него
+# ('current'). Подписки пользователя и счётчики участников всей страницы
+# читаются одним запросом. Возвращает None, если якоря нет в каталоге.
+async def fetch_list_page(user_id, size, direction='first', anchor_id=None):
+    if not cache.enabled:
+        return await fetch_list_page_uncached(user_id, size, direction, anchor_id)
+    async with db.acquire() as conn:
+        event_ids, positions = await load_order(conn)
+        if direction == 'first':
+            start = 0
+        else:
+            position = positions.get(anchor_id)
+            if position is None:
+                return None
+            start = {'prev': max(position - size, 0), 'current': position, 'next': position + 1}[direction]
+        page_ids = event_ids[start:start + size]
+        if not page_ids:
+            return None
+        events = await load_events(conn, page_ids)
+        if not events:
+            return None
+        subscribed, counts = await repository.list_state(conn, user_id, page_ids)
+
+    summaries = tuple(
+        repository.EventSummary(event.event_id, event.title, event.event_date, event.location, counts.get(event.event_id, 0))
+        for event in events
+    )
+    return repository.EventListPage(summaries, start > 0, start + size < len(event_ids), subscribed)
+
+async def fetch_list_page_uncached(user_id, size, direction, anchor_id):
+    async with db.acquire() as conn:
+        page = await repository.catalog_list_page(conn, datetime.now(), size, direction, anchor_id)
+        if page is None:
+            return None
+        subscribed, _ = await repository.list_state(conn, user_id, [event.event_id for event in page.events])
+    return repository.EventListPage(page.events, page.has_prev, page.has_next, subscribed)
+
+def invalidate(event_id=None, reorder=True):
+    cache.invalidate(event_id, reorder)
+
+# Уведомление "<event_id>" — изменено мероприятие, "<event_id>:order" — изменился
+# состав или порядок каталога (миграция 0011)
+def on_events_changed(connection, pid, channel, payload):
+    event_id, _, change = payload.partition(':')
+    try:
+        cache.invalidate(int(event_id), reorder=change == 'order')
+    except ValueError:
+        cache.clear()
+
+def on_listener_terminated(connection):
+    global listener_task
+    # Без уведомлений кэш может устареть: выключаем его до переподключения
+    cache.enabled = False
+    cache.clear()
+    logger.warning("Соединение LISTEN для кэша каталога потеряно, переподключение")
+    listener_task = asyncio.get_running_loop().create_task(connect_listener())
+
+async def connect_listener():
+    global listener_conn
+    while True:
+        try:
+            listener_conn = await asyncpg.connect(**db.load_config())
+            await listener_conn.add_listener(NOTIFY_CHANNEL, on_events_changed)
+            listener_conn.add_termination_listener(on_listener_terminated)
+            cache.clear()
+            cache.enabled = True
+            logger.info("Кэш каталога подписан на уведомления об изменениях мероприятий")
+            return
+        except db.DB_ERRORS as e:
+            logger.error("Ошибка при подписке на уведомления каталога: %s", e)
+            await asyncio.sleep(LISTENER_RETRY_DELAY)
+
+async def start_listener():
+    global listener_task
+    listener_task = asyncio.get_running_loop().create_task(connect_listener())
+
+async def stop_listener():
+    global listener_conn
+    cache.enabled = False
+    if listener_task is not None and not listener_task.done():
+        listener_task.cancel()
+    if listener_conn is not None:
+        listener_conn.remove_termination_listener(on_listener_terminated)
+        await listener_conn.close()
+        listener_conn = None
+    logger.info("Статистика кэша каталога: %s", cache.stats())
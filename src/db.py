@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from configparser import ConfigParser
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.ini')
+
+# Переменные окружения, которые перекрывают параметры из database.ini
+ENV_OVERRIDES = {
+    'database': 'DATABASE_NAME',
+    'user': 'DATABASE_USER',
+    'password': 'DATABASE_PASSWORD',
+    'host': 'DATABASE_HOST',
+    'port': 'DATABASE_PORT',
+}
+
+# Настройки пула по умолчанию: (значение, переменная окружения, тип)
+POOL_DEFAULTS = {
+    'min_size': (2, 'DB_POOL_MIN_SIZE', int),
+    'max_size': (10, 'DB_POOL_MAX_SIZE', int),
+    'acquire_timeout': (5.0, 'DB_ACQUIRE_TIMEOUT', float),
+    'command_timeout': (10.0, 'DB_COMMAND_TIMEOUT', float),
+    'max_inactive_lifetime': (300.0, 'DB_MAX_INACTIVE_LIFETIME', float),
+    'connect_retries': (5, 'DB_CONNECT_RETRIES', int),
+    'retry_delay': (1.0, 'DB_RETRY_DELAY', float),
+    # Сколько подготовленных запросов держит каждое соединение; 0 отключает
+    # подготовку (нужно за pgbouncer в режиме transaction)
+    'statement_cache_size': (100, 'DB_STATEMENT_CACHE_SIZE', int),
+}
+
+# Временные ошибки подключения, после которых имеет смысл повторить попытку
+CONNECT_RETRY_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.CannotConnectNowError, asyncpg.TooManyConnectionsError)
+
+# Ошибки, при которых обработчик должен сообщить пользователю о сбое БД
+DB_ERRORS = (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError)
+
+pool = None
+pool_settings = {}
+
+# Имена запросов для метрик. Запросы, объявленные через named(), учитываются
+# под своим именем, остальные — под именем вида "select events", которое
+# вычисляется один раз для каждого текста запроса.
+QUERY_NAMES = {}
+QUERY_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+(\w+)', re.IGNORECASE)
+
+def named(name, query):
+    QUERY_NAMES[query] = name
+    return query
+
+def query_name(query):
+    name = QUERY_NAMES.get(query)
+    if name is None:
+        words = query.split(None, 1)
+        verb = words[0].lower() if words else 'empty'
+        table = QUERY_TABLE_RE.search(query)
+        name = QUERY_NAMES[query] = f"{verb} {table.group(1).lower()}" if table else verb
+    return name
+
+# Соединение пула, которое учитывает время и ошибки каждого запроса
+class TimedConnection(asyncpg.Connection):
+    _timed = True
+
+    async def _observe(self, call, query, *args, **kwargs):
+        if not self._timed:
+            return await call(query, *args, **kwargs)
+        name = query_name(query)
+        start = time.perf_counter()
+        try:
+            return await call(query, *args, **kwargs)
+        except Exception:
+            metrics.registry.db_errors[name] += 1
+            raise
+        finally:
+            metrics.registry.db_latency[name].observe(time.perf_counter() - start)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._observe(super().execute, query, *args, **kwargs)
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._observe(super().executemany, command, args, **kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._observe(super().fetch, query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._observe(super().fetchrow, query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._observe(super().fetchval, query, *args, **kwargs)
+
+    # Сброс соединения при возврате в пул учитывается отдельно от запросов бота
+    async def reset(self, *, timeout=None):
+        self._timed = False
+        start = time.perf_counter()
+        try:
+            await super().reset(timeout=timeout)
+        finally:
+            self._timed = True
+            metrics.registry.db_latency['connection_reset'].observe(time.perf_counter() - start)
+
+def load_config(filename=CONFIG_PATH, section='postgresql'):
+    parser = ConfigParser()
+    parser.read(filename)
+
+    config = {}
+    if parser.has_section(section):
+        params = parser.items(section)
+        for param in params:
+            config[param[0]] = param[1]
+    else:
+        raise Exception(f'Section {section} not found in the {filename} file')
+
+    for key, env_name in ENV_OVERRIDES.items():
+        value = os.environ.get(env_name)
+        if value:
+            config[key] = value
+
+    return config
+
+def load_pool_settings(filename=CONFIG_PATH, section='pool'):
+    parser = ConfigParser()
+    parser.read(filename)
+
+    settings = {}
+    for key, (default, env_name, cast) in POOL_DEFAULTS.items():
+        value = os.environ.get(env_name)
+        if value is None and parser.has_option(section, key):
+            value = parser.get(section, key)
+        settings[key] = cast(value) if value is not None else default
+
+    if settings['min_size'] > settings['max_size']:
+        raise ValueError('min_size пула не может быть больше max_size')
+
+    return settings
+
+async def create_pool():
+    global pool, pool_settings
+    config = load_config()
+    pool_settings = load_pool_settings()
+
+    retries = pool_settings['connect_retries']
+    for attempt in range(1, retries + 1):
+        try:
+            pool = await asyncpg.create_pool(
+                **config,
+                min_size=pool_settings['min_size'],
+                max_size=pool_settings['max_size'],
+                command_timeout=pool_settings['command_timeout'],
+                max_inactive_connection_lifetime=pool_settings['max_inactive_lifetime'],
+                statement_cache_size=pool_settings['statement_cache_size'],
+                connection_class=TimedConnection,
+            )
+            logger.info(
+                "Пул подключений к базе данных создан (min=%s, max=%s)",
+                pool_settings['min_size'], pool_settings['max_size']
+            )
+            return pool
+        except CONNECT_RETRY_ERRORS as e:
+            logger.error("Ошибка при подключении к базе данных (попытка %s/%s): %s", attempt, retries, e)
+            if attempt == retries:
+                raise
+            await asyncio.sleep(pool_settings['retry_delay'] * attempt)
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+        logger.info("Пул подключений к базе данных закрыт")
+
+# Соединение выдаётся на время одного обработчика. Разорванные соединения
+# пул переоткрывает сам при следующей выдаче, поэтому после падения сервера
+# БД бот восстанавливается без перезапуска.
+@asynccontextmanager
+async def acquire():
+    if pool is None:
+        raise asyncpg.InterfaceError('Пул подключений не инициализирован')
+    async with pool.acquire(timeout=pool_settings['acquire_timeout']) as connection:
+        yield connection
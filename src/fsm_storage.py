@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+import db
+
+logger = logging.getLogger(__name__)
+
+UPSERT_QUERY = db.named(
+    'fsm_upsert',
+    "INSERT INTO fsm_storage (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny, state, data, updated_at)"
+    " VALUES ($1, $2, $3, $4, $5, $6, $7, $8::jsonb, CURRENT_TIMESTAMP)"
+    " ON CONFLICT (bot_id, chat_id, user_id, thread_id, business_connection_id, destiny)"
+    " DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at"
+)
+DELETE_QUERY = db.named(
+    'fsm_delete',
+    "DELETE FROM fsm_storage WHERE bot_id = $1 AND chat_id = $2 AND user_id = $3"
+    " AND thread_id = $4 AND business_connection_id = $5 AND destiny = $6"
+)
+SELECT_QUERY = db.named(
+    'fsm_select',
+    "SELECT state, data FROM fsm_storage WHERE bot_id = $1 AND chat_id = $2 AND user_id = $3"
+    " AND thread_id = $4 AND business_connection_id = $5 AND destiny = $6"
+    " AND updated_at > CURRENT_TIMESTAMP - make_interval(secs => $7)"
+)
+CLEANUP_QUERY = db.named('fsm_cleanup', "DELETE FROM fsm_storage WHERE updated_at < CURRENT_TIMESTAMP - make_interval(secs => $1)")
+
+def key_args(key):
+    return (key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.business_connection_id or '', key.destiny)
+
+# Хранилище состояний FSM в PostgreSQL. Изменения копятся в памяти и
+# записываются одним пакетом раз в flush_interval секунд, поэтому несколько
+# вызовов set_state/update_data в одном обработчике дают одну запись в БД.
+# После записи локальная копия удаляется, и следующее обновление читает
+# актуальное состояние из БД — это позволяет запускать несколько экземпляров
+# бота. Диалоги, не менявшиеся дольше ttl секунд, считаются брошенными.
+class PostgresStorage(BaseStorage):
+    def __init__(self, ttl=86400, flush_interval=0.2, cleanup_interval=600):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cleanup_interval = cleanup_interval
+        self._records = {}
+        self._dirty = set()
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+        self._cleanup_task = None
+
+    async def _load(self, key):
+        record = self._records.get(key)
+        if record is not None:
+            return record
+        async with db.acquire() as conn:
+            row = await conn.fetchrow(SELECT_QUERY, *key_args(key), float(self.ttl))
+        if row is None:
+            return [None, {}]
+        return [row['state'], json.loads(row['data'])]
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, lambda: loop.create_task(self.flush()))
+
+    def _store(self, key, state, data):
+        self._records[key] = [state, data]
+        self._dirty.add(key)
+        self._schedule_flush()
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.get_running_loop().create_task(self._cleanup_loop())
+
+    async def set_state(self, key, state=None):
+        record = await self._load(key)
+        self._store(key, state.state if isinstance(state, State) else state, record[1])
+
+    async def get_state(self, key):
+        record = await self._load(key)
+        return record[0]
+
+    async def set_data(self, key, data):
+        record = await self._load(key)
+        self._store(key, record[0], data.copy())
+
+    async def get_data(self, key):
+        record = await self._load(key)
+        return record[1].copy()
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._flush_handle = None
+            if not self._dirty:
+                return
+            keys = list(self._dirty)
+            self._dirty.clear()
+            batch = {key: self._records[key] for key in keys}
+
+            upserts = []
+            deletes = []
+            for key, (state, data) in batch.items():
+                if state is None and not data:
+                    deletes.append(key_args(key))
+                else:
+                    upserts.append((*key_args(key), state, json.dumps(data, ensure_ascii=False)))
+
+            try:
+                async with db.acquire() as conn:
+                    async with conn.transaction():
+                        if upserts:
+                            await conn.executemany(UPSERT_QUERY, upserts)
+                        if deletes:
+                            await conn.executemany(DELETE_QUERY, deletes)
+            except db.DB_ERRORS as e:
+                logger.error("Ошибка при сохранении состояний FSM: %s", e)
+                # Повторим запись при следующем сбросе, если ключ не перезаписан
+                self._dirty.update(keys)
+                self._schedule_flush()
+                return
+
+            for key, record in batch.items():
+                if key not in self._dirty and self._records.get(key) is record:
+                    del self._records[key]
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                async with db.acquire() as conn:
+                    result = await conn.execute(CLEANUP_QUERY, float(self.ttl))
+                logger.info("Удалены устаревшие состояния FSM: %s", result)
+            except db.DB_ERRORS as e:
+                logger.error("Ошибка при очистке состояний FSM: %s", e)
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+        await self.flush()
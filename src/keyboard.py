@@ -1,48 +1,148 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from callbacks import (pack, ShowCommands, Home, CreateEvent, ListEvents, PersonalList, EventNav, PersonalNav,
+                       ListNav, PersonalListNav, Subscribe, Unsubscribe, EditEvent, DeleteEvent, Search, SearchPage, Popular, Archive, ArchiveNav,
+                       EventPolls, AddPoll, OpenPoll, Vote, ExportParticipants)
+
+# Статичные клавиатуры создаются один раз и переиспользуются: объекты
+# общие для всех вызовов, изменять их нельзя
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📎Показать команды", callback_data=pack(ShowCommands()))]
+])
+
+COMMANDS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📋список мероприятий", callback_data=pack(ListEvents()))],
+    [InlineKeyboardButton(text="📋мои мероприятия", callback_data=pack(PersonalList()))],
+    [InlineKeyboardButton(text="🔎поиск мероприятий", callback_data=pack(Search()))],
+    [InlineKeyboardButton(text="🔥популярные мероприятия", callback_data=pack(Popular()))],
+    [InlineKeyboardButton(text="🗄архив мероприятий", callback_data=pack(Archive()))],
+    [InlineKeyboardButton(text="️📝создать мероприятие", callback_data=pack(CreateEvent()))]
+])
+
+HOME_BUTTON = InlineKeyboardButton(text="🏠Домой", callback_data=pack(Home()))
+HOME_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[HOME_BUTTON]])
+
 def main_menu_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📎Показать команды", callback_data="show_commands")]
-    ])
+    return MAIN_MENU_KEYBOARD
 
 def commands_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📋список мероприятий", callback_data="list_events")],
-        [InlineKeyboardButton(text="📋мои мероприятия", callback_data="personal_list")],
-        [InlineKeyboardButton(text="️📝создать мероприятие", callback_data="create_event")]
-    ])
+    return COMMANDS_KEYBOARD
 
 def home_button():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🏠Домой", callback_data="home")]
-    ])
+    return HOME_KEYBOARD
 
-def event_navigation_keyboard(event_index, events, is_subscribed, event_link):
+def event_navigation_keyboard(event, is_subscribed, has_prev, has_next):
+    subscription = Unsubscribe(event.event_id) if is_subscribed else Subscribe(event.event_id)
     keyboard = [
-        [InlineKeyboardButton(text="❌Отписаться" if is_subscribed else "✍️Записаться", callback_data=f"{'unsubscribe' if is_subscribed else 'subscribe'}_{events[event_index]['event_id']}")],
-        [InlineKeyboardButton(text="🔗Ссылка", url=event_link)]
+        [InlineKeyboardButton(text="❌Отписаться" if is_subscribed else "✍️Записаться", callback_data=pack(subscription))],
+        [InlineKeyboardButton(text="🔗Ссылка", url=event.useful_links)],
+        [InlineKeyboardButton(text="📊Опросы", callback_data=pack(EventPolls(event.event_id)))]
     ]
     navigation_buttons = []
-    if event_index > 0:
-        navigation_buttons.append(InlineKeyboardButton(text="Предыдущее", callback_data=f"prev_{event_index}"))
-    if event_index < len(events) - 1:
-        navigation_buttons.append(InlineKeyboardButton(text="Следующее", callback_data=f"next_{event_index}"))
-    keyboard.append([InlineKeyboardButton(text="🏠Домой", callback_data="home")])
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton(text="Предыдущее", callback_data=pack(EventNav('p', event.event_id))))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton(text="Следующее", callback_data=pack(EventNav('n', event.event_id))))
+    keyboard.append([HOME_BUTTON, InlineKeyboardButton(text="📃К списку", callback_data=pack(ListNav('c', event.event_id)))])
     if navigation_buttons:
         keyboard.append(navigation_buttons)
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def personal_event_navigation_keyboard(event_index, events):
+def personal_event_navigation_keyboard(event, has_prev, has_next):
     keyboard = [
-        [InlineKeyboardButton(text="✏️Редактировать", callback_data=f"edit_{events[event_index]['event_id']}")],
-        [InlineKeyboardButton(text="🗑️Удалить", callback_data=f"delete_{events[event_index]['event_id']}")],
-        [InlineKeyboardButton(text="🏠Домой", callback_data="home")]
+        [InlineKeyboardButton(text="✏️Редактировать", callback_data=pack(EditEvent(event.event_id)))],
+        [InlineKeyboardButton(text="🗑️Удалить", callback_data=pack(DeleteEvent(event.event_id)))],
+        [InlineKeyboardButton(text="📊Добавить опрос", callback_data=pack(AddPoll(event.event_id)))],
+        [InlineKeyboardButton(text="📤Список участников", callback_data=pack(ExportParticipants(event.event_id)))],
+        [HOME_BUTTON, InlineKeyboardButton(text="📃К списку", callback_data=pack(PersonalListNav('c', event.event_id)))]
+    ]
+    navigation_buttons = []
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton(text="Предыдущее", callback_data=pack(PersonalNav('p', event.event_id))))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton(text="Следующее", callback_data=pack(PersonalNav('n', event.event_id))))
+    if navigation_buttons:
+        keyboard.append(navigation_buttons)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Архивная карточка только для просмотра: «Предыдущее» — более позднее мероприятие
+def archive_navigation_keyboard(event, has_prev, has_next):
+    keyboard = [
+        [InlineKeyboardButton(text="🔗Ссылка", url=event.useful_links)],
+        [HOME_BUTTON]
+    ]
+    navigation_buttons = []
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton(text="Предыдущее", callback_data=pack(ArchiveNav('p', event.event_id))))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton(text="Следующее", callback_data=pack(ArchiveNav('n', event.event_id))))
+    if navigation_buttons:
+        keyboard.append(navigation_buttons)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Страница списка: кнопки с номерами открывают карточку мероприятия, по пять в ряд.
+# card_nav и list_nav — типы кнопок карусели и страниц списка.
+def list_page_keyboard(page, card_nav, list_nav):
+    buttons = [
+        InlineKeyboardButton(text=str(number), callback_data=pack(card_nav('c', event.event_id)))
+        for number, event in enumerate(page.events, start=1)
     ]
+    keyboard = [buttons[start:start + 5] for start in range(0, len(buttons), 5)]
+    navigation_buttons = []
+    if page.has_prev:
+        navigation_buttons.append(InlineKeyboardButton(text="Предыдущие", callback_data=pack(list_nav('p', page.events[0].event_id))))
+    if page.has_next:
+        navigation_buttons.append(InlineKeyboardButton(text="Следующие", callback_data=pack(list_nav('n', page.events[-1].event_id))))
+    if navigation_buttons:
+        keyboard.append(navigation_buttons)
+    keyboard.append([HOME_BUTTON])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def event_list_keyboard(page):
+    return list_page_keyboard(page, EventNav, ListNav)
+
+def personal_event_list_keyboard(page):
+    return list_page_keyboard(page, PersonalNav, PersonalListNav)
+
+def search_results_keyboard(events, page, has_prev, has_next):
+    # Кнопки с номерами открывают карточку найденного мероприятия
+    keyboard = [[
+        InlineKeyboardButton(text=str(number), callback_data=pack(EventNav('c', event.event_id)))
+        for number, event in enumerate(events, start=1)
+    ]]
     navigation_buttons = []
-    if event_index > 0:
-        navigation_buttons.append(InlineKeyboardButton(text="Предыдущее", callback_data=f"personal_prev_{event_index}"))
-    if event_index < len(events) - 1:
-        navigation_buttons.append(InlineKeyboardButton(text="Следующее", callback_data=f"personal_next_{event_index}"))
+    if has_prev:
+        navigation_buttons.append(InlineKeyboardButton(text="Предыдущие", callback_data=pack(SearchPage(page - 1))))
+    if has_next:
+        navigation_buttons.append(InlineKeyboardButton(text="Следующие", callback_data=pack(SearchPage(page + 1))))
     if navigation_buttons:
         keyboard.append(navigation_buttons)
+    keyboard.append([HOME_BUTTON])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Кнопки с номерами открывают карточку мероприятия из рейтинга, по пять в ряд
+def popular_keyboard(events):
+    buttons = [
+        InlineKeyboardButton(text=str(number), callback_data=pack(EventNav('c', event.event_id)))
+        for number, event in enumerate(events, start=1)
+    ]
+    keyboard = [buttons[start:start + 5] for start in range(0, len(buttons), 5)]
+    keyboard.append([HOME_BUTTON])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def event_polls_keyboard(event_id, polls):
+    keyboard = [
+        [InlineKeyboardButton(text=f"📊{poll['question']}", callback_data=pack(OpenPoll(poll['poll_id'])))]
+        for poll in polls
+    ]
+    keyboard.append([InlineKeyboardButton(text="К мероприятию", callback_data=pack(EventNav('c', event_id)))])
+    keyboard.append([HOME_BUTTON])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+# Карточка опроса — отдельное сообщение только с кнопками голосования,
+# поэтому её можно обновлять, не затирая другие экраны бота
+def poll_keyboard(poll):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{option_no}. {text}", callback_data=pack(Vote(poll['poll_id'], option_no)))]
+        for option_no, text in poll['options']
+    ])
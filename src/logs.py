@@ -0,0 +1,212 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+from aiogram import BaseMiddleware
+
+# Журнал бота. Обработчики только кладут записи в очередь, а форматирование,
+# удаление секретов и вывод выполняет отдельный поток, так что медленный
+# вывод не задерживает обработку обновлений. При переполнении очереди записи
+# отбрасываются (счётчик dropped). Записи выводятся JSON-строками с полями
+# обновления, во время обработки которого они сделаны: update_id, user_id,
+# handler; запись об обработке обновления добавляет latency_ms. Частые
+# информационные записи выбранных логгеров пишутся выборочно.
+
+# Поля записи, которые попадают в JSON, если заданы
+FIELDS = ('update_id', 'user_id', 'handler', 'latency_ms', 'outcome', 'worker')
+
+# Логгер записей об обработке каждого обновления
+update_logger = logging.getLogger('updates')
+
+_context = contextvars.ContextVar('log_context', default=None)
+
+def load_log_settings():
+    return {
+        'level': os.getenv('LOG_LEVEL', 'INFO').upper(),
+        'format': os.getenv('LOG_FORMAT', 'json'),
+        'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+        'sample_rate': float(os.getenv('LOG_SAMPLE_RATE', '0.1')),
+        'sampled': [name for name in os.getenv('LOG_SAMPLED_LOGGERS', 'aiogram.event,updates').split(',') if name],
+    }
+
+# ---- Поля обновления ----
+
+# Добавляет поля к записям, сделанным до конца обработки текущего обновления
+def bind(**fields):
+    context = _context.get()
+    if context is not None:
+        context.update(fields)
+
+class ContextFilter(logging.Filter):
+    def __init__(self, fields=None):
+        super().__init__()
+        self.fields = fields or {}
+
+    def filter(self, record):
+        for key, value in self.fields.items():
+            setattr(record, key, value)
+        context = _context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+# Информационные записи выбранных логгеров проходят с вероятностью rate;
+# предупреждения и ошибки пишутся всегда
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate, loggers):
+        super().__init__()
+        self.rate = rate
+        self.loggers = set(loggers)
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or record.name not in self.loggers:
+            return True
+        return random.random() < self.rate
+
+# ---- Удаление секретов ----
+
+BOT_TOKEN_RE = re.compile(r'\d{5,}:[A-Za-z0-9_-]{30,}')
+# Пароль в DSN скрывается до последней @ строки подключения: сам пароль тоже может её содержать
+DSN_PASSWORD_RE = re.compile(r'(\w+://[^:/@\s]+:)\S+@')
+SECRET_ENV = ('TOKEN', 'DATABASE_PASSWORD', 'WEBHOOK_SECRET')
+
+def secret_values():
+    return sorted({os.environ[name] for name in SECRET_ENV if len(os.environ.get(name) or '') >= 4}, key=len, reverse=True)
+
+def redact(text, secrets=()):
+    for secret in secrets:
+        text = text.replace(secret, '***')
+    text = BOT_TOKEN_RE.sub('***', text)
+    return DSN_PASSWORD_RE.sub(r'\1***@', text)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f'{field}={getattr(record, field)}' for field in FIELDS if getattr(record, field, None) is not None)
+        return f'{line} [{fields}]' if fields else line
+
+# Секреты удаляются из готовой строки: из сообщения, аргументов и трассировки
+class RedactingFormatter(logging.Formatter):
+    def __init__(self, formatter):
+        super().__init__()
+        self.formatter = formatter
+        self.secrets = secret_values()
+
+    def format(self, record):
+        return redact(self.formatter.format(record), self.secrets)
+
+# ---- Очередь ----
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    # Сообщение собирается из аргументов в потоке вывода, а не в обработчике
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+queue_handler = None
+listener = None
+
+# Настраивает корневой логгер; fields добавляются ко всем записям процесса
+# (например, номер рабочего процесса). Повторный вызов заменяет настройку.
+def setup(**fields):
+    global queue_handler, listener
+    stop()
+    settings = load_log_settings()
+    output = logging.StreamHandler()
+    output.setFormatter(RedactingFormatter(JsonFormatter() if settings['format'] == 'json' else TextFormatter()))
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(settings['queue_size']))
+    if settings['sample_rate'] < 1:
+        queue_handler.addFilter(SamplingFilter(settings['sample_rate'], settings['sampled']))
+    queue_handler.addFilter(ContextFilter(fields))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings['level'])
+    listener = logging.handlers.QueueListener(queue_handler.queue, output)
+    listener.start()
+
+# Дописывает записи из очереди и останавливает поток вывода
+def stop():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+def dropped():
+    return queue_handler.dropped if queue_handler is not None else 0
+
+atexit.register(stop)
+
+# ---- Middleware ----
+
+# Внешний middleware диспетчера: поля обновления для всех записей во время его
+# обработки и запись об обработке с её длительностью
+class UpdateLogMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        context = {'update_id': event.update_id, 'user_id': user.id if user is not None else None}
+        token = _context.set(context)
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await handler(event, data)
+            outcome = 'ok'
+            return result
+        finally:
+            # Ошибки пишутся предупреждением: выборка их не отбрасывает
+            update_logger.log(
+                logging.INFO if outcome == 'ok' else logging.WARNING,
+                "Обновление обработано",
+                extra={'latency_ms': round((time.perf_counter() - start) * 1000, 1), 'outcome': outcome},
+            )
+            _context.reset(token)
+
+# Внутренний middleware роутера: имя обработчика, как в метриках
+class HandlerLogMiddleware(BaseMiddleware):
+    def __init__(self, label=None):
+        self.label = label
+
+    async def __call__(self, handler, event, data):
+        bind(handler=self.label(event) if self.label is not None else data['handler'].callback.__name__)
+        return await handler(event, data)
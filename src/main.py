@@ -1,105 +1,166 @@
+import argparse
 import asyncio
+import io
 import logging
 import os
-import re
-from aiogram import Bot, Dispatcher, types, Router
-from aiogram.filters import Command, CommandStart
+import tempfile
+from aiogram import Bot, Dispatcher, types, Router, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from dotenv import load_dotenv
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from configparser import ConfigParser
 from datetime import datetime
 
-# Импортируем функции клавиатур
-from keyboard import main_menu_keyboard, commands_keyboard, home_button, event_navigation_keyboard, personal_event_navigation_keyboard
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Импортируем функции клавиатур и вывода экранов
+from keyboard import (main_menu_keyboard, commands_keyboard, home_button, search_results_keyboard, popular_keyboard,
+                      event_polls_keyboard, poll_keyboard)
+from render import (render, event_card, personal_event_card, archive_event_card, event_list, personal_event_list,
+                    card_cache)
+# Проверка введённых пользователем даты и ссылки
+from validators import validate_date, convert_date_format, validate_url
+# Схема данных инлайн-кнопок и маршрутизация нажатий
+from callbacks import (CallbackDispatcher, DIRECTIONS, ShowCommands, Home, CreateEvent, ListEvents, PersonalList,
+                       EventNav, PersonalNav, ListNav, PersonalListNav, Subscribe, Unsubscribe, EditEvent, DeleteEvent, Search, SearchPage,
+                       Popular, Archive, ArchiveNav, EventPolls, AddPoll, OpenPoll, Vote, ExportParticipants)
+# Пул подключений к базе данных, доступ к данным, миграции схемы и кэш каталога
+import db
+import repository
+import migrate
+import catalog
+# Полнотекстовый поиск мероприятий
+import search
+# Рейтинг популярных мероприятий
+import popular
+# Перенос прошедших мероприятий в архив
+import archive
+# Режим приёма обновлений через webhook
+import webhook
+# Обработка обновлений в нескольких процессах
+import workers
+# Хранилище состояний FSM в базе данных
+from fsm_storage import PostgresStorage
+# Напоминания и уведомления участникам
+import notifications
+# Опросы и голосование
+import polls
+# Метрики обработчиков, запросов к БД и Bot API
+import metrics
+# Ограничение частоты нажатий кнопок
+from throttling import ThrottlingMiddleware, Limit
+# Загрузка мероприятий из файлов и выгрузка каталога и участников
+import transfer
+# Журнал через очередь и фоновый поток вывода
+import logs
 
 # Загрузка переменных окружения
 load_dotenv()
 TOKEN = os.getenv('TOKEN')
-DATABASE_URL = f"postgresql://{os.environ.get('DATABASE_USER')}:{os.environ.get('DATABASE_PASSWORD')}@" \
-               f"{os.environ.get('DATABASE_HOST')}:{os.environ.get('DATABASE_PORT')}/{os.environ.get('DATABASE_NAME')}"
-logger.info("DATABASE-URL" + str(DATABASE_URL) + "   " + str(TOKEN))
-
-# Инициализация бота и диспетчера
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
-router = Router()
-
-# Функции для работы с базой данных
-def load_config(filename='database.ini', section='postgresql'):
-    parser = ConfigParser()
-    parser.read(filename)
-
-    config = {}
-    if parser.has_section(section):
-        params = parser.items(section)
-        for param in params:
-            config[param[0]] = param[1]
-    else:
-        raise Exception(f'Section {section} not found in the {filename} file')
-
-    return config
-
-def create_db_connection():
-    try:
-        config = load_config()
-        connection = psycopg2.connect(**config, cursor_factory=RealDictCursor)
-        logger.info("Подключение к базе данных установлено")
-        return connection
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при подключении к базе данных: {e}")
-        return None
 
-conn = None
+# Настройка логирования после загрузки окружения: секреты из него удаляются из журнала
+logs.setup()
+logger = logging.getLogger(__name__)
 
-async def on_startup():
-    global conn
-    conn = create_db_connection()
+# Инициализация бота и диспетчера. TELEGRAM_API_URL направляет запросы на
+# другой сервер Bot API: локальный telegram-bot-api или нагрузочный стенд (bench/load_test.py)
+def create_bot():
+    api_url = os.getenv('TELEGRAM_API_URL')
+    if not api_url:
+        return Bot(token=TOKEN)
+    return Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+
+bot = create_bot()
+dp = Dispatcher(storage=PostgresStorage(
+    ttl=int(os.getenv('FSM_STATE_TTL', '86400')),
+    flush_interval=float(os.getenv('FSM_FLUSH_INTERVAL', '0.2')),
+))
+router = Router()
+callback_handlers = CallbackDispatcher()
+
+# Мероприятий на странице списка
+LIST_PAGE_SIZE = int(os.getenv('EVENT_LIST_PAGE_SIZE', '10'))
+
+bot.session.middleware(metrics.ApiMetricsMiddleware())
+dp.update.outer_middleware(metrics.UpdateMetricsMiddleware())
+dp.update.outer_middleware(logs.UpdateLogMiddleware())
+router.message.middleware(metrics.HandlerMetricsMiddleware())
+router.callback_query.middleware(metrics.HandlerMetricsMiddleware(label=callback_handlers.label))
+router.message.middleware(logs.HandlerLogMiddleware())
+router.callback_query.middleware(logs.HandlerLogMiddleware(label=callback_handlers.label))
+dp.callback_query.outer_middleware(ThrottlingMiddleware(limit=callback_handlers.limit))
+
+# Ограничения для отдельных типов кнопок; остальные — THROTTLE_RATE/THROTTLE_BURST.
+# Листать можно быстрее, чем подписываться, а выгрузка участников тяжёлая.
+NAVIGATION_LIMIT = Limit(rate=4, burst=10)
+SUBSCRIPTION_LIMIT = Limit(rate=0.5, burst=3)
+VOTE_LIMIT = Limit(rate=1, burst=5)
+EXPORT_LIMIT = Limit(rate=1 / 60, burst=2)
+
+# background_jobs=False — рабочий процесс, кроме первого: рассылки и архивация
+# выполняются в одном процессе, рейтинг популярных читается при показе. Буфер
+# голосов и карточки опросов есть в каждом процессе: они хранят нажатия и
+# сообщения обновлений, обработанных этим процессом.
+async def on_startup(migrate_schema=True, background_jobs=True):
+    if migrate_schema and os.getenv('DB_MIGRATE_ON_STARTUP', '1') != '0':
+        await migrate.run_migrations()
+    await db.create_pool()
+    await catalog.start_listener()
+    await polls.start(bot)
+    await popular.start(background=background_jobs)
+    if background_jobs:
+        await notifications.start(bot)
+        await archive.start()
+    register_gauges()
+    await metrics.start()
 
 async def on_shutdown():
-    if conn:
-        conn.close()
-        logger.info("Подключение к базе данных закрыто")
+    await metrics.stop()
+    await archive.stop()
+    await popular.stop()
+    await polls.stop()
+    await notifications.stop()
+    await dp.storage.close()
+    await catalog.stop_listener()
+    await db.close_pool()
+
+# Состояние кэшей и очередей выгружается вместе с метриками
+def register_gauges():
+    metrics.registry.register_gauge('catalog_cache', 'Статистика кэша каталога', catalog.cache.stats, label='stat')
+    metrics.registry.register_gauge('card_cache', 'Статистика кэша карточек', card_cache.stats, label='stat')
+    metrics.registry.register_gauge('db_pool_size', 'Открытые соединения пула', lambda: db.pool.get_size())
+    metrics.registry.register_gauge('db_pool_idle', 'Свободные соединения пула', lambda: db.pool.get_idle_size())
+    if notifications.sender is not None:
+        metrics.registry.register_gauge(
+            'broadcast_queue_size', 'Сообщения в очереди рассылки', lambda: notifications.sender.queue.qsize()
+        )
+        metrics.registry.register_gauge('broadcast_messages', 'Итоги рассылки', lambda: {
+            'sent': notifications.sender.sent, 'failed': notifications.sender.failed,
+        }, label='result')
+    metrics.registry.register_gauge('poll_votes_pending', 'Голоса, ожидающие записи', lambda: polls.votes.pending)
+    metrics.registry.register_gauge('log_records_dropped', 'Записи журнала, отброшенные при переполнении очереди', logs.dropped)
 
-# Удаление сообщения безопасно
-async def delete_message_safe(chat_id, message_id):
-    try:
-        await bot.delete_message(chat_id, message_id)
-    except Exception as e:
-        logger.error(f"Ошибка при удалении сообщения: {e}")
+GREETING_TEXT = "Привет! Я бот для создания и управления мероприятиями."
 
 # Команда /start
 @router.message(CommandStart())
 async def start_command(message: types.Message):
     user_id = message.from_user.id
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO users (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING",
-            (user_id,)
-        )
-        conn.commit()
-        cursor.close()
-        logger.info(f"User {user_id} inserted into database.")
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при вставке user_id в базу данных: {e}")
-        conn.rollback()
+        async with db.acquire() as conn:
+            await repository.add_user(conn, user_id)
+        logger.info("User %s inserted into database.", user_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при вставке user_id в базу данных: %s", e)
 
     keyboard = main_menu_keyboard()
-    await message.answer("Привет! Я бот для создания и управления мероприятиями.", reply_markup=keyboard)
+    await message.answer(GREETING_TEXT, reply_markup=keyboard)
 
 # Показать команды
-@router.callback_query(lambda c: c.data == 'show_commands')
-async def show_commands(callback_query: types.CallbackQuery):
-    await delete_message_safe(callback_query.message.chat.id, callback_query.message.message_id)
+@callback_handlers.handler(ShowCommands)
+async def show_commands(callback_query: types.CallbackQuery, data: ShowCommands, state: FSMContext):
     keyboard = commands_keyboard()
-    await callback_query.message.answer("Вот список доступных команд:", reply_markup=keyboard)
+    await render(callback_query, "Вот список доступных команд:", keyboard)
 
 # Определение состояний
 class EventCreation(StatesGroup):
@@ -116,15 +177,23 @@ class EventEdit(StatesGroup):
     waiting_for_event_location = State()
     waiting_for_event_links = State()
 
-# Функция для начала процесса создания мероприятия
+class EventSearch(StatesGroup):
+    waiting_for_query = State()
+
+class PollCreation(StatesGroup):
+    waiting_for_question = State()
+    waiting_for_options = State()
+
+class EventImport(StatesGroup):
+    waiting_for_file = State()
+
+# Функция для начала процесса создания мероприятия. В диалогах состояние
+# сохраняется до отправки вопроса: ответ пользователя может прийти раньше,
+# чем бот получит ответ Bot API на отправку
 async def start_event_creation(message_or_callback, state: FSMContext):
     keyboard = home_button()
-    if isinstance(message_or_callback, types.Message):
-        await message_or_callback.answer("Введите название мероприятия:", reply_markup=keyboard)
-    else:
-        await delete_message_safe(message_or_callback.message.chat.id, message_or_callback.message.message_id)
-        await message_or_callback.message.answer("Введите название мероприятия:", reply_markup=keyboard)
     await state.set_state(EventCreation.waiting_for_event_name)
+    await render(message_or_callback, "Введите название мероприятия:", keyboard)
 
 # Команда /create
 @router.message(Command("create"))
@@ -132,33 +201,23 @@ async def create_event_command(message: types.Message, state: FSMContext):
     await start_event_creation(message, state)
 
 # Инлайн-кнопка создать мероприятие
-@router.callback_query(lambda c: c.data == 'create_event')
-async def create_event_callback(callback_query: types.CallbackQuery, state: FSMContext):
+@callback_handlers.handler(CreateEvent)
+async def create_event_callback(callback_query: types.CallbackQuery, data: CreateEvent, state: FSMContext):
     await start_event_creation(callback_query, state)
 
 @router.message(EventCreation.waiting_for_event_name)
 async def handle_event_name(message: types.Message, state: FSMContext):
     await state.update_data(event_name=message.text)
     keyboard = home_button()
-    await message.answer("Введите описание мероприятия:", reply_markup=keyboard)
     await state.set_state(EventCreation.waiting_for_event_description)
+    await message.answer("Введите описание мероприятия:", reply_markup=keyboard)
 
 @router.message(EventCreation.waiting_for_event_description)
 async def handle_event_description(message: types.Message, state: FSMContext):
     await state.update_data(event_description=message.text)
     keyboard = home_button()
-    await message.answer("Введите дату мероприятия (дд.мм.гггг чч:мм):", reply_markup=keyboard)
     await state.set_state(EventCreation.waiting_for_event_date)
-
-def validate_date(date_text):
-    try:
-        datetime.strptime(date_text, "%d.%m.%Y %H:%M")
-        return True
-    except ValueError:
-        return False
-
-def convert_date_format(date_text):
-    return datetime.strptime(date_text, "%d.%m.%Y %H:%M").strftime("%Y-%m-%d %H:%M:%S")
+    await message.answer("Введите дату мероприятия (дд.мм.гггг чч:мм):", reply_markup=keyboard)
 
 @router.message(EventCreation.waiting_for_event_date)
 async def handle_event_date(message: types.Message, state: FSMContext):
@@ -167,8 +226,8 @@ async def handle_event_date(message: types.Message, state: FSMContext):
         formatted_date = convert_date_format(date_text)
         await state.update_data(event_date=formatted_date)
         keyboard = home_button()
-        await message.answer("Введите место проведения мероприятия:", reply_markup=keyboard)
         await state.set_state(EventCreation.waiting_for_event_location)
+        await message.answer("Введите место проведения мероприятия:", reply_markup=keyboard)
     else:
         await message.answer("Неправильный формат даты. Пожалуйста, введите дату в формате дд.мм.гггг чч:мм:")
 
@@ -176,12 +235,8 @@ async def handle_event_date(message: types.Message, state: FSMContext):
 async def handle_event_location(message: types.Message, state: FSMContext):
     await state.update_data(event_location=message.text)
     keyboard = home_button()
-    await message.answer("Введите ссылку на мероприятие:", reply_markup=keyboard)
     await state.set_state(EventCreation.waiting_for_event_links)
-
-def validate_url(url):
-    url_regex = re.compile(r'^(https?://)?(www\.)?([a-zA-Z0-9]+(\.[a-zA-Z0-9]+)+.*)$')
-    return re.match(url_regex, url) is not None
+    await message.answer("Введите ссылку на мероприятие:", reply_markup=keyboard)
 
 @router.message(EventCreation.waiting_for_event_links)
 async def handle_event_links(message: types.Message, state: FSMContext):
@@ -190,233 +245,259 @@ async def handle_event_links(message: types.Message, state: FSMContext):
         user_data = await state.get_data()
         event_name = user_data['event_name']
         event_description = user_data['event_description']
-        event_date = user_data['event_date']
+        event_date = datetime.fromisoformat(user_data['event_date'])
         event_location = user_data['event_location']
         event_links = url
         user_id = message.from_user.id
 
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO events (user_id, title, description, event_date, location, useful_links) VALUES (%s, %s, %s, %s, %s, %s)",
-                (user_id, event_name, event_description, event_date, event_location, event_links)
-            )
-            conn.commit()
-            cursor.close()
+            async with db.acquire() as conn:
+                async with conn.transaction():
+                    event_id = await repository.create_event(
+                        conn, user_id, event_name, event_description, event_date, event_location, event_links
+                    )
+                    jobs = await notifications.create_reminder_jobs(conn, event_id, event_date)
+            catalog.invalidate()
+            notifications.schedule(jobs)
             await message.answer('Мероприятие создано!')
             # Перенаправление на старт после создания мероприятия
             await start_command(message)
         except Exception as e:
-            logger.error(f"Ошибка при создании мероприятия: {e}")
-            conn.rollback()
+            logger.error("Ошибка при создании мероприятия: %s", e)
             await message.answer("Произошла ошибка при создании мероприятия. Убедитесь, что формат данных правильный.")
 
         await state.clear()
     else:
         await message.answer("Неправильный формат ссылки. Пожалуйста, введите ссылку на мероприятие (начинающуюся с http:// или https://):")
 
-# Функция для отображения событий
-async def show_events(user_id, message_or_callback):
+# Получение одной карточки карусели относительно мероприятия-якоря.
+# Общий каталог читается через кэш, личный список — запросом по индексу владельца.
+async def fetch_event_page(user_id, direction='first', anchor_id=None, personal=False):
+    if not personal:
+        return await catalog.fetch_page(user_id, direction, anchor_id)
+    async with db.acquire() as conn:
+        return await repository.personal_page(conn, user_id, direction, anchor_id)
+
+# Страница списка из LIST_PAGE_SIZE мероприятий относительно мероприятия-якоря
+async def fetch_list_page(user_id, direction='first', anchor_id=None, personal=False):
+    if not personal:
+        return await catalog.fetch_list_page(user_id, LIST_PAGE_SIZE, direction, anchor_id)
+    async with db.acquire() as conn:
+        return await repository.personal_list_page(conn, user_id, LIST_PAGE_SIZE, direction, anchor_id)
+
+# Функция для отображения событий: карточка общего каталога относительно
+# мероприятия-якоря или, если compact, страница списка
+async def show_events(user_id, message_or_callback, direction='first', anchor_id=None, compact=False):
+    fetch = fetch_list_page if compact else fetch_event_page
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM events")
-        events = cursor.fetchall()
-
-        if events:
-            event_index = 0
-            event = events[event_index]
-            cursor.execute("SELECT * FROM participants WHERE event_id = %s AND user_id = %s", (event['event_id'], user_id))
-            participant = cursor.fetchone()
-
-            is_subscribed = participant is not None
-            keyboard = event_navigation_keyboard(event_index, events, is_subscribed, event['useful_links'])
-
-            response_text = (
-                f"📝 Название: {event['title']}\n"
-                f"📖 Описание: {event['description']}\n"
-                f"📅 Дата: {event['event_date']}\n"
-                f"📍 Место: {event['location']}\n"
-            )
+        page = await fetch(user_id, direction, anchor_id)
+        if page is None and direction != 'first':
+            # Якорное мероприятие удалено — начинаем карусель сначала
+            page = await fetch(user_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при получении списка мероприятий: %s", e)
+        await render(message_or_callback, "Произошла ошибка при получении списка мероприятий.", home_button())
+        return
 
-            if isinstance(message_or_callback, types.Message):
-                await message_or_callback.answer(response_text, reply_markup=keyboard)
-            else:
-                await delete_message_safe(message_or_callback.message.chat.id, message_or_callback.message.message_id)
-                await message_or_callback.message.answer(response_text, reply_markup=keyboard)
-        else:
-            response_text = "Нет доступных мероприятий."
-            if isinstance(message_or_callback, types.Message):
-                await message_or_callback.answer(response_text)
-            else:
-                await message_or_callback.message.answer(response_text)
-        cursor.close()
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при получении списка мероприятий: {e}")
-        error_text = "Произошла ошибка при получении списка мероприятий."
-        if isinstance(message_or_callback, types.Message):
-            await message_or_callback.answer(error_text)
-        else:
-            await message_or_callback.message.answer(error_text)
+    if page is None:
+        await render(message_or_callback, "Нет доступных мероприятий.", home_button())
+        return
+
+    response_text, keyboard = event_list(page) if compact else event_card(page)
+    await render(message_or_callback, response_text, keyboard)
 
 # Функция для отображения личных событий
-async def show_personal_events(user_id, message_or_callback):
+async def show_personal_events(user_id, message_or_callback, direction='first', anchor_id=None, compact=False):
+    fetch = fetch_list_page if compact else fetch_event_page
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM events WHERE user_id = %s", (user_id,))
-        events = cursor.fetchall()
-
-        if events:
-            event_index = 0
-            event = events[event_index]
-
-            keyboard = personal_event_navigation_keyboard(event_index, events)
+        page = await fetch(user_id, direction, anchor_id, personal=True)
+        if page is None and direction == 'current':
+            page = await fetch(user_id, personal=True)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при получении списка мероприятий: %s", e)
+        await render(message_or_callback, "Произошла ошибка при получении списка мероприятий.", home_button())
+        return
 
-            response_text = (
-                f"📝 Название: {event['title']}\n"
-                f"📖 Описание: {event['description']}\n"
-                f"📅 Дата: {event['event_date']}\n"
-                f"📍 Место: {event['location']}\n"
-            )
+    # Проверка на выход за пределы списка
+    if page is None and direction in ('prev', 'next'):
+        await message_or_callback.answer("Нет доступных событий в этом направлении.", show_alert=True)
+        return
+    if page is None:
+        await render(message_or_callback, "Нет доступных мероприятий.", home_button())
+        return
 
-            if isinstance(message_or_callback, types.Message):
-                await message_or_callback.answer(response_text, reply_markup=keyboard)
-            else:
-                await delete_message_safe(message_or_callback.message.chat.id, message_or_callback.message.message_id)
-                await message_or_callback.message.answer(response_text, reply_markup=keyboard)
-        else:
-            response_text = "Нет доступных мероприятий."
-            if isinstance(message_or_callback, types.Message):
-                await message_or_callback.answer(response_text)
-            else:
-                await message_or_callback.message.answer(response_text)
-        cursor.close()
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при получении списка мероприятий: {e}")
-        error_text = "Произошла ошибка при получении списка мероприятий."
-        if isinstance(message_or_callback, types.Message):
-            await message_or_callback.answer(error_text)
-        else:
-            await message_or_callback.message.answer(error_text)
+    response_text, keyboard = personal_event_list(page) if compact else personal_event_card(page)
+    await render(message_or_callback, response_text, keyboard)
 
-# Команда /list
+# Команда /list: страница списка, кнопки с номерами открывают карточки
 @router.message(Command("list"))
 async def list_events_command(message: types.Message, state: FSMContext):
-    await show_events(message.from_user.id, message)
+    await show_events(message.from_user.id, message, compact=True)
 
-@router.callback_query(lambda c: c.data == 'list_events')
-async def list_events_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    await show_events(callback_query.from_user.id, callback_query)
+@callback_handlers.handler(ListEvents)
+async def list_events_callback(callback_query: types.CallbackQuery, data: ListEvents, state: FSMContext):
+    await show_events(callback_query.from_user.id, callback_query, compact=True)
 
 # Команда /personal_list
 @router.message(Command("personal_list"))
 async def personal_list_command(message: types.Message, state: FSMContext):
-    await show_personal_events(message.from_user.id, message)
-
-@router.callback_query(lambda c: c.data == 'personal_list')
-async def personal_list_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    await show_personal_events(callback_query.from_user.id, callback_query)
+    await show_personal_events(message.from_user.id, message, compact=True)
+
+@callback_handlers.handler(PersonalList)
+async def personal_list_callback(callback_query: types.CallbackQuery, data: PersonalList, state: FSMContext):
+    await show_personal_events(callback_query.from_user.id, callback_query, compact=True)
+
+# Поиск мероприятий: запрос и режим поиска хранятся в FSM, кнопки содержат только номер страницы
+async def show_search_results(message_or_callback, state: FSMContext, page=0):
+    data = await state.get_data()
+    query = data.get('search_query')
+    if not query:
+        await render(message_or_callback, "Введите запрос: /search <текст>", home_button())
+        return
 
-@router.callback_query(lambda c: c.data.startswith('prev_') or c.data.startswith('next_'))
-async def switch_event(callback_query: types.CallbackQuery, state: FSMContext):
-    user_id = callback_query.from_user.id
-    direction, event_index_str = callback_query.data.split('_')
-    event_index = int(event_index_str)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM events")
-    events = cursor.fetchall()
-
-    if direction == 'next':
-        event_index += 1
-    elif direction == 'prev':
-        event_index -= 1
-
-    event = events[event_index]
-    cursor.execute("SELECT * FROM participants WHERE event_id = %s AND user_id = %s", (event['event_id'], user_id))
-    participant = cursor.fetchone()
-
-    is_subscribed = participant is not None
-    keyboard = event_navigation_keyboard(event_index, events, is_subscribed, event['useful_links'])
-
-    await callback_query.message.edit_text(
-        f"📝 Название: {event['title']}\n"
-        f"📖 Описание: {event['description']}\n"
-        f"📅 Дата: {event['event_date']}\n"
-        f"📍 Место: {event['location']}\n",
-        reply_markup=keyboard
-    )
-    cursor.close()
+    try:
+        result = await search.search_events(query, page, data.get('search_fuzzy'))
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при поиске мероприятий: %s", e)
+        await render(message_or_callback, "Произошла ошибка при поиске мероприятий.", home_button())
+        return
+    await state.update_data(search_fuzzy=result['fuzzy'])
 
-@router.callback_query(lambda c: c.data.startswith('personal_prev_') or c.data.startswith('personal_next_'))
-async def switch_personal_event(callback_query: types.CallbackQuery, state: FSMContext):
-    user_id = callback_query.from_user.id
-    data = callback_query.data.split('_')
-    direction = data[1]
-    event_index = int(data[2])
+    if not result['events']:
+        await render(message_or_callback, f"По запросу «{query}» ничего не найдено.", home_button())
+        return
 
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM events WHERE user_id = %s", (user_id,))
-    events = cursor.fetchall()
-    cursor.close()
+    header = f"🔎 Похожие мероприятия по запросу «{query}»:" if result['fuzzy'] else f"🔎 Результаты по запросу «{query}»:"
+    lines = [
+        f"{number}. {event.title} — {event.event_date}, {event.location}"
+        for number, event in enumerate(result['events'], start=1)
+    ]
+    keyboard = search_results_keyboard(result['events'], page, result['has_prev'], result['has_next'])
+    await render(message_or_callback, header + "\n\n" + "\n".join(lines), keyboard)
+
+async def start_search(message_or_callback, state: FSMContext, query):
+    query = search.normalize_query(query)
+    if not query:
+        await state.set_state(EventSearch.waiting_for_query)
+        await render(message_or_callback, "Введите поисковый запрос:", home_button())
+        return
+    await state.set_state(None)
+    await state.update_data(search_query=query, search_fuzzy=None)
+    await show_search_results(message_or_callback, state)
+
+# Команда /search <запрос>
+@router.message(Command("search"))
+async def search_command(message: types.Message, command: CommandObject, state: FSMContext):
+    await start_search(message, state, command.args)
+
+@router.message(EventSearch.waiting_for_query)
+async def handle_search_query(message: types.Message, state: FSMContext):
+    await start_search(message, state, message.text)
+
+@callback_handlers.handler(Search)
+async def search_callback(callback_query: types.CallbackQuery, data: Search, state: FSMContext):
+    await start_search(callback_query, state, None)
+
+@callback_handlers.handler(SearchPage)
+async def search_page_callback(callback_query: types.CallbackQuery, data: SearchPage, state: FSMContext):
+    await show_search_results(callback_query, state, data.page)
+
+# Популярные мероприятия: рейтинг берётся из памяти и обновляется в фоне
+# (в рабочих процессах, кроме первого, — при показе, если устарел)
+async def show_popular(message_or_callback):
+    events = await popular.top_events()
+    if not events:
+        await render(message_or_callback, "Пока ни на одно предстоящее мероприятие никто не записался.", home_button())
+        return
+    lines = [
+        f"{number}. {event.title} — {event.event_date}, 👥 {event.participants_count}"
+        for number, event in enumerate(events, start=1)
+    ]
+    await render(message_or_callback, "🔥 Популярные мероприятия:\n\n" + "\n".join(lines), popular_keyboard(events))
+
+# Команда /popular
+@router.message(Command("popular"))
+async def popular_command(message: types.Message, state: FSMContext):
+    await show_popular(message)
+
+@callback_handlers.handler(Popular)
+async def popular_callback(callback_query: types.CallbackQuery, data: Popular, state: FSMContext):
+    await show_popular(callback_query)
+
+# Архив прошедших мероприятий: карусель от недавних к старым
+async def show_archive(message_or_callback, direction='first', anchor_id=None):
+    try:
+        async with db.acquire() as conn:
+            page = await repository.archive_page(conn, direction, anchor_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при получении архива мероприятий: %s", e)
+        await render(message_or_callback, "Произошла ошибка при получении архива мероприятий.", home_button())
+        return
 
-    # Проверка на выход за пределы списка
-    if direction == 'next' and event_index < len(events) - 1:
-        event_index += 1
-    elif direction == 'prev' and event_index > 0:
-        event_index -= 1
-    else:
-        await callback_query.answer("Нет доступных событий в этом направлении.", show_alert=True)
+    if page is None and direction in ('prev', 'next'):
+        await message_or_callback.answer("Нет доступных событий в этом направлении.", show_alert=True)
+        return
+    if page is None:
+        await render(message_or_callback, "В архиве пока нет мероприятий.", home_button())
         return
 
-    event = events[event_index]
+    response_text, keyboard = archive_event_card(page)
+    await render(message_or_callback, response_text, keyboard)
 
-    keyboard = personal_event_navigation_keyboard(event_index, events)
+# Команда /archive
+@router.message(Command("archive"))
+async def archive_command(message: types.Message, state: FSMContext):
+    await show_archive(message)
 
-    response_text = (
-        f"📝 Название: {event['title']}\n"
-        f"📖 Описание: {event['description']}\n"
-        f"📅 Дата: {event['event_date']}\n"
-        f"📍 Место: {event['location']}\n"
-    )
+@callback_handlers.handler(Archive)
+async def archive_callback(callback_query: types.CallbackQuery, data: Archive, state: FSMContext):
+    await show_archive(callback_query)
 
-    new_reply_markup = keyboard
+@callback_handlers.handler(ArchiveNav, limit=NAVIGATION_LIMIT)
+async def switch_archive_event(callback_query: types.CallbackQuery, data: ArchiveNav, state: FSMContext):
+    await show_archive(callback_query, DIRECTIONS[data.direction], data.event_id)
 
-    # Преобразование текущей и новой клавиатуры в строки для сравнения
-    current_message_text = callback_query.message.text
-    current_reply_markup = callback_query.message.reply_markup
+@callback_handlers.handler(EventNav, limit=NAVIGATION_LIMIT)
+async def switch_event(callback_query: types.CallbackQuery, data: EventNav, state: FSMContext):
+    await show_events(callback_query.from_user.id, callback_query, DIRECTIONS[data.direction], data.event_id)
 
-    if current_message_text == response_text and str(current_reply_markup) == str(new_reply_markup):
-        await callback_query.answer()  # Просто ответить на callback_query, чтобы убрать часы
-    else:
-        await callback_query.message.edit_text(
-            response_text,
-            reply_markup=new_reply_markup
-        )
+@callback_handlers.handler(PersonalNav, limit=NAVIGATION_LIMIT)
+async def switch_personal_event(callback_query: types.CallbackQuery, data: PersonalNav, state: FSMContext):
+    await show_personal_events(callback_query.from_user.id, callback_query, DIRECTIONS[data.direction], data.event_id)
+
+@callback_handlers.handler(ListNav, limit=NAVIGATION_LIMIT)
+async def switch_list_page(callback_query: types.CallbackQuery, data: ListNav, state: FSMContext):
+    await show_events(callback_query.from_user.id, callback_query, DIRECTIONS[data.direction], data.event_id, compact=True)
 
-@router.callback_query(lambda c: c.data.startswith('edit_'))
-async def edit_event_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback_query.data.split('_')[1])
-    await state.update_data(event_id=event_id)
+@callback_handlers.handler(PersonalListNav, limit=NAVIGATION_LIMIT)
+async def switch_personal_list_page(callback_query: types.CallbackQuery, data: PersonalListNav, state: FSMContext):
+    await show_personal_events(
+        callback_query.from_user.id, callback_query, DIRECTIONS[data.direction], data.event_id, compact=True
+    )
+
+@callback_handlers.handler(EditEvent)
+async def edit_event_callback(callback_query: types.CallbackQuery, data: EditEvent, state: FSMContext):
+    await state.update_data(event_id=data.event_id)
     await start_event_edit(callback_query, state)
 
 async def start_event_edit(callback_query: types.CallbackQuery, state: FSMContext):
     keyboard = home_button()
-    await delete_message_safe(callback_query.message.chat.id, callback_query.message.message_id)
-    await callback_query.message.answer("Введите новое название мероприятия:", reply_markup=keyboard)
     await state.set_state(EventEdit.waiting_for_event_name)
+    await render(callback_query, "Введите новое название мероприятия:", keyboard)
 
 @router.message(EventEdit.waiting_for_event_name)
 async def handle_edit_event_name(message: types.Message, state: FSMContext):
     await state.update_data(event_name=message.text)
     keyboard = home_button()
-    await message.answer("Введите новое описание мероприятия:", reply_markup=keyboard)
     await state.set_state(EventEdit.waiting_for_event_description)
+    await message.answer("Введите новое описание мероприятия:", reply_markup=keyboard)
 
 @router.message(EventEdit.waiting_for_event_description)
 async def handle_edit_event_description(message: types.Message, state: FSMContext):
     await state.update_data(event_description=message.text)
     keyboard = home_button()
-    await message.answer("Введите новую дату мероприятия (дд.мм.гггг чч:мм):", reply_markup=keyboard)
     await state.set_state(EventEdit.waiting_for_event_date)
+    await message.answer("Введите новую дату мероприятия (дд.мм.гггг чч:мм):", reply_markup=keyboard)
 
 @router.message(EventEdit.waiting_for_event_date)
 async def handle_edit_event_date(message: types.Message, state: FSMContext):
@@ -425,8 +506,8 @@ async def handle_edit_event_date(message: types.Message, state: FSMContext):
         formatted_date = convert_date_format(date_text)
         await state.update_data(event_date=formatted_date)
         keyboard = home_button()
-        await message.answer("Введите новое место проведения мероприятия:", reply_markup=keyboard)
         await state.set_state(EventEdit.waiting_for_event_location)
+        await message.answer("Введите новое место проведения мероприятия:", reply_markup=keyboard)
     else:
         await message.answer("Неправильный формат даты. Пожалуйста, введите дату в формате дд.мм.гггг чч:мм:")
 
@@ -434,8 +515,8 @@ async def handle_edit_event_date(message: types.Message, state: FSMContext):
 async def handle_edit_event_location(message: types.Message, state: FSMContext):
     await state.update_data(event_location=message.text)
     keyboard = home_button()
-    await message.answer("Введите новую ссылку на мероприятие:", reply_markup=keyboard)
     await state.set_state(EventEdit.waiting_for_event_links)
+    await message.answer("Введите новую ссылку на мероприятие:", reply_markup=keyboard)
 
 @router.message(EventEdit.waiting_for_event_links)
 async def handle_edit_event_links(message: types.Message, state: FSMContext):
@@ -445,90 +526,322 @@ async def handle_edit_event_links(message: types.Message, state: FSMContext):
         event_id = user_data['event_id']
         event_name = user_data['event_name']
         event_description = user_data['event_description']
-        event_date = user_data['event_date']
+        event_date = datetime.fromisoformat(user_data['event_date'])
         event_location = user_data['event_location']
         event_links = url
+        user_id = message.from_user.id
 
         try:
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE events SET title = %s, description = %s, event_date = %s, location = %s, useful_links = %s WHERE event_id = %s",
-                (event_name, event_description, event_date, event_location, event_links, event_id)
-            )
-            conn.commit()
-            cursor.close()
-            await message.answer('Мероприятие обновлено!')
+            jobs = []
+            async with db.acquire() as conn:
+                async with conn.transaction():
+                    # Редактировать можно только собственное мероприятие
+                    updated = await repository.update_event(
+                        conn, event_id, user_id, event_name, event_description, event_date, event_location, event_links
+                    )
+                    if updated is not None:
+                        # Переносим напоминания и сообщаем участникам об изменении
+                        jobs = await notifications.reschedule_event_jobs(conn, event_id, event_date)
+            if updated is None:
+                await message.answer('Мероприятие не найдено.')
+            else:
+                catalog.invalidate(event_id)
+                card_cache.forget_event(event_id)
+                notifications.schedule(jobs)
+                await message.answer('Мероприятие обновлено!')
             await start_command(message)
         except Exception as e:
-            logger.error(f"Ошибка при обновлении мероприятия: {e}")
-            conn.rollback()
+            logger.error("Ошибка при обновлении мероприятия: %s", e)
             await message.answer("Произошла ошибка при обновлении мероприятия. Убедитесь, что формат данных правильный.")
 
         await state.clear()
     else:
         await message.answer("Неправильный формат ссылки. Пожалуйста, введите ссылку на мероприятие (начинающуюся с http:// или https://):")
 
-@router.callback_query(lambda c: c.data.startswith('delete_'))
-async def delete_event_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback_query.data.split('_')[1])
+@callback_handlers.handler(DeleteEvent)
+async def delete_event_callback(callback_query: types.CallbackQuery, data: DeleteEvent, state: FSMContext):
+    event_id = data.event_id
     try:
-        cursor = conn.cursor()
-        # Сначала удаляем все записи из таблицы participants, которые ссылаются на удаляемое мероприятие
-        cursor.execute("DELETE FROM participants WHERE event_id = %s", (event_id,))
-        # Затем удаляем само мероприятие
-        cursor.execute("DELETE FROM events WHERE event_id = %s", (event_id,))
-        conn.commit()
-        cursor.close()
-        await callback_query.message.answer('Мероприятие удалено!')
-        await delete_message_safe(callback_query.message.chat.id, callback_query.message.message_id)
-        await show_personal_events(callback_query.from_user.id, callback_query)
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при удалении мероприятия: {e}")
-        await callback_query.message.answer("Произошла ошибка при удалении мероприятия.")
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                # Удалить можно только собственное мероприятие
+                owned = await repository.lock_own_event(conn, event_id, callback_query.from_user.id)
+                if owned:
+                    # Уведомление об отмене получат все подписчики на момент удаления
+                    jobs = await notifications.create_cancel_job(conn, event_id)
+                    # Подписки на мероприятие удаляются каскадно (ON DELETE CASCADE)
+                    await repository.delete_event(conn, event_id)
+        if not owned:
+            await callback_query.answer('Мероприятие не найдено.', show_alert=True)
+            return
+        catalog.invalidate(event_id)
+        card_cache.forget_event(event_id)
+        polls.forget_event(event_id)
+        popular.forget_event(event_id)
+        notifications.schedule(jobs)
+        await callback_query.answer('Мероприятие удалено!')
+        await show_personal_events(callback_query.from_user.id, callback_query, compact=True)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при удалении мероприятия: %s", e)
+        await callback_query.answer("Произошла ошибка при удалении мероприятия.", show_alert=True)
 
 # Подписка на мероприятие
-@router.callback_query(lambda c: c.data.startswith('subscribe_'))
-async def subscribe_event(callback_query: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback_query.data.split('_')[1])
+@callback_handlers.handler(Subscribe, limit=SUBSCRIPTION_LIMIT)
+async def subscribe_event(callback_query: types.CallbackQuery, data: Subscribe, state: FSMContext):
+    event_id = data.event_id
     user_id = callback_query.from_user.id
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO participants (event_id, user_id) VALUES (%s, %s)",
-            (event_id, user_id)
-        )
-        conn.commit()
-        cursor.close()
-        await delete_message_safe(callback_query.message.chat.id, callback_query.message.message_id)
-        await show_events(user_id, callback_query)  # Обновить список мероприятий
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при подписке на мероприятие: {e}")
-        await callback_query.message.answer("Произошла ошибка при подписке на мероприятие.")
+        async with db.acquire() as conn:
+            await repository.subscribe(conn, event_id, user_id)
+        # Обновить карточку, оставаясь на том же мероприятии
+        await show_events(user_id, callback_query, 'current', event_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при подписке на мероприятие: %s", e)
+        await callback_query.answer("Произошла ошибка при подписке на мероприятие.", show_alert=True)
 
 # Отписка от мероприятия
-@router.callback_query(lambda c: c.data.startswith('unsubscribe_'))
-async def unsubscribe_event(callback_query: types.CallbackQuery, state: FSMContext):
-    event_id = int(callback_query.data.split('_')[1])
+@callback_handlers.handler(Unsubscribe, limit=SUBSCRIPTION_LIMIT)
+async def unsubscribe_event(callback_query: types.CallbackQuery, data: Unsubscribe, state: FSMContext):
+    event_id = data.event_id
     user_id = callback_query.from_user.id
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "DELETE FROM participants WHERE event_id = %s AND user_id = %s",
-            (event_id, user_id)
+        async with db.acquire() as conn:
+            await repository.unsubscribe(conn, event_id, user_id)
+        # Обновить карточку, оставаясь на том же мероприятии
+        await show_events(user_id, callback_query, 'current', event_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при отписке от мероприятия: %s", e)
+        await callback_query.answer("Произошла ошибка при отписке от мероприятия.", show_alert=True)
+
+# Добавление опроса организатором мероприятия
+@callback_handlers.handler(AddPoll)
+async def add_poll_callback(callback_query: types.CallbackQuery, data: AddPoll, state: FSMContext):
+    await state.update_data(poll_event_id=data.event_id)
+    await state.set_state(PollCreation.waiting_for_question)
+    await render(callback_query, "Введите вопрос опроса:", home_button())
+
+@router.message(PollCreation.waiting_for_question)
+async def handle_poll_question(message: types.Message, state: FSMContext):
+    await state.update_data(poll_question=message.text)
+    await state.set_state(PollCreation.waiting_for_options)
+    await message.answer(
+        f"Введите варианты ответа, каждый с новой строки (от 2 до {polls.MAX_OPTIONS}):",
+        reply_markup=home_button()
+    )
+
+@router.message(PollCreation.waiting_for_options)
+async def handle_poll_options(message: types.Message, state: FSMContext):
+    options = polls.parse_options(message.text)
+    if options is None:
+        await message.answer(
+            f"Нужно от 2 до {polls.MAX_OPTIONS} вариантов, каждый с новой строки. Попробуйте снова:",
+            reply_markup=home_button()
         )
-        conn.commit()
-        cursor.close()
-        await delete_message_safe(callback_query.message.chat.id, callback_query.message.message_id)
-        await show_events(user_id, callback_query)  # Обновить список мероприятий
-    except psycopg2.Error as e:
-        logger.error(f"Ошибка при отписке от мероприятия: {e}")
-        await callback_query.message.answer("Произошла ошибка при отписке от мероприятия.")
+        return
+
+    data = await state.get_data()
+    event_id = data['poll_event_id']
+    try:
+        poll_id = None
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                # Добавить опрос можно только к собственному мероприятию
+                owned = await repository.share_own_event(conn, event_id, message.from_user.id)
+                if owned:
+                    poll_id = await polls.create_poll(conn, event_id, data['poll_question'], options)
+        await state.clear()
+        if poll_id is None:
+            await message.answer('Мероприятие не найдено.')
+            await start_command(message)
+            return
+        await message.answer('Опрос добавлен!')
+        await send_poll_card(message, poll_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при создании опроса: %s", e)
+        await message.answer("Произошла ошибка при создании опроса.")
+        await state.clear()
+
+# Карточка опроса отправляется отдельным сообщением и затем обновляется по мере голосования
+async def send_poll_card(message, poll_id):
+    poll = await polls.load_poll(poll_id)
+    if poll is None:
+        return None
+    card = await message.answer(polls.poll_card(poll, await polls.load_tally(poll_id)), reply_markup=poll_keyboard(poll))
+    polls.track_card(poll_id, card)
+    return card
+
+# Список опросов мероприятия
+@callback_handlers.handler(EventPolls)
+async def event_polls_callback(callback_query: types.CallbackQuery, data: EventPolls, state: FSMContext):
+    try:
+        event_polls = await polls.event_polls(data.event_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при получении опросов: %s", e)
+        await callback_query.answer("Произошла ошибка при получении опросов.", show_alert=True)
+        return
+    if not event_polls:
+        await callback_query.answer("У мероприятия пока нет опросов.", show_alert=True)
+        return
+    await render(callback_query, "Опросы мероприятия:", event_polls_keyboard(data.event_id, event_polls))
+
+@callback_handlers.handler(OpenPoll)
+async def open_poll_callback(callback_query: types.CallbackQuery, data: OpenPoll, state: FSMContext):
+    try:
+        card = await send_poll_card(callback_query.message, data.poll_id)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при получении опроса: %s", e)
+        await callback_query.answer("Произошла ошибка при получении опроса.", show_alert=True)
+        return
+    if card is None:
+        await callback_query.answer("Опрос не найден.", show_alert=True)
+        return
+    await callback_query.answer()
+
+# Голос записывается в буфер и попадает в итоги при ближайшем пакетном сбросе.
+# Опрос берётся из памяти, а участие в мероприятии проверяет сброс: нажатие
+# не обращается к БД.
+@callback_handlers.handler(Vote, limit=VOTE_LIMIT)
+async def vote_callback(callback_query: types.CallbackQuery, data: Vote, state: FSMContext):
+    user_id = callback_query.from_user.id
+    try:
+        poll = await polls.load_poll(data.poll_id)
+        if poll is None or data.option_no not in dict(poll['options']):
+            await callback_query.answer("Опрос не найден.", show_alert=True)
+            return
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при голосовании: %s", e)
+        await callback_query.answer("Произошла ошибка при голосовании.", show_alert=True)
+        return
+    polls.record_vote(data.poll_id, user_id, data.option_no)
+    polls.track_card(data.poll_id, callback_query.message)
+    await callback_query.answer("Голос принят! Учитываются голоса участников мероприятия.")
+
+# Загрузка мероприятий из файла: все строки проверяются заранее, и файл
+# загружается целиком одной транзакцией или не загружается вовсе
+IMPORT_HELP_TEXT = (
+    "Отправьте файл CSV или ICS с мероприятиями.\n\n"
+    "В CSV первая строка — названия колонок: title, description, date, location, url. "
+    "Дата в формате дд.мм.гггг чч:мм, ссылка обязательна. "
+    f"В одном файле до {transfer.MAX_IMPORT_ROWS} мероприятий."
+)
+
+# Загрузка и выгрузка всего каталога доступны только администраторам
+ADMIN_ONLY_TEXT = "Загрузка и выгрузка каталога доступны только администраторам."
+
+@router.message(Command("import"))
+async def import_command(message: types.Message, state: FSMContext):
+    if not transfer.is_admin(message.from_user.id):
+        await message.answer(ADMIN_ONLY_TEXT)
+        return
+    await state.set_state(EventImport.waiting_for_file)
+    await message.answer(IMPORT_HELP_TEXT, reply_markup=home_button())
+
+@router.message(EventImport.waiting_for_file, F.document)
+async def handle_import_file(message: types.Message, state: FSMContext):
+    # Права проверяются и при получении файла: их могли отозвать после /import
+    if not transfer.is_admin(message.from_user.id):
+        await state.clear()
+        await message.answer(ADMIN_ONLY_TEXT)
+        return
+    document = message.document
+    if document.file_size and document.file_size > transfer.MAX_IMPORT_BYTES:
+        await message.answer(f"Файл слишком большой: не больше {transfer.MAX_IMPORT_BYTES // (1024 * 1024)} МБ.")
+        return
+    data = await bot.download(document, destination=io.BytesIO())
+    try:
+        records, errors = await asyncio.to_thread(transfer.parse_events, data.getvalue())
+    except transfer.ImportFileError as e:
+        await message.answer(str(e), reply_markup=home_button())
+        return
+    if errors:
+        await message.answer(
+            "Файл не загружен, исправьте ошибки и отправьте его снова:\n" + transfer.format_errors(errors),
+            reply_markup=home_button()
+        )
+        return
+
+    try:
+        async with db.acquire() as conn:
+            event_ids, jobs = await transfer.import_events(conn, message.from_user.id, records)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при загрузке мероприятий: %s", e)
+        await message.answer("Произошла ошибка при загрузке мероприятий.", reply_markup=home_button())
+        return
+    await state.clear()
+    notifications.schedule(jobs)
+    await message.answer(f"Загружено мероприятий: {len(event_ids)}.")
+    await start_command(message)
+
+@router.message(EventImport.waiting_for_file)
+async def handle_import_text(message: types.Message):
+    await message.answer("Отправьте файл CSV или ICS документом.", reply_markup=home_button())
+
+# Выгрузка пишется во временный файл по мере чтения из базы и отправляется документом
+async def send_export(chat_id, filename, export, *args):
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1])
+    os.close(fd)
+    try:
+        async with db.acquire() as conn:
+            count = await export(conn, *args, path)
+        await bot.send_document(chat_id, types.FSInputFile(path, filename=filename), caption=f"Записей: {count}")
+    finally:
+        os.unlink(path)
+
+# Команда /export [csv|ics]: весь каталог, только для администраторов
+@router.message(Command("export"))
+async def export_command(message: types.Message, command: CommandObject):
+    if not transfer.is_admin(message.from_user.id):
+        await message.answer(ADMIN_ONLY_TEXT)
+        return
+    fmt = 'ics' if (command.args or '').strip().lower() == 'ics' else 'csv'
+    try:
+        await send_export(message.chat.id, f"events.{fmt}", transfer.export_catalog, fmt)
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при выгрузке каталога: %s", e)
+        await message.answer("Произошла ошибка при выгрузке каталога.")
+
+# Список участников получает организатор мероприятия или администратор
+async def export_participants(user_id, event_id):
+    async with db.acquire() as conn:
+        owner_id = await repository.event_owner(conn, event_id)
+    if owner_id is None or (owner_id != user_id and not transfer.is_admin(user_id)):
+        return False
+    await send_export(user_id, f"participants_{event_id}.csv", transfer.export_participants_csv, event_id)
+    return True
+
+# Команда /participants <id мероприятия>
+@router.message(Command("participants"))
+async def participants_command(message: types.Message, command: CommandObject):
+    args = (command.args or '').strip()
+    if not args.isdigit():
+        await message.answer("Укажите номер мероприятия: /participants <id>")
+        return
+    try:
+        if not await export_participants(message.from_user.id, int(args)):
+            await message.answer("Мероприятие не найдено.")
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при выгрузке участников: %s", e)
+        await message.answer("Произошла ошибка при выгрузке участников.")
+
+@callback_handlers.handler(ExportParticipants, limit=EXPORT_LIMIT)
+async def export_participants_callback(callback_query: types.CallbackQuery, data: ExportParticipants, state: FSMContext):
+    try:
+        if not await export_participants(callback_query.from_user.id, data.event_id):
+            await callback_query.answer("Мероприятие не найдено.", show_alert=True)
+            return
+    except db.DB_ERRORS as e:
+        logger.error("Ошибка при выгрузке участников: %s", e)
+        await callback_query.answer("Произошла ошибка при выгрузке участников.", show_alert=True)
+        return
+    await callback_query.answer()
 
 # Кнопка "Домой"
-@router.callback_query(lambda c: c.data == "home")
-async def home_callback(callback_query: types.CallbackQuery):
-    await delete_message_safe(callback_query.message.chat.id, callback_query.message.message_id)
-    await start_command(callback_query.message)
+@callback_handlers.handler(Home)
+async def home_callback(callback_query: types.CallbackQuery, data: Home, state: FSMContext):
+    await render(callback_query, GREETING_TEXT, main_menu_keyboard())
+
+# Все нажатия инлайн-кнопок проходят через один обработчик с таблицей префиксов
+router.callback_query()(callback_handlers.dispatch)
 
 # Обработчик для всех остальных сообщений
 @router.message()
@@ -538,12 +851,49 @@ async def handle_text(message: types.Message):
 
 # Основная функция
 async def main():
+    parser = argparse.ArgumentParser(description='Телеграм-бот itmo.eve')
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default=os.getenv('BOT_MODE', 'polling'),
+                        help='способ получения обновлений (по умолчанию BOT_MODE или polling)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('BOT_WORKERS', '0')),
+                        help='число рабочих процессов (по умолчанию BOT_WORKERS или 0 — один процесс)')
+    args = parser.parse_args()
+
     dp.include_router(router)
+    if args.workers > 0:
+        await run_sharded(args.mode, args.workers)
+        return
     await on_startup()
     try:
-        await dp.start_polling(bot)
+        if args.mode == 'webhook':
+            await webhook.run_webhook(dp, bot)
+        else:
+            # Telegram не отдаёт обновления через getUpdates, пока установлен webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
         await on_shutdown()
 
+# Основной процесс только принимает обновления и раздаёт их рабочим процессам;
+# миграции применяются один раз здесь, до их запуска
+async def run_sharded(mode, count):
+    if os.getenv('DB_MIGRATE_ON_STARTUP', '1') != '0':
+        await migrate.run_migrations()
+    front = workers.ShardedFront(count, workers.load_worker_settings())
+    front.start()
+    try:
+        if mode == 'webhook':
+            await webhook.run_webhook(dp, bot, feed=front.submit)
+        else:
+            await bot.delete_webhook()
+            polling = asyncio.get_running_loop().create_task(
+                workers.poll_updates(bot, front, dp.resolve_used_update_types())
+            )
+            await webhook.wait_for_stop_signal()
+            polling.cancel()
+            await asyncio.gather(polling, return_exceptions=True)
+    finally:
+        await front.stop()
+        await bot.session.close()
+
 if __name__ == '__main__':
     asyncio.run(main())
@@ -0,0 +1,242 @@
+import asyncio
+import bisect
+import logging
+import os
+import time
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, в секундах
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Гистограмма с фиксированными корзинами: наблюдение — поиск корзины и
+# увеличение счётчиков, без выделения памяти
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Оценка квантиля по верхней границе корзины
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float('inf')
+        return float('inf')
+
+# Семейства метрик с одной меткой; значение для новой метки создаётся при первом обращении
+class HistogramFamily(dict):
+    def __missing__(self, label):
+        histogram = self[label] = Histogram()
+        return histogram
+
+class CounterFamily(dict):
+    def __missing__(self, label):
+        return 0
+
+class Registry:
+    def __init__(self):
+        self.in_flight = 0
+        self.updates = Histogram()
+        self.handler_latency = HistogramFamily()
+        self.handler_errors = CounterFamily()
+        self.db_latency = HistogramFamily()
+        self.db_errors = CounterFamily()
+        self.api_latency = HistogramFamily()
+        self.api_errors = CounterFamily()
+        self.api_retry_after = CounterFamily()
+        self.callbacks_dropped = CounterFamily()
+        self.gauges = {}
+
+    # Показатели других модулей (кэши, очереди) читаются только при выгрузке метрик.
+    # read() возвращает число или словарь {значение метки: число}.
+    def register_gauge(self, name, help_text, read, label=None):
+        self.gauges[name] = (help_text, read, label)
+
+    def families(self):
+        return (
+            ('bot_handler_duration_seconds', 'Время работы обработчика', 'handler', self.handler_latency),
+            ('bot_handler_errors_total', 'Необработанные исключения в обработчике', 'handler', self.handler_errors),
+            ('db_query_duration_seconds', 'Время выполнения запроса к БД', 'query', self.db_latency),
+            ('db_query_errors_total', 'Ошибки запросов к БД', 'query', self.db_errors),
+            ('telegram_api_duration_seconds', 'Время вызова Bot API', 'method', self.api_latency),
+            ('telegram_api_errors_total', 'Ошибки вызовов Bot API', 'method', self.api_errors),
+            ('telegram_api_retry_after_total', 'Ответы 429 от Bot API', 'method', self.api_retry_after),
+            ('bot_callbacks_dropped_total', 'Отброшенные нажатия кнопок', 'reason', self.callbacks_dropped),
+        )
+
+    def render(self):
+        lines = [
+            '# HELP bot_updates_in_flight Обновления в обработке',
+            '# TYPE bot_updates_in_flight gauge',
+            f'bot_updates_in_flight {self.in_flight}',
+        ]
+        lines.extend(render_histogram('bot_update_duration_seconds', 'Время обработки обновления', {None: self.updates}, None))
+        for name, help_text, label, family in self.families():
+            if isinstance(family, HistogramFamily):
+                lines.extend(render_histogram(name, help_text, family, label))
+            else:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for value, count in sorted(family.items()):
+                    lines.append(f'{name}{{{label}="{escape(value)}"}} {count}')
+        for name, (help_text, read, label) in self.gauges.items():
+            try:
+                value = read()
+            except Exception as e:
+                logger.error("Ошибка при чтении показателя %s: %s", name, e)
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{escape(key)}"}} {item}')
+            else:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        parts = [f"обновлений {self.updates.count}, в обработке {self.in_flight}"]
+        for title, latency, errors in (
+            ('обработчики', self.handler_latency, self.handler_errors),
+            ('запросы', self.db_latency, self.db_errors),
+            ('Bot API', self.api_latency, self.api_errors),
+        ):
+            busiest = sorted(latency.items(), key=lambda item: item[1].sum, reverse=True)[:5]
+            if busiest:
+                parts.append(title + ': ' + ', '.join(
+                    f"{name} n={h.count} p50={h.quantile(0.5) * 1000:g}мс p95={h.quantile(0.95) * 1000:g}мс"
+                    f" ошибок={errors[name]}"
+                    for name, h in busiest
+                ))
+        retry_after = sum(self.api_retry_after.values())
+        if retry_after:
+            parts.append(f"ответов 429: {retry_after}")
+        if self.callbacks_dropped:
+            parts.append('отброшено нажатий: ' + ', '.join(
+                f"{reason}={count}" for reason, count in sorted(self.callbacks_dropped.items())
+            ))
+        return '; '.join(parts)
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_histogram(name, help_text, family, label):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for value, histogram in sorted(family.items(), key=lambda item: str(item[0])):
+        prefix = f'{label}="{escape(value)}",' if label else ''
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+        labels = f'{{{prefix[:-1]}}}' if prefix else ''
+        lines.append(f'{name}_sum{labels} {histogram.sum}')
+        lines.append(f'{name}_count{labels} {histogram.count}')
+    return lines
+
+registry = Registry()
+
+# Внешний middleware диспетчера: число обновлений в обработке и общее время
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            registry.in_flight -= 1
+            registry.updates.observe(time.perf_counter() - start)
+
+# Внутренний middleware роутера: время и ошибки по обработчикам. Имя
+# обработчика берётся из aiogram или, для нажатий кнопок, из label(event).
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self, label=None):
+        self.label = label
+
+    async def __call__(self, handler, event, data):
+        name = self.label(event) if self.label is not None else data['handler'].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            registry.handler_errors[name] += 1
+            raise
+        finally:
+            registry.handler_latency[name].observe(time.perf_counter() - start)
+
+# Middleware сессии бота: время вызовов Bot API, ошибки и ответы 429
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            registry.api_retry_after[name] += 1
+            raise
+        except TelegramAPIError:
+            registry.api_errors[name] += 1
+            raise
+        finally:
+            registry.api_latency[name].observe(time.perf_counter() - start)
+
+def load_metrics_settings():
+    return {
+        'host': os.getenv('METRICS_HOST', '127.0.0.1'),
+        'port': int(os.getenv('METRICS_PORT', '9100')),
+        'log_interval': float(os.getenv('METRICS_LOG_INTERVAL', '0')),
+    }
+
+async def handle_metrics(request):
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+async def log_summary(interval):
+    while True:
+        await asyncio.sleep(interval)
+        logger.info("Метрики: %s", registry.summary())
+
+runner = None
+summary_task = None
+
+# Порт 0 отключает HTTP-выгрузку, интервал 0 — периодическую сводку в лог
+async def start():
+    global runner, summary_task
+    settings = load_metrics_settings()
+    if settings['port']:
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, settings['host'], settings['port']).start()
+        logger.info("Метрики доступны на http://%s:%s/metrics", settings['host'], settings['port'])
+    if settings['log_interval'] > 0:
+        summary_task = asyncio.get_running_loop().create_task(log_summary(settings['log_interval']))
+
+async def stop():
+    global runner, summary_task
+    if summary_task is not None:
+        summary_task.cancel()
+        await asyncio.gather(summary_task, return_exceptions=True)
+        summary_task = None
+    if runner is not None:
+        await runner.cleanup()
+        runner = None
+    logger.info("Метрики: %s", registry.summary())
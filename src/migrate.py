@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+
+import asyncpg
+from dotenv import load_dotenv
+
+import db
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Ключ advisory-блокировки: несколько экземпляров бота не применяют миграции одновременно
+MIGRATION_LOCK_ID = 7_318_004_001
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            migrations.append((int(match.group(1)), match.group(2), f.read()))
+    migrations.sort()
+
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise Exception(f'Повторяющиеся номера миграций в {directory}')
+
+    return migrations
+
+async def applied_versions(conn):
+    rows = await conn.fetch("SELECT version FROM schema_version")
+    return {row['version'] for row in rows}
+
+async def apply_migrations(conn, migrations=None):
+    if migrations is None:
+        migrations = load_migrations()
+
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            " version INT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        applied = await applied_versions(conn)
+
+        count = 0
+        for version, name, sql in migrations:
+            if version in applied:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, name) VALUES ($1, $2)",
+                    version, name
+                )
+            logger.info("Применена миграция %04d_%s", version, name)
+            count += 1
+
+        if count == 0:
+            logger.info("Схема базы данных в актуальном состоянии")
+        return count
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+async def show_status(conn):
+    applied = set()
+    exists = await conn.fetchval("SELECT to_regclass('schema_version') IS NOT NULL")
+    if exists:
+        applied = await applied_versions(conn)
+    for version, name, _ in load_migrations():
+        mark = 'x' if version in applied else ' '
+        print(f"[{mark}] {version:04d}_{name}")
+
+# Миграции выполняются на отдельном соединении: на соединения пула действует
+# command_timeout, которого может не хватить для построения индексов
+async def run_migrations(status_only=False):
+    conn = await asyncpg.connect(**db.load_config())
+    try:
+        if status_only:
+            await show_status(conn)
+        else:
+            await apply_migrations(conn)
+    finally:
+        await conn.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description='Миграции схемы базы данных itmo.eve')
+    parser.add_argument('--status', action='store_true', help='показать применённые миграции и выйти')
+    args = parser.parse_args()
+    await run_migrations(status_only=args.status)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    asyncio.run(main())
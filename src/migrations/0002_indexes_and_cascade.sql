@@ -0,0 +1,21 @@
+-- Удаляем повторные подписки, оставляя самую раннюю запись
+DELETE FROM participants p
+USING participants d
+WHERE p.event_id = d.event_id
+  AND p.user_id = d.user_id
+  AND p.participant_id > d.participant_id;
+
+-- Проверка подписки при каждой отрисовке карточки и защита от дублей
+CREATE UNIQUE INDEX IF NOT EXISTS participants_event_user_uidx ON participants (event_id, user_id);
+
+-- Личный список мероприятий и его карусель
+CREATE INDEX IF NOT EXISTS events_user_date_idx ON events (user_id, event_date, event_id);
+
+-- Общая карусель упорядочена по (event_date, event_id)
+CREATE INDEX IF NOT EXISTS events_date_idx ON events (event_date, event_id);
+
+-- Удаление мероприятия сразу удаляет его подписки
+ALTER TABLE participants DROP CONSTRAINT IF EXISTS participants_event_id_fkey;
+ALTER TABLE participants
+    ADD CONSTRAINT participants_event_id_fkey
+    FOREIGN KEY (event_id) REFERENCES events(event_id) ON DELETE CASCADE;
@@ -0,0 +1,16 @@
+-- Уведомление экземпляров бота об изменении мероприятий (сброс кэша каталога)
+CREATE OR REPLACE FUNCTION notify_events_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('events_changed', OLD.event_id::text);
+    ELSE
+        PERFORM pg_notify('events_changed', NEW.event_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS events_changed_notify ON events;
+CREATE TRIGGER events_changed_notify
+    AFTER INSERT OR UPDATE OR DELETE ON events
+    FOR EACH ROW EXECUTE FUNCTION notify_events_changed();
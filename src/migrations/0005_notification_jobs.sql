@@ -0,0 +1,23 @@
+-- Отложенные рассылки участникам: напоминания, изменения и отмена мероприятий
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    event_id INT NOT NULL,
+    run_at TIMESTAMP NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    locked_until TIMESTAMP,
+    -- Последний получатель, которому рассылка поставлена в очередь (продолжение после перезапуска)
+    last_user_id BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS notification_jobs_due_idx ON notification_jobs (run_at) WHERE status <> 'done';
+CREATE INDEX IF NOT EXISTS notification_jobs_event_idx ON notification_jobs (event_id) WHERE status = 'pending';
+
+-- Получатели уведомления об отмене: подписки удаляются вместе с мероприятием
+CREATE TABLE IF NOT EXISTS notification_recipients (
+    job_id BIGINT NOT NULL REFERENCES notification_jobs(job_id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (job_id, user_id)
+);
@@ -0,0 +1,31 @@
+-- Полнотекстовый поиск по мероприятиям: поддерживаемый базой tsvector
+-- (русская и английская конфигурации) и GIN-индекс по нему
+ALTER TABLE events ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', title), 'A') ||
+    setweight(to_tsvector('english', title), 'A') ||
+    setweight(to_tsvector('russian', location), 'B') ||
+    setweight(to_tsvector('english', location), 'B') ||
+    setweight(to_tsvector('russian', description), 'C') ||
+    setweight(to_tsvector('english', description), 'C')
+) STORED;
+
+CREATE INDEX IF NOT EXISTS events_search_idx ON events USING GIN (search_tsv);
+
+-- Поиск с опечатками через pg_trgm. Расширение может быть недоступно
+-- (нет contrib или прав) — тогда бот ищет только по tsvector.
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm недоступно, поиск с опечатками отключён: %', SQLERRM;
+END;
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS events_search_trgm_idx ON events '
+                'USING GIN ((title || '' '' || location) gin_trgm_ops)';
+    END IF;
+END;
+$$;
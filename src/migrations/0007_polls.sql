@@ -0,0 +1,27 @@
+-- Опросы к мероприятиям. Итоги хранятся счётчиками в poll_options.votes,
+-- которые обновляются пакетно вместе с записью голосов
+CREATE TABLE IF NOT EXISTS polls (
+    poll_id SERIAL PRIMARY KEY,
+    event_id INT NOT NULL REFERENCES events(event_id) ON DELETE CASCADE,
+    question TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS polls_event_idx ON polls (event_id, poll_id);
+
+CREATE TABLE IF NOT EXISTS poll_options (
+    poll_id INT NOT NULL REFERENCES polls(poll_id) ON DELETE CASCADE,
+    option_no SMALLINT NOT NULL,
+    text TEXT NOT NULL,
+    votes INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (poll_id, option_no)
+);
+
+-- Один голос пользователя в опросе; повторный голос меняет выбранный вариант
+CREATE TABLE IF NOT EXISTS poll_votes (
+    poll_id INT NOT NULL REFERENCES polls(poll_id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    option_no SMALLINT NOT NULL,
+    voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (poll_id, user_id)
+);
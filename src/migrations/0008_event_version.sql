@@ -0,0 +1,15 @@
+-- Версия строки мероприятия: растёт при каждом изменении и входит в ключ
+-- кэша отрисованных карточек
+ALTER TABLE events ADD COLUMN IF NOT EXISTS version INT NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_event_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS events_bump_version ON events;
+CREATE TRIGGER events_bump_version
+    BEFORE UPDATE ON events
+    FOR EACH ROW EXECUTE FUNCTION bump_event_version();
@@ -0,0 +1,15 @@
+-- Счётчик участников мероприятия. Хранится в отдельной узкой таблице: обновление
+-- строки events пересчитывало бы search_tsv, меняло версию карточки и сбрасывало
+-- кэш каталога на каждую подписку. Счётчик меняется тем же запросом, что и
+-- подписка (repository.SUBSCRIBE / UNSUBSCRIBE).
+CREATE TABLE IF NOT EXISTS event_stats (
+    event_id INT PRIMARY KEY REFERENCES events(event_id) ON DELETE CASCADE,
+    participants_count INT NOT NULL DEFAULT 0 CHECK (participants_count >= 0)
+);
+
+INSERT INTO event_stats (event_id, participants_count)
+SELECT event_id, count(*) FROM participants GROUP BY event_id
+ON CONFLICT (event_id) DO UPDATE SET participants_count = EXCLUDED.participants_count;
+
+-- Рейтинг популярных мероприятий читается по этому индексу до первых N подходящих строк
+CREATE INDEX IF NOT EXISTS event_stats_popular_idx ON event_stats (participants_count DESC, event_id);
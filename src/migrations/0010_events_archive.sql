@@ -0,0 +1,30 @@
+-- Архив прошедших мероприятий. Фоновая задача (archive.py) переносит сюда
+-- мероприятия, прошедшие больше ARCHIVE_AFTER_DAYS дней назад, вместе с
+-- подписками, и в events остаются только предстоящие и недавние мероприятия.
+-- Архив разбит на помесячные секции по event_date; секции создаёт та же задача
+-- перед переносом. Ключ секционированной таблицы должен включать event_date.
+CREATE TABLE IF NOT EXISTS events_archive (
+    event_id INT NOT NULL,
+    user_id BIGINT,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    event_date TIMESTAMP NOT NULL,
+    location TEXT NOT NULL,
+    useful_links TEXT NOT NULL,
+    created_at TIMESTAMP,
+    version INT NOT NULL,
+    -- Число участников на момент переноса
+    participants_count INT NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (event_id, event_date)
+) PARTITION BY RANGE (event_date);
+
+-- Карусель архива идёт от недавних мероприятий к старым
+CREATE INDEX IF NOT EXISTS events_archive_date_idx ON events_archive (event_date, event_id);
+
+CREATE TABLE IF NOT EXISTS participants_archive (
+    event_id INT NOT NULL,
+    event_date TIMESTAMP NOT NULL,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (event_id, user_id, event_date)
+) PARTITION BY RANGE (event_date);
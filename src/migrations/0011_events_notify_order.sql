@@ -0,0 +1,14 @@
+-- Уведомление об изменении мероприятия сообщает, изменился ли состав или
+-- порядок каталога: кэш каталога сбрасывает список id только в этом случае
+CREATE OR REPLACE FUNCTION notify_events_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('events_changed', OLD.event_id::text || ':order');
+    ELSIF TG_OP = 'UPDATE' AND NEW.event_date IS NOT DISTINCT FROM OLD.event_date THEN
+        PERFORM pg_notify('events_changed', NEW.event_id::text);
+    ELSE
+        PERFORM pg_notify('events_changed', NEW.event_id::text || ':order');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
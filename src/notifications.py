@@ -0,0 +1,386 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# За сколько до начала мероприятия отправляются напоминания
+REMINDER_OFFSETS = {
+    'reminder_24h': timedelta(hours=24),
+    'reminder_1h': timedelta(hours=1),
+}
+
+# Сколько получателей читается за раз; прогресс рассылки сохраняется после
+# отправки каждой пачки
+RECIPIENT_BATCH = 500
+# Время, на которое экземпляр бота захватывает задание; по истечении его подхватит другой
+JOB_LEASE = timedelta(minutes=10)
+MAX_SEND_ATTEMPTS = 5
+# Сколько раз задание может быть захвачено; после этого оно помечается 'failed'
+MAX_JOB_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '5'))
+
+INSERT_JOB_QUERY = db.named(
+    'notification_job_insert',
+    "INSERT INTO notification_jobs (kind, event_id, run_at, payload) VALUES ($1, $2, $3, $4::jsonb)"
+    " RETURNING job_id, run_at"
+)
+CLAIM_JOB_QUERY = db.named(
+    'notification_job_claim',
+    "UPDATE notification_jobs SET status = 'running', attempts = attempts + 1, locked_until = $2"
+    " WHERE job_id = $1 AND attempts < $4"
+    " AND (status = 'pending' OR (status = 'running' AND locked_until < $3))"
+    " RETURNING job_id, kind, event_id, payload, last_user_id"
+)
+# Захват, прерванный остановкой бота, не считается попыткой
+RELEASE_JOB_QUERY = db.named(
+    'notification_job_release',
+    "UPDATE notification_jobs SET status = 'pending', attempts = attempts - 1, locked_until = NULL"
+    " WHERE job_id = $1 AND status = 'running'"
+)
+# Задания, исчерпавшие попытки, больше не захватываются
+FAIL_JOBS_QUERY = db.named(
+    'notification_jobs_fail',
+    "UPDATE notification_jobs SET status = 'failed', locked_until = NULL"
+    " WHERE status = 'running' AND locked_until < $1 AND attempts >= $2"
+    " RETURNING job_id, kind, event_id"
+)
+DUE_JOBS_QUERY = db.named(
+    'notification_jobs_due',
+    "SELECT job_id, run_at FROM notification_jobs"
+    " WHERE status <> 'done' AND status <> 'failed' AND run_at <= $1 AND (locked_until IS NULL OR locked_until < $2)"
+)
+PROGRESS_QUERY = db.named(
+    'notification_job_progress',
+    "UPDATE notification_jobs SET last_user_id = $2, locked_until = $3 WHERE job_id = $1"
+)
+PARTICIPANT_RECIPIENTS_QUERY = db.named(
+    'notification_participant_recipients',
+    "SELECT user_id FROM participants WHERE event_id = $1 AND user_id > $2 ORDER BY user_id LIMIT $3"
+)
+SAVED_RECIPIENTS_QUERY = db.named(
+    'notification_saved_recipients',
+    "SELECT user_id FROM notification_recipients WHERE job_id = $1 AND user_id > $2 ORDER BY user_id LIMIT $3"
+)
+# Напоминания для пачки новых мероприятий одним запросом (загрузка из файла)
+INSERT_REMINDERS_QUERY = db.named(
+    'notification_jobs_bulk_insert',
+    "INSERT INTO notification_jobs (kind, event_id, run_at, payload)"
+    " SELECT r.kind, e.event_id, e.event_date - r.offset_by, '{}'::jsonb"
+    " FROM events e CROSS JOIN unnest($2::text[], $3::interval[]) AS r(kind, offset_by)"
+    " WHERE e.event_id = ANY($1::int[]) AND e.event_date - r.offset_by > $4"
+    " RETURNING job_id, run_at"
+)
+
+def format_event_date(event_date):
+    return event_date.strftime("%d.%m.%Y %H:%M")
+
+def notification_text(kind, event):
+    if kind == 'reminder_24h':
+        return f"⏰ Напоминание: «{event['title']}» начнётся через 24 часа.\n📅 {event['event_date']}\n📍 {event['location']}"
+    if kind == 'reminder_1h':
+        return f"⏰ Напоминание: «{event['title']}» начнётся через час.\n📅 {event['event_date']}\n📍 {event['location']}"
+    if kind == 'edited':
+        return f"✏️ Мероприятие «{event['title']}» изменено.\n📅 Дата: {event['event_date']}\n📍 Место: {event['location']}"
+    if kind == 'cancelled':
+        return f"❌ Мероприятие «{event['title']}» ({event['event_date']}) отменено."
+    raise ValueError(f'Неизвестный тип уведомления: {kind}')
+
+# Функции ниже вызываются внутри транзакции, изменяющей мероприятие, и
+# возвращают созданные задания для передачи планировщику после коммита
+
+async def create_reminder_jobs(conn, event_id, event_date):
+    now = datetime.now()
+    jobs = []
+    for kind, offset in REMINDER_OFFSETS.items():
+        run_at = event_date - offset
+        if run_at > now:
+            jobs.append(await conn.fetchrow(INSERT_JOB_QUERY, kind, event_id, run_at, '{}'))
+    return jobs
+
+async def create_reminder_jobs_bulk(conn, event_ids):
+    return await conn.fetch(
+        INSERT_REMINDERS_QUERY, event_ids, list(REMINDER_OFFSETS), list(REMINDER_OFFSETS.values()), datetime.now()
+    )
+
+async def reschedule_event_jobs(conn, event_id, event_date):
+    await conn.execute(
+        "DELETE FROM notification_jobs WHERE event_id = $1 AND status = 'pending' AND kind = ANY($2::text[])",
+        event_id, list(REMINDER_OFFSETS)
+    )
+    jobs = await create_reminder_jobs(conn, event_id, event_date)
+    jobs.append(await conn.fetchrow(INSERT_JOB_QUERY, 'edited', event_id, datetime.now(), '{}'))
+    return jobs
+
+# Вызывается до удаления мероприятия: подписки удалятся каскадно, поэтому
+# список получателей сохраняется вместе с заданием
+async def create_cancel_job(conn, event_id):
+    event = await conn.fetchrow("SELECT title, event_date FROM events WHERE event_id = $1", event_id)
+    if event is None:
+        return []
+    await conn.execute("DELETE FROM notification_jobs WHERE event_id = $1 AND status = 'pending'", event_id)
+    payload = json.dumps({'title': event['title'], 'event_date': format_event_date(event['event_date'])}, ensure_ascii=False)
+    job = await conn.fetchrow(INSERT_JOB_QUERY, 'cancelled', event_id, datetime.now(), payload)
+    await conn.execute(
+        "INSERT INTO notification_recipients (job_id, user_id) SELECT $1, user_id FROM participants WHERE event_id = $2",
+        job['job_id'], event_id
+    )
+    return [job]
+
+# Очередь отправки сообщений с соблюдением лимитов Telegram: не больше rate
+# сообщений в секунду суммарно и не чаще одного сообщения в per_chat_interval
+# секунд в один чат. При ответе 429 отправка приостанавливается на retry_after.
+# send() возвращает future, которая завершается, когда сообщение отправлено
+# (True) или отправить его не удалось (False).
+class BroadcastSender:
+    def __init__(self, bot, rate=25, per_chat_interval=1.0, queue_size=1000, workers=4):
+        self.bot = bot
+        self.interval = 1.0 / rate
+        self.per_chat_interval = per_chat_interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self.sent = 0
+        self.failed = 0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._chat_next = {}
+        self._tasks = []
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    # Задания рассылки к этому моменту уже остановлены: неотправленные сообщения
+    # будут отправлены заново вместе с их пачкой после перезапуска
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self.queue.empty():
+            _, _, delivered = self.queue.get_nowait()
+            delivered.cancel()
+
+    async def send(self, chat_id, text):
+        delivered = asyncio.get_running_loop().create_future()
+        await self.queue.put((chat_id, text, delivered))
+        return delivered
+
+    async def _wait_turn(self, chat_id):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next_slot, self._paused_until, self._chat_next.get(chat_id, 0.0))
+        self._next_slot = start + self.interval
+        self._chat_next[chat_id] = start + self.per_chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {chat: t for chat, t in self._chat_next.items() if t > now}
+        if start > now:
+            await asyncio.sleep(start - now)
+        # Пауза после 429 могла начаться, пока мы ждали своей очереди
+        while self._paused_until > loop.time():
+            await asyncio.sleep(self._paused_until - loop.time())
+
+    async def _deliver(self, chat_id, text):
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            await self._wait_turn(chat_id)
+            try:
+                await self.bot.send_message(chat_id, text)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning("Превышен лимит Telegram, пауза рассылки на %s с", e.retry_after)
+                self._paused_until = max(self._paused_until, asyncio.get_running_loop().time() + e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Пользователь заблокировал бота или чат недоступен — повторять бессмысленно
+                logger.info("Не удалось отправить уведомление пользователю %s: %s", chat_id, e)
+                return False
+            except TelegramNetworkError as e:
+                logger.warning("Сетевая ошибка при отправке уведомления пользователю %s: %s", chat_id, e)
+                await asyncio.sleep(attempt)
+        return False
+
+    async def _worker(self):
+        while True:
+            chat_id, text, delivered = await self.queue.get()
+            result = False
+            try:
+                result = await self._deliver(chat_id, text)
+            except Exception as e:
+                logger.error("Ошибка при отправке уведомления пользователю %s: %s", chat_id, e)
+            finally:
+                if result:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                if not delivered.done():
+                    delivered.set_result(result)
+                self.queue.task_done()
+
+# Планировщик заданий: ближайшие задания держатся в куче по времени запуска,
+# остальные раз в poll_interval секунд подгружаются из БД. Задание выполняет
+# тот экземпляр бота, который первым его захватил.
+class NotificationScheduler:
+    def __init__(self, sender, poll_interval=60, max_running=2):
+        self.sender = sender
+        self.poll_interval = poll_interval
+        self.horizon = timedelta(seconds=poll_interval * 2)
+        self._heap = []
+        self._known = set()
+        self._wakeup = asyncio.Event()
+        self._running = asyncio.Semaphore(max_running)
+        self._task = None
+        self._jobs = set()
+
+    def schedule(self, jobs):
+        horizon = datetime.now() + self.horizon
+        for job in jobs:
+            if job['run_at'] <= horizon and job['job_id'] not in self._known:
+                self._known.add(job['job_id'])
+                heapq.heappush(self._heap, (job['run_at'], job['job_id']))
+                self._wakeup.set()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for task in list(self._jobs):
+            task.cancel()
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+
+    async def _poll(self):
+        now = datetime.now()
+        try:
+            async with db.acquire() as conn:
+                for job in await conn.fetch(FAIL_JOBS_QUERY, now, MAX_JOB_ATTEMPTS):
+                    logger.error(
+                        "Рассылка %s (%s) мероприятия %s не выполнена за %s попыток",
+                        job['job_id'], job['kind'], job['event_id'], MAX_JOB_ATTEMPTS
+                    )
+                jobs = await conn.fetch(DUE_JOBS_QUERY, now + self.horizon, now)
+            self.schedule(jobs)
+        except db.DB_ERRORS as e:
+            logger.error("Ошибка при загрузке заданий рассылки: %s", e)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_poll = 0.0
+        while True:
+            if loop.time() >= next_poll:
+                await self._poll()
+                next_poll = loop.time() + self.poll_interval
+
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now:
+                _, job_id = heapq.heappop(self._heap)
+                task = loop.create_task(self._execute(job_id))
+                self._jobs.add(task)
+                task.add_done_callback(self._jobs.discard)
+
+            timeout = next_poll - loop.time()
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job_id):
+        async with self._running:
+            try:
+                await self._broadcast(job_id)
+            except db.DB_ERRORS as e:
+                # Задание останется захваченным до истечения аренды и будет повторено
+                logger.error("Ошибка при выполнении рассылки %s: %s", job_id, e)
+            except asyncio.CancelledError:
+                # Остановка бота: задание сразу возвращается в очередь с последней сохранённой пачки
+                await asyncio.shield(self._release(job_id))
+                raise
+            finally:
+                self._known.discard(job_id)
+
+    async def _broadcast(self, job_id):
+        now = datetime.now()
+        async with db.acquire() as conn:
+            job = await conn.fetchrow(CLAIM_JOB_QUERY, job_id, now + JOB_LEASE, now, MAX_JOB_ATTEMPTS)
+            if job is None:
+                return
+            if job['kind'] == 'cancelled':
+                event = json.loads(job['payload'])
+                recipients_query, recipients_arg = SAVED_RECIPIENTS_QUERY, job_id
+            else:
+                event = await conn.fetchrow(
+                    "SELECT title, event_date, location FROM events WHERE event_id = $1", job['event_id']
+                )
+                recipients_query, recipients_arg = PARTICIPANT_RECIPIENTS_QUERY, job['event_id']
+
+        if event is not None:
+            if job['kind'] != 'cancelled':
+                event = dict(event, event_date=format_event_date(event['event_date']))
+            text = notification_text(job['kind'], event)
+            count = await self._fan_out(job_id, text, recipients_query, recipients_arg, job['last_user_id'])
+            logger.info("Рассылка %s (%s) выполнена: %s получателей", job_id, job['kind'], count)
+
+        async with db.acquire() as conn:
+            await conn.execute("UPDATE notification_jobs SET status = 'done', locked_until = NULL WHERE job_id = $1", job_id)
+            await conn.execute("DELETE FROM notification_recipients WHERE job_id = $1", job_id)
+
+    # Получатели читаются пачками по RECIPIENT_BATCH строк по ключу user_id,
+    # соединение берётся только на время запроса. Прогресс сохраняется, когда
+    # отправка всей пачки завершена, поэтому после перезапуска повторяется не
+    # больше одной пачки, а потерянных сообщений нет.
+    async def _fan_out(self, job_id, text, query, arg, last_user_id):
+        count = 0
+        while True:
+            async with db.acquire() as conn:
+                rows = await conn.fetch(query, arg, last_user_id, RECIPIENT_BATCH)
+            if not rows:
+                return count
+            await asyncio.gather(*[await self.sender.send(row['user_id'], text) for row in rows])
+            last_user_id = rows[-1]['user_id']
+            count += len(rows)
+            await self._save_progress(job_id, last_user_id)
+
+    async def _save_progress(self, job_id, user_id):
+        async with db.acquire() as conn:
+            await conn.execute(PROGRESS_QUERY, job_id, user_id, datetime.now() + JOB_LEASE)
+
+    async def _release(self, job_id):
+        try:
+            async with db.acquire() as conn:
+                await conn.execute(RELEASE_JOB_QUERY, job_id)
+        except db.DB_ERRORS as e:
+            logger.error("Ошибка при освобождении задания рассылки %s: %s", job_id, e)
+
+sender = None
+scheduler = None
+
+async def start(bot):
+    global sender, scheduler
+    sender = BroadcastSender(
+        bot,
+        rate=float(os.getenv('BROADCAST_RATE', '25')),
+        per_chat_interval=float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1')),
+    )
+    scheduler = NotificationScheduler(sender, poll_interval=float(os.getenv('NOTIFICATION_POLL_INTERVAL', '60')))
+    sender.start()
+    scheduler.start()
+
+async def stop():
+    if scheduler is not None:
+        await scheduler.stop()
+    if sender is not None:
+        await sender.stop()
+        logger.info("Уведомлений отправлено: %s, не доставлено: %s", sender.sent, sender.failed)
+
+def schedule(jobs):
+    if scheduler is not None:
+        scheduler.schedule(jobs)
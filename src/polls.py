@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+
+import db
+from keyboard import poll_keyboard
+
+logger = logging.getLogger(__name__)
+
+MAX_OPTIONS = 10
+MAX_OPTION_LENGTH = 100
+# Опросы после создания не меняются, поэтому их можно держать в памяти
+POLL_CACHE_SIZE = 1000
+# Сколько открытых карточек одного опроса обновляется и как долго
+MAX_LIVE_CARDS = 50
+CARD_LIFETIME = 15 * 60
+# Пауза между правками карточек, чтобы не упереться в лимиты Telegram
+EDIT_INTERVAL = 0.05
+
+# Пакетная запись голосов. Голоса берутся только для существующих вариантов
+# и только от участников мероприятия: нажатие не проверяется запросом к БД,
+# голоса остальных отбрасываются здесь. previous блокирует и читает прежние голоса
+# до вставки (вставка от него зависит), поэтому при смене варианта счётчик
+# старого уменьшается, а нового увеличивается.
+FLUSH_VOTES_QUERY = db.named('poll_votes_flush', """
+    WITH incoming AS (
+        SELECT t.poll_id, t.user_id, t.option_no
+        FROM unnest($1::int[], $2::bigint[], $3::smallint[]) AS t(poll_id, user_id, option_no)
+        JOIN poll_options o ON o.poll_id = t.poll_id AND o.option_no = t.option_no
+        JOIN polls p ON p.poll_id = t.poll_id
+        JOIN participants pa ON pa.event_id = p.event_id AND pa.user_id = t.user_id
+    ), previous AS (
+        SELECT v.poll_id, v.user_id, v.option_no
+        FROM poll_votes v
+        JOIN incoming i ON i.poll_id = v.poll_id AND i.user_id = v.user_id
+        FOR UPDATE OF v
+    ), upserted AS (
+        INSERT INTO poll_votes (poll_id, user_id, option_no)
+        SELECT i.poll_id, i.user_id, i.option_no
+        FROM incoming i
+        LEFT JOIN previous p ON p.poll_id = i.poll_id AND p.user_id = i.user_id
+        WHERE p.option_no IS DISTINCT FROM i.option_no
+        ON CONFLICT (poll_id, user_id) DO UPDATE SET option_no = EXCLUDED.option_no, voted_at = CURRENT_TIMESTAMP
+        WHERE poll_votes.option_no <> EXCLUDED.option_no
+        RETURNING poll_id, user_id, option_no
+    ), changes AS (
+        SELECT poll_id, option_no, 1 AS delta FROM upserted
+        UNION ALL
+        SELECT p.poll_id, p.option_no, -1 FROM previous p
+        JOIN upserted u ON u.poll_id = p.poll_id AND u.user_id = p.user_id
+    )
+    UPDATE poll_options o SET votes = o.votes + c.delta
+    FROM (SELECT poll_id, option_no, SUM(delta) AS delta FROM changes GROUP BY poll_id, option_no) c
+    WHERE o.poll_id = c.poll_id AND o.option_no = c.option_no AND c.delta <> 0
+    RETURNING o.poll_id
+""")
+
+# Сбросы разных экземпляров бота с голосами одного опроса выполняются по
+# очереди: иначе оба не увидят прежнего голоса пользователя в previous и
+# дважды изменят счётчики. Блокировки берутся по возрастанию poll_id.
+POLL_LOCK_CLASS = 0x706f6c6c
+LOCK_POLLS_QUERY = db.named(
+    'poll_votes_lock', "SELECT pg_advisory_xact_lock($1, poll_id) FROM unnest($2::int[]) AS t(poll_id)"
+)
+
+def parse_options(text):
+    options = [line.strip()[:MAX_OPTION_LENGTH] for line in (text or '').splitlines() if line.strip()]
+    if len(options) < 2 or len(options) > MAX_OPTIONS:
+        return None
+    return options
+
+# Вызывается внутри транзакции вместе с проверкой владельца мероприятия
+async def create_poll(conn, event_id, question, options):
+    poll_id = await conn.fetchval(
+        "INSERT INTO polls (event_id, question) VALUES ($1, $2) RETURNING poll_id",
+        event_id, question
+    )
+    await conn.executemany(
+        "INSERT INTO poll_options (poll_id, option_no, text) VALUES ($1, $2, $3)",
+        [(poll_id, option_no, text) for option_no, text in enumerate(options, start=1)]
+    )
+    return poll_id
+
+_polls = OrderedDict()
+
+async def load_poll(poll_id):
+    poll = _polls.get(poll_id)
+    if poll is not None:
+        _polls.move_to_end(poll_id)
+        return poll
+    async with db.acquire() as conn:
+        row = await conn.fetchrow("SELECT poll_id, event_id, question FROM polls WHERE poll_id = $1", poll_id)
+        if row is None:
+            return None
+        options = await conn.fetch(
+            "SELECT option_no, text FROM poll_options WHERE poll_id = $1 ORDER BY option_no", poll_id
+        )
+    poll = {
+        'poll_id': row['poll_id'],
+        'event_id': row['event_id'],
+        'question': row['question'],
+        'options': [(option['option_no'], option['text']) for option in options],
+    }
+    _polls[poll_id] = poll
+    while len(_polls) > POLL_CACHE_SIZE:
+        _polls.popitem(last=False)
+    return poll
+
+def forget_event(event_id):
+    for poll_id in [poll_id for poll_id, poll in _polls.items() if poll['event_id'] == event_id]:
+        del _polls[poll_id]
+
+async def event_polls(event_id):
+    async with db.acquire() as conn:
+        return await conn.fetch(
+            "SELECT poll_id, question FROM polls WHERE event_id = $1 ORDER BY poll_id", event_id
+        )
+
+# Итоги читаются из счётчиков poll_options.votes, без подсчёта голосов
+async def load_tally(poll_id):
+    async with db.acquire() as conn:
+        rows = await conn.fetch("SELECT option_no, votes FROM poll_options WHERE poll_id = $1", poll_id)
+    return {row['option_no']: row['votes'] for row in rows}
+
+def poll_card(poll, tally):
+    total = sum(tally.values())
+    lines = [f"📊 {poll['question']}", ""]
+    for option_no, text in poll['options']:
+        votes = tally.get(option_no, 0)
+        percent = round(votes * 100 / total) if total else 0
+        lines.append(f"{option_no}. {text} — {votes} ({percent}%)")
+    lines.append("")
+    lines.append(f"Всего голосов: {total}")
+    return "\n".join(lines)
+
+# Буфер голосов: нажатия копятся в памяти и раз в flush_interval секунд
+# записываются одним запросом. Повторные нажатия одного пользователя в пределах
+# пакета схлопываются — учитывается последнее.
+class VoteBuffer:
+    def __init__(self, flush_interval=0.5, on_flushed=None):
+        self.flush_interval = flush_interval
+        self.on_flushed = on_flushed
+        self.recorded = 0
+        self.flushed = 0
+        self._pending = {}
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, lambda: loop.create_task(self.flush()))
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, poll_id, user_id, option_no):
+        self._pending[(poll_id, user_id)] = option_no
+        self.recorded += 1
+        self._schedule_flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._flush_handle = None
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = {}
+            keys = sorted(batch)  # одинаковый порядок блокировок в параллельных сбросах
+            try:
+                async with db.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.execute(LOCK_POLLS_QUERY, POLL_LOCK_CLASS, sorted({poll_id for poll_id, _ in keys}))
+                        rows = await conn.fetch(
+                            FLUSH_VOTES_QUERY,
+                            [poll_id for poll_id, _ in keys],
+                            [user_id for _, user_id in keys],
+                            [batch[key] for key in keys],
+                        )
+            except db.DB_ERRORS as e:
+                logger.error("Ошибка при записи голосов: %s", e)
+                # Повторим запись при следующем сбросе, если голос не перезаписан
+                for key, option_no in batch.items():
+                    self._pending.setdefault(key, option_no)
+                self._schedule_flush()
+                return
+            self.flushed += len(batch)
+            if self.on_flushed is not None:
+                self.on_flushed({row['poll_id'] for row in rows})
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        await self.flush()
+
+# Открытые карточки опросов обновляются правкой сообщения не чаще раза в
+# interval секунд на опрос, сколько бы голосов ни пришло за это время.
+# Обновляются карточки, показанные этим экземпляром бота.
+class LiveCards:
+    def __init__(self, bot, interval=3.0):
+        self.bot = bot
+        self.interval = interval
+        self.edits = 0
+        self._cards = {}
+        self._dirty = set()
+        self._task = None
+
+    def track(self, poll_id, message):
+        cards = self._cards.setdefault(poll_id, OrderedDict())
+        key = (message.chat.id, message.message_id)
+        cards[key] = time.monotonic() + CARD_LIFETIME
+        cards.move_to_end(key)
+        while len(cards) > MAX_LIVE_CARDS:
+            cards.popitem(last=False)
+
+    def mark_dirty(self, poll_ids):
+        self._dirty.update(poll_id for poll_id in poll_ids if poll_id in self._cards)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            dirty, self._dirty = self._dirty, set()
+            for poll_id in dirty:
+                try:
+                    await self._refresh(poll_id)
+                except db.DB_ERRORS as e:
+                    logger.error("Ошибка при обновлении карточек опроса %s: %s", poll_id, e)
+
+    async def _refresh(self, poll_id):
+        now = time.monotonic()
+        cards = self._cards.get(poll_id)
+        for key in [key for key, expires in cards.items() if expires < now]:
+            del cards[key]
+        if not cards:
+            del self._cards[poll_id]
+            return
+
+        poll = await load_poll(poll_id)
+        if poll is None:
+            del self._cards[poll_id]
+            return
+        text = poll_card(poll, await load_tally(poll_id))
+        markup = poll_keyboard(poll)
+        for chat_id, message_id in list(cards):
+            await self._edit(cards, chat_id, message_id, text, markup)
+            await asyncio.sleep(EDIT_INTERVAL)
+
+    async def _edit(self, cards, chat_id, message_id, text, markup):
+        try:
+            await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=markup)
+            self.edits += 1
+        except TelegramRetryAfter as e:
+            logger.warning("Превышен лимит Telegram, обновление карточек опросов приостановлено на %s с", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            if 'message is not modified' not in str(e):
+                # Сообщение удалено или показывает уже другой экран
+                cards.pop((chat_id, message_id), None)
+        except TelegramForbiddenError:
+            cards.pop((chat_id, message_id), None)
+        except TelegramNetworkError as e:
+            logger.warning("Сетевая ошибка при обновлении карточки опроса: %s", e)
+
+votes = None
+cards = None
+
+async def start(bot):
+    global votes, cards
+    cards = LiveCards(bot, interval=float(os.getenv('POLL_CARD_INTERVAL', '3')))
+    votes = VoteBuffer(flush_interval=float(os.getenv('VOTE_FLUSH_INTERVAL', '0.5')), on_flushed=cards.mark_dirty)
+    cards.start()
+
+async def stop():
+    if votes is not None:
+        await votes.close()
+        logger.info("Голосов принято: %s, записано: %s", votes.recorded, votes.flushed)
+    if cards is not None:
+        await cards.stop()
+
+def record_vote(poll_id, user_id, option_no):
+    votes.record(poll_id, user_id, option_no)
+
+def track_card(poll_id, message):
+    if cards is not None and message is not None:
+        cards.track(poll_id, message)
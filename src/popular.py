@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+import db
+import repository
+
+logger = logging.getLogger(__name__)
+
+# Рейтинг популярных мероприятий: первые size предстоящих мероприятий по числу
+# участников. Список читается из базы раз в refresh_interval секунд и отдаётся
+# из памяти, так что показ рейтинга не нагружает базу. Без фонового обновления
+# (рабочие процессы, кроме первого) список перечитывается при показе, если устарел.
+class PopularEvents:
+    def __init__(self, size=10, refresh_interval=60.0):
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = None
+        self._events = []
+        self._task = None
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def events(self):
+        return self._events
+
+    def is_stale(self):
+        return self.refreshed_at is None or (datetime.now() - self.refreshed_at).total_seconds() >= self.refresh_interval
+
+    async def current(self):
+        if self._task is None and self.is_stale():
+            async with self._refresh_lock:
+                if self.is_stale():
+                    try:
+                        await self.refresh()
+                    except db.DB_ERRORS as e:
+                        logger.error("Ошибка при обновлении рейтинга мероприятий: %s", e)
+        return self._events
+
+    async def refresh(self):
+        async with db.acquire() as conn:
+            self._events = await repository.popular_events(conn, self.size, datetime.now())
+        self.refreshed_at = datetime.now()
+
+    # Удалённое мероприятие пропадает из рейтинга сразу, не дожидаясь обновления
+    def forget_event(self, event_id):
+        self._events = [event for event in self._events if event.event_id != event_id]
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except db.DB_ERRORS as e:
+                logger.error("Ошибка при обновлении рейтинга мероприятий: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+ranking = None
+
+async def start(background=True):
+    global ranking
+    ranking = PopularEvents(
+        size=int(os.getenv('POPULAR_SIZE', '10')),
+        refresh_interval=float(os.getenv('POPULAR_REFRESH_INTERVAL', '60')),
+    )
+    if background:
+        ranking.start()
+
+async def stop():
+    if ranking is not None:
+        await ranking.stop()
+
+async def top_events():
+    return await ranking.current() if ranking is not None else []
+
+def forget_event(event_id):
+    if ranking is not None:
+        ranking.forget_event(event_id)
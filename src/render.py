@@ -0,0 +1,160 @@
+import logging
+import os
+from collections import OrderedDict
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+
+from keyboard import (event_navigation_keyboard, personal_event_navigation_keyboard, archive_navigation_keyboard,
+                      event_list_keyboard, personal_event_list_keyboard)
+
+logger = logging.getLogger(__name__)
+
+def event_card_text(event, participants_count):
+    return (
+        f"📝 Название: {event.title}\n"
+        f"📖 Описание: {event.description}\n"
+        f"📅 Дата: {event.event_date}\n"
+        f"📍 Место: {event.location}\n"
+        f"👥 Участников: {participants_count}\n"
+    )
+
+# Готовые карточки мероприятий (текст и клавиатура) в LRU-кэше. Ключ включает
+# версию строки и число участников, поэтому изменённое мероприятие, в том числе
+# другим экземпляром бота, получает новую карточку; записи изменённых и удалённых
+# мероприятий удаляются через forget_event().
+class CardCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cards = OrderedDict()
+        self._keys_by_event = {}
+
+    def get(self, key):
+        card = self._cards.get(key)
+        if card is None:
+            self.misses += 1
+            return None
+        self._cards.move_to_end(key)
+        self.hits += 1
+        return card
+
+    def put(self, key, card):
+        self._cards[key] = card
+        self._cards.move_to_end(key)
+        self._keys_by_event.setdefault(key[1], set()).add(key)
+        while len(self._cards) > self.max_size:
+            old_key, _ = self._cards.popitem(last=False)
+            self._discard_key(old_key)
+
+    def _discard_key(self, key):
+        keys = self._keys_by_event.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_event[key[1]]
+
+    def forget_event(self, event_id):
+        for key in self._keys_by_event.pop(event_id, ()):
+            self._cards.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'cards': len(self._cards),
+        }
+
+card_cache = CardCache(max_size=int(os.getenv('CARD_CACHE_SIZE', '2000')))
+
+# Карточка общего каталога по странице карусели (repository.EventPage)
+def event_card(page):
+    event = page.event
+    key = ('public', event.event_id, event.version, page.participants_count, page.is_subscribed,
+           page.has_prev, page.has_next)
+    card = card_cache.get(key)
+    if card is None:
+        keyboard = event_navigation_keyboard(event, page.is_subscribed, page.has_prev, page.has_next)
+        card = (event_card_text(event, page.participants_count), keyboard)
+        card_cache.put(key, card)
+    return card
+
+# Карточка мероприятия в списке организатора
+def personal_event_card(page):
+    event = page.event
+    key = ('personal', event.event_id, event.version, page.participants_count, page.has_prev, page.has_next)
+    card = card_cache.get(key)
+    if card is None:
+        card = (
+            event_card_text(event, page.participants_count),
+            personal_event_navigation_keyboard(event, page.has_prev, page.has_next),
+        )
+        card_cache.put(key, card)
+    return card
+
+# Карточка прошедшего мероприятия из архива; архивные строки не меняются
+def archive_event_card(page):
+    event = page.event
+    key = ('archive', event.event_id, event.version, page.participants_count, page.has_prev, page.has_next)
+    card = card_cache.get(key)
+    if card is None:
+        card = (
+            "🗄 Мероприятие завершено\n" + event_card_text(event, page.participants_count),
+            archive_navigation_keyboard(event, page.has_prev, page.has_next),
+        )
+        card_cache.put(key, card)
+    return card
+
+# Строки страницы списка (repository.EventListPage) с номерами кнопок;
+# ✅ отмечает мероприятия, на которые записан пользователь
+def event_list_text(header, page):
+    lines = [
+        f"{number}. {'✅ ' if event.event_id in page.subscribed else ''}{event.title} — {event.event_date}, 👥 {event.participants_count}"
+        for number, event in enumerate(page.events, start=1)
+    ]
+    return header + "\n\n" + "\n".join(lines)
+
+def event_list(page):
+    return event_list_text("📋 Предстоящие мероприятия:", page), event_list_keyboard(page)
+
+def personal_event_list(page):
+    return event_list_text("📋 Мои мероприятия:", page), personal_event_list_keyboard(page)
+
+# Единая точка вывода экранов бота. На команду отправляется новое сообщение,
+# а нажатие кнопки редактирует сообщение с этой кнопкой: меняется только то,
+# что изменилось, а если не изменилось ничего — запрос к Bot API не делается.
+async def render(target, text, reply_markup=None):
+    if isinstance(target, types.Message):
+        return await target.answer(text, reply_markup=reply_markup)
+
+    message = target.message
+    if message is None or isinstance(message, types.InaccessibleMessage):
+        # Сообщение с кнопкой слишком старое — показываем экран новым сообщением
+        await target.answer()
+        return await target.bot.send_message(target.from_user.id, text, reply_markup=reply_markup)
+
+    # Telegram обрезает пробельные символы по краям текста сообщения
+    same_text = getattr(message, 'text', None) == text.strip()
+    same_markup = getattr(message, 'reply_markup', None) == reply_markup
+
+    try:
+        if same_text and same_markup:
+            await target.answer()  # Просто ответить на callback_query, чтобы убрать часы
+            return message
+        if same_text:
+            return await message.edit_reply_markup(reply_markup=reply_markup)
+        return await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if 'message is not modified' in str(e):
+            await target.answer()
+            return message
+        # Сообщение слишком старое или не текстовое — заменяем его новым
+        logger.info("Не удалось отредактировать сообщение, отправляется новое: %s", e)
+        try:
+            await message.delete()
+        except TelegramBadRequest as delete_error:
+            logger.error("Ошибка при удалении сообщения: %s", delete_error)
+        return await message.answer(text, reply_markup=reply_markup)
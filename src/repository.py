@@ -0,0 +1,326 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+import db
+
+# Доступ к пользователям, мероприятиям и подпискам: одна функция на операцию.
+# Тексты запросов объявлены константами, чтобы их под теми же именами
+# использовали метрики и бенчмарки (bench/db_bench.py). asyncpg готовит каждый
+# запрос на сервере один раз на соединение и дальше только выполняет его
+# (кэш statement_cache_size, см. DB_STATEMENT_CACHE_SIZE).
+
+# Строки мероприятий неизменяемы: одни и те же объекты лежат в кэше каталога
+# и передаются в карточки и клавиатуры
+@dataclass(frozen=True, slots=True)
+class Event:
+    event_id: int
+    user_id: int
+    title: str
+    description: str
+    event_date: datetime
+    location: str
+    useful_links: str
+    version: int
+
+# Краткая строка мероприятия для списков, результатов поиска и рейтинга
+@dataclass(frozen=True, slots=True)
+class EventSummary:
+    event_id: int
+    title: str
+    event_date: datetime
+    location: str
+    participants_count: int = 0
+
+# Карточка карусели: мероприятие, наличие соседей и число участников.
+# Счётчик меняется чаще самого мероприятия, поэтому не входит в Event
+# и не кэшируется вместе со строкой.
+@dataclass(frozen=True, slots=True)
+class EventPage:
+    event: Event
+    has_prev: bool
+    has_next: bool
+    is_subscribed: bool = False
+    participants_count: int = 0
+
+# Страница списка мероприятий: краткие строки (EventSummary), наличие соседних
+# страниц и id мероприятий страницы, на которые записан пользователь
+@dataclass(frozen=True, slots=True)
+class EventListPage:
+    events: tuple
+    has_prev: bool
+    has_next: bool
+    subscribed: frozenset = frozenset()
+
+# Колонки в порядке полей Event: строка запроса передаётся в конструктор как есть
+EVENT_COLUMNS = "e.event_id, e.user_id, e.title, e.description, e.event_date, e.location, e.useful_links, e.version"
+EVENT_FIELDS = len(fields(Event))
+
+def event_from_row(row):
+    return Event(*row[:EVENT_FIELDS])
+
+INSERT_USER = db.named('user_insert', "INSERT INTO users (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING")
+
+INSERT_EVENT = db.named(
+    'event_insert',
+    "INSERT INTO events (user_id, title, description, event_date, location, useful_links)"
+    " VALUES ($1, $2, $3, $4, $5, $6) RETURNING event_id"
+)
+UPDATE_EVENT = db.named(
+    'event_update',
+    "UPDATE events SET title = $1, description = $2, event_date = $3, location = $4, useful_links = $5"
+    " WHERE event_id = $6 AND user_id = $7 RETURNING event_id"
+)
+DELETE_EVENT = db.named('event_delete', "DELETE FROM events WHERE event_id = $1")
+
+# Проверка владельца перед удалением мероприятия и добавлением опроса
+LOCK_OWN_EVENT = db.named(
+    'event_lock_own', "SELECT event_id FROM events WHERE event_id = $1 AND user_id = $2 FOR UPDATE"
+)
+SHARE_OWN_EVENT = db.named(
+    'event_share_own', "SELECT event_id FROM events WHERE event_id = $1 AND user_id = $2 FOR SHARE"
+)
+EVENT_OWNER_QUERY = db.named('event_owner', "SELECT user_id FROM events WHERE event_id = $1")
+
+# Подписка и отписка меняют счётчик event_stats тем же запросом и только
+# если подписка действительно добавлена или удалена
+SUBSCRIBE = db.named('participant_insert', """
+    WITH added AS (
+        INSERT INTO participants (event_id, user_id) VALUES ($1, $2)
+        ON CONFLICT (event_id, user_id) DO NOTHING
+        RETURNING event_id
+    )
+    INSERT INTO event_stats (event_id, participants_count)
+    SELECT event_id, 1 FROM added
+    ON CONFLICT (event_id) DO UPDATE SET participants_count = event_stats.participants_count + 1
+""")
+UNSUBSCRIBE = db.named('participant_delete', """
+    WITH removed AS (
+        DELETE FROM participants WHERE event_id = $1 AND user_id = $2
+        RETURNING event_id
+    )
+    UPDATE event_stats s SET participants_count = s.participants_count - 1
+    FROM removed r WHERE s.event_id = r.event_id
+""")
+# Подписка пользователя и число участников для карточки общего каталога
+EVENT_STATE_QUERY = db.named(
+    'catalog_event_state',
+    "SELECT EXISTS (SELECT 1 FROM participants WHERE event_id = $1 AND user_id = $2) AS is_subscribed,"
+    " COALESCE((SELECT participants_count FROM event_stats WHERE event_id = $1), 0) AS participants_count"
+)
+# То же для всей страницы списка одним запросом вместо запроса на каждое мероприятие
+LIST_STATE_QUERY = db.named('catalog_list_state', """
+    SELECT e.event_id, COALESCE(s.participants_count, 0) AS participants_count, p.user_id IS NOT NULL AS is_subscribed
+    FROM events e
+    LEFT JOIN event_stats s ON s.event_id = e.event_id
+    LEFT JOIN participants p ON p.event_id = e.event_id AND p.user_id = $1
+    WHERE e.event_id = ANY($2)
+""")
+# Самые популярные предстоящие мероприятия (индекс event_stats_popular_idx)
+POPULAR_QUERY = db.named('events_popular', """
+    SELECT e.event_id, e.title, e.event_date, e.location, s.participants_count
+    FROM event_stats s
+    JOIN events e ON e.event_id = s.event_id
+    WHERE s.participants_count > 0 AND e.event_date >= $2
+    ORDER BY s.participants_count DESC, s.event_id
+    LIMIT $1
+""")
+
+# Запросы общего каталога, результаты которых кэширует catalog.py. Каталог
+# показывает только предстоящие мероприятия: диапазон индекса events_date_idx
+# от $1, поэтому время запроса зависит только от их числа.
+ORDER_QUERY = db.named(
+    'catalog_order', "SELECT event_id FROM events WHERE event_date >= $1 ORDER BY event_date, event_id"
+)
+EVENT_QUERY = db.named('catalog_event', f"SELECT {EVENT_COLUMNS} FROM events e WHERE e.event_id = $1")
+# Строки страницы списка, которых нет в кэше
+EVENTS_QUERY = db.named('catalog_events', f"SELECT {EVENT_COLUMNS} FROM events e WHERE e.event_id = ANY($1)")
+
+# Запросы каруселей по ключу (event_date, event_id): одна строка-карточка плюс
+# проверки наличия соседей. $1 задаёт область: id владельца для личного списка
+# или начало периода для общего каталога, $2 — id мероприятия-якоря.
+PERSONAL_SCOPE = "e.user_id = $1"
+CATALOG_SCOPE = "e.event_date >= $1"
+EVENT_PAGE_ANCHORS = {
+    'first': ("TRUE", "e.event_date, e.event_id"),
+    'current': ("e.event_id = $2", "e.event_date, e.event_id"),
+    'next': ("(e.event_date, e.event_id) > (SELECT a.event_date, a.event_id FROM events a WHERE a.event_id = $2)",
+             "e.event_date, e.event_id"),
+    'prev': ("(e.event_date, e.event_id) < (SELECT a.event_date, a.event_id FROM events a WHERE a.event_id = $2)",
+             "e.event_date DESC, e.event_id DESC"),
+}
+
+def build_page_query(scope, direction):
+    anchor, order = EVENT_PAGE_ANCHORS[direction]
+    return (
+        "WITH target AS ("
+        f" SELECT {EVENT_COLUMNS} FROM events e WHERE {scope} AND {anchor} ORDER BY {order} LIMIT 1"
+        ") SELECT t.*,"
+        " COALESCE((SELECT s.participants_count FROM event_stats s WHERE s.event_id = t.event_id), 0) AS participants_count,"
+        f" EXISTS (SELECT 1 FROM events e WHERE {scope} AND (e.event_date, e.event_id) < (t.event_date, t.event_id)) AS has_prev,"
+        f" EXISTS (SELECT 1 FROM events e WHERE {scope} AND (e.event_date, e.event_id) > (t.event_date, t.event_id)) AS has_next"
+        " FROM target t"
+    )
+
+PERSONAL_PAGE = {
+    direction: db.named(f'personal_page_{direction}', build_page_query(PERSONAL_SCOPE, direction))
+    for direction in EVENT_PAGE_ANCHORS
+}
+# Карусель общего каталога без кэша (catalog.py, пока нет подписки на уведомления)
+CATALOG_PAGE = {
+    direction: db.named(f'catalog_page_{direction}', build_page_query(CATALOG_SCOPE, direction))
+    for direction in EVENT_PAGE_ANCHORS
+}
+
+# Страница списка: до $2 строк по ключу (event_date, event_id) от
+# мероприятия-якоря $3. 'current' — страница, начинающаяся с якоря.
+LIST_ANCHOR = "(SELECT a.event_date, a.event_id FROM events a WHERE a.event_id = $3)"
+LIST_ANCHORS = {
+    'first': ("TRUE", "e.event_date, e.event_id"),
+    'current': (f"(e.event_date, e.event_id) >= {LIST_ANCHOR}", "e.event_date, e.event_id"),
+    'next': (f"(e.event_date, e.event_id) > {LIST_ANCHOR}", "e.event_date, e.event_id"),
+    'prev': (f"(e.event_date, e.event_id) < {LIST_ANCHOR}", "e.event_date DESC, e.event_id DESC"),
+}
+
+def build_list_query(scope, direction):
+    anchor, order = LIST_ANCHORS[direction]
+    return (
+        "WITH target AS ("
+        " SELECT e.event_id, e.title, e.event_date, e.location FROM events e"
+        f" WHERE {scope} AND {anchor} ORDER BY {order} LIMIT $2"
+        ") SELECT t.*,"
+        " COALESCE((SELECT s.participants_count FROM event_stats s WHERE s.event_id = t.event_id), 0) AS participants_count,"
+        f" EXISTS (SELECT 1 FROM events e WHERE {scope} AND (e.event_date, e.event_id) < (t.event_date, t.event_id)) AS has_prev,"
+        f" EXISTS (SELECT 1 FROM events e WHERE {scope} AND (e.event_date, e.event_id) > (t.event_date, t.event_id)) AS has_next"
+        " FROM target t ORDER BY t.event_date, t.event_id"
+    )
+
+PERSONAL_LIST = {
+    direction: db.named(f'personal_list_{direction}', build_list_query(PERSONAL_SCOPE, direction))
+    for direction in LIST_ANCHORS
+}
+CATALOG_LIST = {
+    direction: db.named(f'catalog_list_{direction}', build_list_query(CATALOG_SCOPE, direction))
+    for direction in LIST_ANCHORS
+}
+
+# Карусель архива (archive.py): от недавних мероприятий к старым, $1 — id мероприятия-якоря
+ARCHIVE_COLUMNS = EVENT_COLUMNS.replace('e.', 'a.')
+ARCHIVE_ANCHOR = "(SELECT x.event_date, x.event_id FROM events_archive x WHERE x.event_id = $1)"
+ARCHIVE_PAGE_ANCHORS = {
+    'first': ("TRUE", "a.event_date DESC, a.event_id DESC"),
+    'current': ("a.event_id = $1", "a.event_date DESC, a.event_id DESC"),
+    'next': (f"(a.event_date, a.event_id) < {ARCHIVE_ANCHOR}", "a.event_date DESC, a.event_id DESC"),
+    'prev': (f"(a.event_date, a.event_id) > {ARCHIVE_ANCHOR}", "a.event_date, a.event_id"),
+}
+
+def build_archive_page_query(direction):
+    anchor, order = ARCHIVE_PAGE_ANCHORS[direction]
+    return (
+        "WITH target AS ("
+        f" SELECT {ARCHIVE_COLUMNS}, a.participants_count FROM events_archive a WHERE {anchor} ORDER BY {order} LIMIT 1"
+        ") SELECT t.*,"
+        " EXISTS (SELECT 1 FROM events_archive a WHERE (a.event_date, a.event_id) > (t.event_date, t.event_id)) AS has_prev,"
+        " EXISTS (SELECT 1 FROM events_archive a WHERE (a.event_date, a.event_id) < (t.event_date, t.event_id)) AS has_next"
+        " FROM target t"
+    )
+
+ARCHIVE_PAGE = {
+    direction: db.named(f'archive_page_{direction}', build_archive_page_query(direction))
+    for direction in ARCHIVE_PAGE_ANCHORS
+}
+
+async def add_user(conn, user_id):
+    await conn.execute(INSERT_USER, user_id)
+
+async def create_event(conn, user_id, title, description, event_date, location, useful_links):
+    return await conn.fetchval(INSERT_EVENT, user_id, title, description, event_date, location, useful_links)
+
+# Изменить можно только собственное мероприятие; для чужого возвращается None
+async def update_event(conn, event_id, user_id, title, description, event_date, location, useful_links):
+    return await conn.fetchval(
+        UPDATE_EVENT, title, description, event_date, location, useful_links, event_id, user_id
+    )
+
+async def delete_event(conn, event_id):
+    await conn.execute(DELETE_EVENT, event_id)
+
+# Блокировки владельца вызываются внутри транзакции
+async def lock_own_event(conn, event_id, user_id):
+    return await conn.fetchval(LOCK_OWN_EVENT, event_id, user_id) is not None
+
+async def share_own_event(conn, event_id, user_id):
+    return await conn.fetchval(SHARE_OWN_EVENT, event_id, user_id) is not None
+
+async def event_owner(conn, event_id):
+    return await conn.fetchval(EVENT_OWNER_QUERY, event_id)
+
+async def subscribe(conn, event_id, user_id):
+    await conn.execute(SUBSCRIBE, event_id, user_id)
+
+async def unsubscribe(conn, event_id, user_id):
+    await conn.execute(UNSUBSCRIBE, event_id, user_id)
+
+# Возвращает (подписан ли пользователь, число участников)
+async def event_state(conn, event_id, user_id):
+    row = await conn.fetchrow(EVENT_STATE_QUERY, event_id, user_id)
+    return row['is_subscribed'], row['participants_count']
+
+# Возвращает (id мероприятий с подпиской пользователя, {id мероприятия: число участников})
+async def list_state(conn, user_id, event_ids):
+    rows = await conn.fetch(LIST_STATE_QUERY, user_id, event_ids)
+    subscribed = frozenset(row['event_id'] for row in rows if row['is_subscribed'])
+    return subscribed, {row['event_id']: row['participants_count'] for row in rows}
+
+async def popular_events(conn, limit, since):
+    return [EventSummary(*row) for row in await conn.fetch(POPULAR_QUERY, limit, since)]
+
+async def event_order(conn, since):
+    return [row['event_id'] for row in await conn.fetch(ORDER_QUERY, since)]
+
+async def get_event(conn, event_id):
+    row = await conn.fetchrow(EVENT_QUERY, event_id)
+    return event_from_row(row) if row is not None else None
+
+async def get_events(conn, event_ids):
+    return [event_from_row(row) for row in await conn.fetch(EVENTS_QUERY, event_ids)]
+
+async def fetch_page(conn, queries, scope_arg, direction, anchor_id):
+    args = (scope_arg,) if direction == 'first' else (scope_arg, anchor_id)
+    row = await conn.fetchrow(queries[direction], *args)
+    if row is None:
+        return None
+    return EventPage(
+        event_from_row(row), row['has_prev'], row['has_next'], participants_count=row['participants_count']
+    )
+
+async def personal_page(conn, user_id, direction='first', anchor_id=None):
+    return await fetch_page(conn, PERSONAL_PAGE, user_id, direction, anchor_id)
+
+# Подписку пользователя на мероприятие карточки каталога читает catalog.py
+async def catalog_page(conn, since, direction='first', anchor_id=None):
+    return await fetch_page(conn, CATALOG_PAGE, since, direction, anchor_id)
+
+# has_prev и has_next страницы — у её первой и последней строки
+async def fetch_list_page(conn, queries, scope_arg, size, direction, anchor_id):
+    args = (scope_arg, size) if direction == 'first' else (scope_arg, size, anchor_id)
+    rows = await conn.fetch(queries[direction], *args)
+    if not rows:
+        return None
+    return EventListPage(
+        tuple(EventSummary(*row[:5]) for row in rows), rows[0]['has_prev'], rows[-1]['has_next']
+    )
+
+async def personal_list_page(conn, user_id, size, direction='first', anchor_id=None):
+    return await fetch_list_page(conn, PERSONAL_LIST, user_id, size, direction, anchor_id)
+
+async def catalog_list_page(conn, since, size, direction='first', anchor_id=None):
+    return await fetch_list_page(conn, CATALOG_LIST, since, size, direction, anchor_id)
+
+async def archive_page(conn, direction='first', anchor_id=None):
+    args = () if direction == 'first' else (anchor_id,)
+    row = await conn.fetchrow(ARCHIVE_PAGE[direction], *args)
+    if row is None:
+        return None
+    return EventPage(
+        event_from_row(row), row['has_prev'], row['has_next'], participants_count=row['participants_count']
+    )
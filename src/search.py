@@ -0,0 +1,71 @@
+import logging
+
+import db
+from repository import EventSummary
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5
+MAX_QUERY_LENGTH = 200
+
+# Запрос разбирается в обеих конфигурациях: слова на русском и английском
+# совпадают с соответствующей частью events.search_tsv. Ранжируются все
+# совпадения: GIN-индекс отбирает их без просмотра каталога, а полный порядок
+# (ранг, дата, id) одинаков между запросами, так что страницы не повторяются
+# и не пропускают мероприятия.
+FULLTEXT_QUERY = db.named('search_fulltext', """
+    WITH q AS (
+        SELECT websearch_to_tsquery('russian', $1) || websearch_to_tsquery('english', $1) AS query
+    )
+    SELECT e.event_id, e.title, e.event_date, e.location
+    FROM events e, q
+    WHERE e.search_tsv @@ q.query
+    ORDER BY ts_rank_cd(e.search_tsv, q.query) DESC, e.event_date, e.event_id
+    LIMIT $2 OFFSET $3
+""")
+
+# Запасной поиск с опечатками по названию и месту (GIN-индекс events_search_trgm_idx)
+TRIGRAM_QUERY = db.named('search_trigram', """
+    SELECT event_id, title, event_date, location
+    FROM events
+    WHERE $1 <% (title || ' ' || location)
+    ORDER BY word_similarity($1, title || ' ' || location) DESC, event_date, event_id
+    LIMIT $2 OFFSET $3
+""")
+
+# None — ещё не проверяли, установлено ли расширение pg_trgm
+trigram_available = None
+
+async def has_trigram(conn):
+    global trigram_available
+    if trigram_available is None:
+        trigram_available = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+        )
+        if not trigram_available:
+            logger.warning("Расширение pg_trgm не установлено, поиск с опечатками отключён")
+    return trigram_available
+
+def normalize_query(text):
+    return ' '.join((text or '').split())[:MAX_QUERY_LENGTH]
+
+# Страница результатов поиска. Если полнотекстовый поиск ничего не нашёл,
+# используется нечёткий поиск; режим запоминается в FSM вместе с запросом,
+# чтобы следующие страницы брались из того же списка.
+async def search_events(query, page=0, fuzzy=None):
+    offset = page * PAGE_SIZE
+    async with db.acquire() as conn:
+        rows = []
+        if not fuzzy:
+            rows = await conn.fetch(FULLTEXT_QUERY, query, PAGE_SIZE + 1, offset)
+            if rows:
+                fuzzy = False
+        if fuzzy is not False and await has_trigram(conn):
+            rows = await conn.fetch(TRIGRAM_QUERY, query, PAGE_SIZE + 1, offset)
+            fuzzy = True
+    return {
+        'events': [EventSummary(*row) for row in rows[:PAGE_SIZE]],
+        'has_prev': page > 0,
+        'has_next': len(rows) > PAGE_SIZE,
+        'fuzzy': bool(fuzzy),
+    }
@@ -0,0 +1,88 @@
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from aiogram import BaseMiddleware
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Сколько корзин хранится до очистки простаивающих
+MAX_BUCKETS = 10000
+
+# Ограничение нажатий одного типа для одного пользователя: в среднем rate
+# нажатий в секунду, подряд — не больше burst
+@dataclass(frozen=True, slots=True)
+class Limit:
+    rate: float
+    burst: int
+
+def default_limit():
+    return Limit(rate=float(os.getenv('THROTTLE_RATE', '2')), burst=int(os.getenv('THROTTLE_BURST', '5')))
+
+class TokenBucket:
+    __slots__ = ('limit', 'tokens', 'updated')
+
+    def __init__(self, limit, now):
+        self.limit = limit
+        self.tokens = limit.burst
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.limit.rate >= self.limit.burst
+
+# Внешний middleware нажатий кнопок, до разбора данных и обращений к БД:
+# - повторное нажатие той же кнопки того же сообщения, пока первое ещё
+#   обрабатывается, сразу получает пустой ответ — результат покажет первое;
+# - нажатия сверх лимита типа кнопки получают короткий ответ и отбрасываются.
+# limit(callback_query) возвращает (тип кнопки, Limit или None для лимита по умолчанию).
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, limit, default=None):
+        self.limit = limit
+        self.default = default or default_limit()
+        self._buckets = {}
+        self._in_flight = set()
+
+    def _allow(self, user_id, kind, limit, now):
+        key = (user_id, kind)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(limit, now)
+        return bucket.take(now)
+
+    # Полная корзина ничем не отличается от новой, её можно забыть
+    def _prune(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if not bucket.is_full(now)}
+
+    async def __call__(self, handler, event, data):
+        user_id = event.from_user.id
+        message_key = event.inline_message_id or (event.message.message_id if event.message else None)
+        press = (user_id, message_key, event.data)
+        if press in self._in_flight:
+            registry.callbacks_dropped['duplicate'] += 1
+            await event.answer()
+            return None
+
+        kind, limit = self.limit(event)
+        if not self._allow(user_id, kind, limit or self.default, time.monotonic()):
+            registry.callbacks_dropped['throttled'] += 1
+            await event.answer("Слишком много нажатий, подождите немного.")
+            return None
+
+        self._in_flight.add(press)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(press)
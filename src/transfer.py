@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import csv
+import io
+import logging
+import os
+import re
+from datetime import datetime, timezone
+
+import asyncpg
+from dotenv import load_dotenv
+
+import catalog
+import db
+import notifications
+import repository
+from validators import DATE_FORMAT, validate_date, validate_url
+
+logger = logging.getLogger(__name__)
+
+# Загрузка мероприятий из CSV/ICS и выгрузка каталога и списков участников.
+# Используется командами бота /import, /export, /participants и из командной строки:
+#   python src/transfer.py import events.csv --owner 123456
+#   python src/transfer.py export catalog.ics
+#   python src/transfer.py export participants.csv --event 42
+
+MAX_IMPORT_BYTES = int(os.getenv('IMPORT_MAX_BYTES', str(5 * 1024 * 1024)))
+MAX_IMPORT_ROWS = int(os.getenv('IMPORT_MAX_ROWS', '5000'))
+# Сколько ошибок в строках показывается пользователю
+MAX_REPORTED_ERRORS = 10
+# Сколько строк выгрузки читается из курсора за раз
+EXPORT_BATCH = 500
+# COPY большого каталога может не уложиться в command_timeout пула
+TRANSFER_TIMEOUT = 300
+
+# Колонки CSV: те же имена выгружает export, поэтому выгрузку можно загрузить обратно.
+# Остальные колонки (например, event_id) пропускаются.
+CSV_COLUMNS = ('title', 'description', 'date', 'location', 'url')
+REQUIRED_COLUMNS = ('title', 'date', 'url')
+IMPORT_COLUMNS = ('title', 'description', 'event_date', 'location', 'useful_links')
+
+# Строки сначала копируются во временную таблицу, а в events переносятся одним
+# INSERT ... SELECT: так COPY остаётся быстрым, а id новых мероприятий нужны
+# для напоминаний
+CREATE_STAGING_QUERY = (
+    "CREATE TEMP TABLE events_import (title TEXT, description TEXT, event_date TIMESTAMP,"
+    " location TEXT, useful_links TEXT) ON COMMIT DROP"
+)
+IMPORT_EVENTS_QUERY = db.named(
+    'events_import',
+    "INSERT INTO events (user_id, title, description, event_date, location, useful_links)"
+    " SELECT $1, title, description, event_date, location, useful_links FROM events_import"
+    " RETURNING event_id"
+)
+
+CATALOG_CSV_QUERY = (
+    "SELECT event_id, title, description, to_char(event_date, 'DD.MM.YYYY HH24:MI') AS date, location,"
+    " useful_links AS url FROM events ORDER BY event_date, event_id"
+)
+CATALOG_ICS_QUERY = db.named(
+    'events_export',
+    "SELECT event_id, title, description, event_date, location, useful_links FROM events"
+    " ORDER BY event_date, event_id"
+)
+PARTICIPANTS_CSV_QUERY = "SELECT user_id FROM participants WHERE event_id = $1 ORDER BY user_id"
+
+ICS_ESCAPES = re.compile(r'\\([\\;,nN])')
+
+class ImportFileError(ValueError):
+    pass
+
+# Администраторы (ADMIN_IDS через запятую) выгружают весь каталог и списки
+# участников любых мероприятий
+def admin_ids():
+    return {int(value) for value in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if value}
+
+def is_admin(user_id):
+    return user_id in admin_ids()
+
+# ---- Загрузка ----
+
+def decode(data):
+    # Excel в русской локали сохраняет CSV в cp1251
+    for encoding in ('utf-8-sig', 'cp1251'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ImportFileError('Не удалось определить кодировку файла, сохраните его в UTF-8.')
+
+def read_csv(text):
+    sample = text[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text, newline=''), dialect=dialect)
+    columns = {name.strip().lower() for name in reader.fieldnames or ()}
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ImportFileError(
+            f"В первой строке файла нет колонок: {', '.join(missing)}. "
+            f"Ожидаются колонки {', '.join(CSV_COLUMNS)}."
+        )
+    for row in reader:
+        fields = {(name or '').strip().lower(): (value or '').strip() for name, value in row.items() if name}
+        if any(fields.get(name) for name in CSV_COLUMNS):
+            yield reader.line_num, fields
+
+def unescape_ics(value):
+    return ICS_ESCAPES.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+def split_ics_property(line):
+    # Двоеточие внутри кавычек относится к параметру (например, TZID="...")
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            name, *params = line[:index].split(';')
+            params = dict(param.partition('=')[::2] for param in params)
+            return name.upper(), {key.upper(): value for key, value in params.items()}, line[index + 1:]
+    return line.upper(), {}, ''
+
+# Дата начала приводится к формату диалога создания мероприятия и дальше
+# проверяется так же, как введённая вручную. Время в UTC переводится в местное,
+# часовой пояс TZID не учитывается.
+def ics_date(value, params):
+    try:
+        if params.get('VALUE') == 'DATE' or len(value) == 8:
+            moment = datetime.strptime(value, '%Y%m%d')
+        elif value.endswith('Z'):
+            moment = datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc).astimezone()
+        else:
+            moment = datetime.strptime(value, '%Y%m%dT%H%M%S')
+    except ValueError:
+        return value
+    return moment.strftime(DATE_FORMAT)
+
+ICS_FIELDS = {'SUMMARY': 'title', 'DESCRIPTION': 'description', 'LOCATION': 'location', 'URL': 'url'}
+
+def read_ics(text):
+    lines = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if line[:1] in (' ', '\t') and lines:
+            lines[-1][1] += line[1:]
+        elif line.strip():
+            lines.append([number, line])
+
+    fields = None
+    for number, line in lines:
+        name, params, value = split_ics_property(line)
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            fields, start_line = {}, number
+        elif fields is None:
+            continue
+        elif name == 'END' and value.upper() == 'VEVENT':
+            yield start_line, fields
+            fields = None
+        elif name == 'DTSTART':
+            fields['date'] = ics_date(value.strip(), params)
+        elif name in ICS_FIELDS:
+            fields[ICS_FIELDS[name]] = unescape_ics(value).strip()
+
+def validate_row(fields):
+    title = fields.get('title', '')
+    date_text = fields.get('date', '')
+    url = fields.get('url', '')
+    if not title:
+        return None, "не указано название"
+    if not validate_date(date_text):
+        return None, f"неправильный формат даты «{date_text}», нужно дд.мм.гггг чч:мм"
+    if not validate_url(url):
+        return None, f"неправильный формат ссылки «{url}»"
+    record = (
+        title, fields.get('description', ''), datetime.strptime(date_text, DATE_FORMAT),
+        fields.get('location', ''), url,
+    )
+    return record, None
+
+# Возвращает записи для COPY и список ошибок вида (номер строки, описание)
+def parse_events(data):
+    if len(data) > MAX_IMPORT_BYTES:
+        raise ImportFileError(f"Файл больше {MAX_IMPORT_BYTES // (1024 * 1024)} МБ.")
+    text = decode(data)
+    rows = read_ics(text) if text.lstrip().upper().startswith('BEGIN:VCALENDAR') else read_csv(text)
+    records = []
+    errors = []
+    for line, fields in rows:
+        if len(records) + len(errors) >= MAX_IMPORT_ROWS:
+            raise ImportFileError(f"В файле больше {MAX_IMPORT_ROWS} мероприятий.")
+        record, error = validate_row(fields)
+        if error is None:
+            records.append(record)
+        else:
+            errors.append((line, error))
+    if not records and not errors:
+        raise ImportFileError("В файле нет мероприятий.")
+    return records, errors
+
+def format_errors(errors):
+    lines = [f"строка {line}: {error}" for line, error in errors[:MAX_REPORTED_ERRORS]]
+    if len(errors) > MAX_REPORTED_ERRORS:
+        lines.append(f"…и ещё {len(errors) - MAX_REPORTED_ERRORS}")
+    return "\n".join(lines)
+
+# Все мероприятия файла создаются в одной транзакции вместе с напоминаниями.
+# Возвращает id созданных мероприятий и задания для планировщика уведомлений.
+async def import_events(conn, user_id, records):
+    async with conn.transaction():
+        await repository.add_user(conn, user_id)
+        await conn.execute(CREATE_STAGING_QUERY)
+        await conn.copy_records_to_table(
+            'events_import', records=records, columns=IMPORT_COLUMNS, timeout=TRANSFER_TIMEOUT
+        )
+        event_ids = [row['event_id'] for row in await conn.fetch(IMPORT_EVENTS_QUERY, user_id)]
+        jobs = await notifications.create_reminder_jobs_bulk(conn, event_ids)
+    catalog.invalidate()
+    return event_ids, jobs
+
+# ---- Выгрузка ----
+# Строки выгрузки пишутся в файл по мере чтения из базы: CSV потоком COPY TO STDOUT,
+# iCalendar — через серверный курсор пачками по EXPORT_BATCH строк
+
+def copied_rows(status):
+    return int(status.rsplit(' ', 1)[-1])
+
+async def export_catalog_csv(conn, path):
+    status = await conn.copy_from_query(
+        CATALOG_CSV_QUERY, output=path, format='csv', header=True, timeout=TRANSFER_TIMEOUT
+    )
+    return copied_rows(status)
+
+async def export_participants_csv(conn, event_id, path):
+    status = await conn.copy_from_query(
+        PARTICIPANTS_CSV_QUERY, event_id, output=path, format='csv', header=True, timeout=TRANSFER_TIMEOUT
+    )
+    return copied_rows(status)
+
+def escape_ics(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+# Строки iCalendar переносятся по 75 байт, продолжение начинается с пробела
+def fold_ics(line):
+    parts = []
+    current, size = '', 0
+    for char in line:
+        length = len(char.encode('utf-8'))
+        if size + length > 75:
+            parts.append(current)
+            current, size = ' ', 1
+        current += char
+        size += length
+    parts.append(current)
+    return '\r\n'.join(parts) + '\r\n'
+
+def ics_event(row, stamp):
+    lines = (
+        'BEGIN:VEVENT',
+        f"UID:event-{row['event_id']}@itmo.eve",
+        f'DTSTAMP:{stamp}',
+        f"DTSTART:{row['event_date']:%Y%m%dT%H%M%S}",
+        f"SUMMARY:{escape_ics(row['title'])}",
+        f"DESCRIPTION:{escape_ics(row['description'])}",
+        f"LOCATION:{escape_ics(row['location'])}",
+        f"URL:{row['useful_links']}",
+        'END:VEVENT',
+    )
+    return ''.join(fold_ics(line) for line in lines)
+
+async def export_catalog_ics(conn, path):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        output.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//itmo.eve//events//RU\r\n')
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(CATALOG_ICS_QUERY, prefetch=EXPORT_BATCH):
+                output.write(ics_event(row, stamp))
+                count += 1
+        output.write('END:VCALENDAR\r\n')
+    return count
+
+async def export_catalog(conn, path, fmt):
+    if fmt == 'ics':
+        return await export_catalog_ics(conn, path)
+    return await export_catalog_csv(conn, path)
+
+# ---- Командная строка ----
+# Работает на отдельном соединении, как и миграции. Уведомления о новых
+# мероприятиях подхватит запущенный бот, кэш каталога сбросится по NOTIFY.
+
+async def run_import(conn, path, owner):
+    with open(path, 'rb') as f:
+        records, errors = parse_events(f.read())
+    if errors:
+        raise ImportFileError("Файл не загружен, исправьте ошибки:\n" + format_errors(errors))
+    event_ids, _ = await import_events(conn, owner, records)
+    logger.info("Загружено мероприятий: %s", len(event_ids))
+
+async def run_export(conn, path, event_id):
+    if event_id is not None:
+        count = await export_participants_csv(conn, event_id, path)
+        logger.info("Выгружено участников мероприятия %s: %s", event_id, count)
+    else:
+        count = await export_catalog(conn, path, 'ics' if path.lower().endswith('.ics') else 'csv')
+        logger.info("Выгружено мероприятий: %s", count)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Загрузка и выгрузка мероприятий itmo.eve')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='загрузить мероприятия из CSV или ICS')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--owner', type=int, required=True, help='Telegram id организатора')
+    export_parser = commands.add_parser('export', help='выгрузить каталог (CSV или ICS по расширению) или участников')
+    export_parser.add_argument('path')
+    export_parser.add_argument('--event', type=int, help='выгрузить участников мероприятия в CSV')
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(**db.load_config())
+    try:
+        if args.command == 'import':
+            await run_import(conn, args.path, args.owner)
+        else:
+            await run_export(conn, args.path, args.event)
+    except ImportFileError as e:
+        parser.exit(1, f"{e}\n")
+    finally:
+        await conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    asyncio.run(main())
@@ -0,0 +1,19 @@
+import re
+from datetime import datetime
+
+# Формат даты, в котором пользователь вводит дату мероприятия
+DATE_FORMAT = "%d.%m.%Y %H:%M"
+URL_REGEX = re.compile(r'^(https?://)?(www\.)?([a-zA-Z0-9]+(\.[a-zA-Z0-9]+)+.*)$')
+
+def validate_date(date_text):
+    try:
+        datetime.strptime(date_text, DATE_FORMAT)
+        return True
+    except ValueError:
+        return False
+
+def convert_date_format(date_text):
+    return datetime.strptime(date_text, DATE_FORMAT).strftime("%Y-%m-%d %H:%M:%S")
+
+def validate_url(url):
+    return re.match(URL_REGEX, url) is not None
@@ -0,0 +1,127 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+
+from aiohttp import web
+from aiogram.types import Update
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def load_webhook_settings():
+    secret = os.getenv('WEBHOOK_SECRET')
+    if not secret:
+        raise Exception('Для режима webhook необходимо задать WEBHOOK_SECRET')
+    return {
+        'url': os.getenv('WEBHOOK_URL'),
+        'path': os.getenv('WEBHOOK_PATH', '/webhook'),
+        'host': os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+        'port': int(os.getenv('WEBHOOK_PORT', '8080')),
+        'secret': secret,
+        'max_concurrency': int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '100')),
+        'drain_timeout': float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '30')),
+    }
+
+# Приём обновлений от Telegram: ответ отправляется сразу после постановки
+# обновления в обработку, а число одновременно обрабатываемых обновлений
+# ограничено семафором. Когда лимит исчерпан, ответ задерживается, и Telegram
+# сам притормаживает доставку. С feed обновления не разбираются, а передаются
+# словарями в рабочие процессы (workers.ShardedFront.submit).
+class WebhookServer:
+    def __init__(self, dp, bot, secret, max_concurrency, feed=None):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.feed = feed
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.tasks = set()
+        self.accepting = True
+
+    async def handle(self, request):
+        if not self.accepting:
+            return web.Response(status=503)
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            logger.warning("Webhook-запрос с неверным секретом от %s", request.remote)
+            return web.Response(status=401)
+        if self.feed is not None:
+            try:
+                data = await request.json()
+            except ValueError as e:
+                logger.error("Некорректное обновление в webhook-запросе: %s", e)
+                return web.Response(status=400)
+            await self.feed(data)
+            return web.Response()
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except (ValueError, ValidationError) as e:
+            logger.error("Некорректное обновление в webhook-запросе: %s", e)
+            return web.Response(status=400)
+
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self.process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def process(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.exception("Ошибка при обработке обновления %s: %s", update.update_id, e)
+        finally:
+            self.semaphore.release()
+
+    # Плавная остановка: новые обновления не принимаются, начатые дорабатываются
+    async def drain(self, timeout):
+        self.accepting = False
+        if not self.tasks:
+            return
+        logger.info("Ожидание завершения %s обновлений", len(self.tasks))
+        done, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Прервано %s обновлений по таймауту остановки", len(pending))
+
+def wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка по KeyboardInterrupt
+            pass
+    return stop.wait()
+
+async def run_webhook(dp, bot, feed=None):
+    settings = load_webhook_settings()
+    server = WebhookServer(dp, bot, settings['secret'], settings['max_concurrency'], feed)
+
+    app = web.Application()
+    app.router.add_post(settings['path'], server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings['host'], settings['port'])
+    await site.start()
+    logger.info("Webhook-сервер запущен на %s:%s%s", settings['host'], settings['port'], settings['path'])
+
+    if settings['url']:
+        await bot.set_webhook(
+            settings['url'].rstrip('/') + settings['path'],
+            secret_token=settings['secret'],
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(settings['max_concurrency'], 100),
+        )
+
+    try:
+        await wait_for_stop_signal()
+    finally:
+        await site.stop()
+        await server.drain(settings['drain_timeout'])
+        await runner.cleanup()
+        logger.info("Webhook-сервер остановлен")
@@ -0,0 +1,307 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+import aiohttp
+from aiogram.types import Update
+
+import logs
+
+logger = logging.getLogger(__name__)
+
+# Режим с несколькими процессами: основной процесс только принимает обновления
+# и раскладывает их по очередям рабочих процессов по user_id, а разбор
+# обновлений, обработчики и запросы к БД выполняются в рабочих процессах.
+# Обновления одного пользователя всегда попадают в один процесс и
+# обрабатываются там строго по очереди, как того требуют диалоги FSM.
+
+# Пауза перед повторной попыткой положить обновление в переполненную очередь
+BACKPRESSURE_DELAY = 0.05
+# Рабочий процесс, проживший меньше этого времени, считается упавшим при запуске
+MIN_UPTIME = 10
+MAX_RESTART_DELAY = 60
+POLL_TIMEOUT = 25
+
+def load_worker_settings():
+    return {
+        'queue_size': int(os.getenv('WORKER_QUEUE_SIZE', '1000')),
+        'concurrency': int(os.getenv('WORKER_CONCURRENCY', '100')),
+        'health_interval': float(os.getenv('WORKER_HEALTH_INTERVAL', '5')),
+        'stall_timeout': float(os.getenv('WORKER_STALL_TIMEOUT', '30')),
+        'drain_timeout': float(os.getenv('WORKER_DRAIN_TIMEOUT', '30')),
+        'restart_delay': float(os.getenv('WORKER_RESTART_DELAY', '1')),
+    }
+
+# Пользователь, от которого пришло обновление, без разбора его в модели aiogram
+def update_user_id(data):
+    for value in data.values():
+        if isinstance(value, dict):
+            user = value.get('from') or value.get('user') or value.get('chat')
+            if isinstance(user, dict) and 'id' in user:
+                return user['id']
+    return data.get('update_id', 0)
+
+# ---- Рабочий процесс ----
+
+# При запуске через spawn main.py уже загружен в дочерний процесс как __mp_main__
+def load_app():
+    module = sys.modules.get('__mp_main__')
+    if module is not None and hasattr(module, 'dp'):
+        return module
+    return importlib.import_module('main')
+
+class ShardWorker:
+    def __init__(self, app, updates, heartbeat, settings):
+        self.app = app
+        self.updates = updates
+        self.heartbeat = heartbeat
+        self.settings = settings
+        self.slots = asyncio.Semaphore(settings['concurrency'])
+        self.tasks = set()
+        self._user_locks = {}
+        self._parent_pid = os.getppid()
+
+    async def beat(self):
+        while True:
+            self.heartbeat.value = time.time()
+            await asyncio.sleep(1)
+
+    # Блокировки берутся в порядке поступления обновлений, поэтому обновления
+    # одного пользователя обрабатываются последовательно и по порядку
+    async def process(self, user_id, data):
+        entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                update = Update.model_validate(data, context={'bot': self.app.bot})
+                await self.app.dp.feed_update(self.app.bot, update)
+        except Exception as e:
+            logger.exception("Ошибка при обработке обновления %s: %s", data.get('update_id'), e)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[user_id]
+            self.slots.release()
+
+    # Новое обновление читается из очереди, только когда есть свободный слот:
+    # очередь не вычитывается в память процесса, и основной процесс видит её заполнение
+    # Если основной процесс пропал, не дождавшись остановки, процесс завершается сам
+    def next_update(self):
+        while True:
+            try:
+                return self.updates.get(timeout=1)
+            except queue.Empty:
+                if os.getppid() != self._parent_pid:
+                    logger.error("Основной процесс завершился, рабочий процесс останавливается")
+                    return None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            data = await loop.run_in_executor(None, self.next_update)
+            if data is None:
+                self.slots.release()
+                return
+            task = loop.create_task(self.process(update_user_id(data), data))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def drain(self):
+        if self.tasks:
+            done, pending = await asyncio.wait(set(self.tasks), timeout=self.settings['drain_timeout'])
+            for task in pending:
+                task.cancel()
+
+async def run_worker(shard, updates, heartbeat, settings):
+    app = load_app()
+    app.dp.include_router(app.router)
+    worker = ShardWorker(app, updates, heartbeat, settings)
+    beat = asyncio.get_running_loop().create_task(worker.beat())
+    # Рассылки, архивация и фоновое обновление рейтинга — только в процессе 0
+    await app.on_startup(migrate_schema=False, background_jobs=shard == 0)
+    logger.info("Рабочий процесс %s запущен (pid %s)", shard, os.getpid())
+    try:
+        await worker.run()
+        await worker.drain()
+    finally:
+        await app.on_shutdown()
+        await app.bot.session.close()
+        beat.cancel()
+        logger.info("Рабочий процесс %s остановлен", shard)
+
+# Точка входа дочернего процесса. Остановкой управляет основной процесс,
+# поэтому Ctrl+C в терминале рабочие процессы игнорируют. У каждого процесса
+# свой порт метрик; рассылку ведёт только процесс 0 с полной скоростью.
+def worker_main(shard, updates, heartbeat, settings):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Записи процесса помечаются полем worker; atexit в дочернем процессе не
+    # вызывается, поэтому очередь журнала дописывается явно
+    logs.setup(worker=shard)
+    metrics_port = int(os.getenv('METRICS_PORT', '9100'))
+    if metrics_port:
+        os.environ['METRICS_PORT'] = str(metrics_port + 1 + shard)
+    try:
+        asyncio.run(run_worker(shard, updates, heartbeat, settings))
+    finally:
+        logs.stop()
+
+# ---- Основной процесс ----
+
+class Shard:
+    def __init__(self, context, index, settings):
+        self.context = context
+        self.index = index
+        self.settings = settings
+        self.updates = context.Queue(maxsize=settings['queue_size'])
+        self.heartbeat = context.Value('d', 0.0)
+        self.process = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at = 0.0
+        self.full = False
+
+    def start(self):
+        self.heartbeat.value = time.time()
+        self.started_at = time.monotonic()
+        self.process = self.context.Process(
+            target=worker_main, name=f'itmo-eve-worker-{self.index}',
+            args=(self.index, self.updates, self.heartbeat, self.settings),
+        )
+        self.process.start()
+
+    def is_stalled(self):
+        return time.time() - self.heartbeat.value > self.settings['stall_timeout']
+
+    def depth(self):
+        try:
+            return self.updates.qsize()
+        except NotImplementedError:  # macOS
+            return 0
+
+class ShardedFront:
+    def __init__(self, count, settings):
+        context = multiprocessing.get_context('spawn')
+        self.settings = settings
+        self.shards = [Shard(context, index, settings) for index in range(count)]
+        self._supervisor = None
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+        self._supervisor = asyncio.get_running_loop().create_task(self._supervise())
+        logger.info("Запущено рабочих процессов: %s", len(self.shards))
+
+    # Пока очередь процесса заполнена, приём обновлений приостанавливается:
+    # в режиме polling не запрашиваются новые обновления, в режиме webhook
+    # задерживается ответ Telegram
+    async def submit(self, data):
+        shard = self.shards[update_user_id(data) % len(self.shards)]
+        while True:
+            try:
+                shard.updates.put_nowait(data)
+                break
+            except queue.Full:
+                if not shard.full:
+                    shard.full = True
+                    logger.warning("Очередь рабочего процесса %s заполнена, приём обновлений замедлен", shard.index)
+                await asyncio.sleep(BACKPRESSURE_DELAY)
+        if shard.full:
+            shard.full = False
+            logger.info("Очередь рабочего процесса %s снова принимает обновления", shard.index)
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(self.settings['health_interval'])
+            for shard in self.shards:
+                self._check(shard)
+
+    # Процесс, убитый во время чтения, оставляет блокировку чтения очереди
+    # занятой, поэтому перезапущенный процесс получает новую очередь, а
+    # оставшиеся в старой обновления теряются
+    def _replace_queue(self, shard):
+        lost = shard.depth()
+        shard.updates = shard.context.Queue(maxsize=self.settings['queue_size'])
+        if lost:
+            logger.error("Потеряно обновлений из очереди процесса %s: %s", shard.index, lost)
+
+    # Зависший процесс (не обновляет heartbeat) завершается и перезапускается
+    # сразу, упавший — после паузы, которая растёт, если процесс падает сразу
+    # после запуска
+    def _check(self, shard):
+        now = time.monotonic()
+        if shard.process.is_alive():
+            if not shard.is_stalled():
+                if now - shard.started_at > MIN_UPTIME:
+                    shard.failures = 0
+                return
+            logger.error("Рабочий процесс %s не отвечает, перезапуск", shard.index)
+            shard.process.kill()
+            shard.process.join()
+            self._replace_queue(shard)
+        elif shard.restart_at == 0.0:
+            logger.error("Рабочий процесс %s завершился с кодом %s", shard.index, shard.process.exitcode)
+            self._replace_queue(shard)
+            if now - shard.started_at < MIN_UPTIME:
+                shard.failures += 1
+            delay = min(self.settings['restart_delay'] * 2 ** shard.failures, MAX_RESTART_DELAY)
+            shard.restart_at = now + delay
+            return
+        if now < shard.restart_at:
+            return
+        shard.restart_at = 0.0
+        shard.start()
+        logger.info("Рабочий процесс %s перезапущен (pid %s)", shard.index, shard.process.pid)
+
+    async def stop(self):
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for shard in self.shards:
+            if shard.process.is_alive():
+                await loop.run_in_executor(None, shard.updates.put, None)
+        timeout = self.settings['drain_timeout'] + 10
+        for shard in self.shards:
+            await loop.run_in_executor(None, shard.process.join, timeout)
+            if shard.process.is_alive():
+                logger.warning("Рабочий процесс %s не завершился вовремя и будет остановлен", shard.index)
+                shard.process.kill()
+        logger.info("Рабочие процессы остановлены")
+
+# Long polling без разбора обновлений: основной процесс получает JSON от
+# getUpdates и передаёт словари в очереди рабочих процессов
+async def poll_updates(bot, front, allowed_updates):
+    url = bot.session.api.api_url(token=bot.token, method='getUpdates')
+    offset = None
+    failures = 0
+    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        while True:
+            payload = {'timeout': POLL_TIMEOUT, 'allowed_updates': allowed_updates}
+            if offset is not None:
+                payload['offset'] = offset
+            try:
+                async with session.post(url, json=payload) as response:
+                    result = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                failures += 1
+                logger.warning("Ошибка при получении обновлений: %s", e)
+                await asyncio.sleep(min(failures, 30))
+                continue
+            if not result.get('ok'):
+                failures += 1
+                retry_after = result.get('parameters', {}).get('retry_after')
+                logger.warning("Bot API отклонил getUpdates: %s", result.get('description'))
+                await asyncio.sleep(retry_after or min(failures, 30))
+                continue
+            failures = 0
+            for data in result['result']:
+                await front.submit(data)
+                offset = data['update_id'] + 1
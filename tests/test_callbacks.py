@@ -0,0 +1,63 @@
+import pytest
+
+from callbacks import (CallbackDataError, CallbackDispatcher, EventNav, Home, MAX_INT, PAYLOADS, Vote, decode_field,
+                       encode_int, pack, unpack)
+
+
+@pytest.mark.parametrize('value', [0, 1, 35, 36, 100, 2 ** 31, MAX_INT])
+def test_int_round_trip(value):
+    assert decode_field(int, encode_int(value)) == value
+
+
+def test_pack_is_compact():
+    assert pack(EventNav('n', 100)) == 'e:n:2s'
+    assert pack(Home()) == 'h'
+    assert unpack('v:a:3') == Vote(10, 3)
+
+
+@pytest.mark.parametrize('raw', ['00', '02s', '0000000000001'])
+def test_leading_zeros_rejected(raw):
+    with pytest.raises(CallbackDataError):
+        decode_field(int, raw)
+
+
+def test_one_encoding_per_payload():
+    assert unpack('e:n:2s') == EventNav('n', 100)
+    with pytest.raises(CallbackDataError):
+        unpack('e:n:002s')
+
+
+@pytest.mark.parametrize('packed', [
+    '', 'zz', 'e', 'e:n', 'e:n:2s:1', 'e:x:2s', 'e:n:-1', 'e:n:2S', 'e:n:' + 'z' * 14,
+    'e:n:' + 'z' * 13, 'x' * 65,
+])
+def test_malformed_rejected(packed):
+    with pytest.raises(CallbackDataError):
+        unpack(packed)
+
+
+def test_encode_rejects_out_of_range():
+    with pytest.raises(CallbackDataError):
+        encode_int(-1)
+    with pytest.raises(CallbackDataError):
+        pack(EventNav('x', 1))
+
+
+def test_every_payload_fits_telegram_limit():
+    for cls in PAYLOADS.values():
+        values = [MAX_INT if field_type is int else field_type.__args__[0] for _, field_type in cls.codecs]
+        assert len(pack(cls(*values)).encode()) <= 64
+
+
+def test_dispatcher_resolves_by_prefix():
+    dispatcher = CallbackDispatcher()
+
+    @dispatcher.handler(EventNav)
+    async def switch_event(callback_query, data, state):
+        pass
+
+    assert dispatcher.resolve('e:p:a') == (switch_event, EventNav('p', 10))
+    with pytest.raises(KeyError):
+        dispatcher.resolve('h')
+    with pytest.raises(ValueError):
+        dispatcher.handler(EventNav)(switch_event)
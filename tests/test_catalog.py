@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import catalog
+from catalog import EventCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(catalog.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(clock):
+    cache = EventCache(ttl=60, max_size=2)
+    cache.enabled = True
+    return cache
+
+
+def row(event_id):
+    return SimpleNamespace(event_id=event_id)
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = EventCache(ttl=60, max_size=2)
+    cache.put_row(row(1), cache.generation)
+    assert cache.put_order([1, 2], cache.generation) == ([1, 2], {1: 0, 2: 1})
+    assert cache.get_row(1) is None
+    assert cache.get_order() is None
+
+
+def test_rows_expire_and_are_evicted(cache, clock):
+    cache.put_row(row(1), cache.generation)
+    cache.put_row(row(2), cache.generation)
+    assert cache.get_row(1).event_id == 1
+    cache.put_row(row(3), cache.generation)
+    assert cache.get_row(2) is None
+    assert cache.get_row(1).event_id == 1
+    clock.now += 61
+    assert cache.get_row(1) is None
+
+
+def test_order_expires(cache, clock):
+    cache.put_order([3, 1], cache.generation)
+    assert cache.get_order() == ([3, 1], {3: 0, 1: 1})
+    clock.now += 61
+    assert cache.get_order() is None
+
+
+def test_stale_generation_is_not_stored(cache):
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put_row(row(1), generation)
+    order = cache.put_order([1], generation)
+    assert cache.get_row(1) is None
+    assert cache.get_order() is None
+    # Прочитанный порядок всё равно отдаётся вызвавшему
+    assert order == ([1], {1: 0})
+
+
+def test_invalidate_without_reorder_keeps_order(cache):
+    cache.put_row(row(1), cache.generation)
+    cache.put_row(row(2), cache.generation)
+    cache.put_order([1, 2], cache.generation)
+    cache.invalidate(1, reorder=False)
+    assert cache.get_row(1) is None
+    assert cache.get_row(2).event_id == 2
+    assert cache.get_order() == ([1, 2], {1: 0, 2: 1})
+    cache.invalidate(2)
+    assert cache.get_order() is None
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_invalidate_during_load_is_not_lost(monkeypatch, cache):
+    monkeypatch.setattr(catalog, 'cache', cache)
+
+    async def get_event(conn, event_id):
+        # Уведомление об изменении приходит, пока строка читается из базы
+        catalog.on_events_changed(None, 0, catalog.NOTIFY_CHANNEL, str(event_id))
+        return row(event_id)
+
+    monkeypatch.setattr(catalog.repository, 'get_event', get_event)
+    assert asyncio.run(catalog.load_event(None, 5)).event_id == 5
+    assert cache.get_row(5) is None
+
+
+@pytest.mark.parametrize('payload, order_kept, row_kept', [
+    ('1', True, False),
+    ('1:order', False, False),
+    ('2', True, True),
+    ('garbage', False, False),
+    ('', False, False),
+])
+def test_notification_payloads(monkeypatch, cache, payload, order_kept, row_kept):
+    monkeypatch.setattr(catalog, 'cache', cache)
+    cache.put_row(row(1), cache.generation)
+    cache.put_order([1], cache.generation)
+    catalog.on_events_changed(None, 0, catalog.NOTIFY_CHANNEL, payload)
+    assert (cache.get_order() is not None) == order_kept
+    assert (cache.get_row(1) is not None) == row_kept
@@ -0,0 +1,54 @@
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def main(monkeypatch):
+    monkeypatch.setenv('TOKEN', '123456:' + 'A' * 35)
+    monkeypatch.setenv('ADMIN_IDS', '1, 2')
+    return importlib.import_module('main')
+
+
+class FakeMessage:
+    def __init__(self, user_id):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.document = SimpleNamespace(file_size=10)
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+class FakeState:
+    def __init__(self, state=None):
+        self.state = state
+
+    async def set_state(self, state):
+        self.state = state
+
+    async def clear(self):
+        self.state = None
+
+
+def test_import_refused_for_non_admin(main):
+    message, state = FakeMessage(3), FakeState()
+    asyncio.run(main.import_command(message, state))
+    assert message.answers == [main.ADMIN_ONLY_TEXT]
+    assert state.state is None
+
+
+def test_import_file_refused_for_non_admin(main):
+    message, state = FakeMessage(3), FakeState(main.EventImport.waiting_for_file)
+    asyncio.run(main.handle_import_file(message, state))
+    assert message.answers == [main.ADMIN_ONLY_TEXT]
+    assert state.state is None
+
+
+def test_import_allowed_for_admin(main):
+    message, state = FakeMessage(2), FakeState()
+    asyncio.run(main.import_command(message, state))
+    assert message.answers == [main.IMPORT_HELP_TEXT]
+    assert state.state == main.EventImport.waiting_for_file
@@ -0,0 +1,50 @@
+import json
+import logging
+
+from logs import JsonFormatter, RedactingFormatter, SamplingFilter, redact, secret_values
+
+BOT_TOKEN = '123456789:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw_'
+
+
+def test_redact_known_secrets():
+    assert redact('webhook secret=hunter22 end', ['hunter22']) == 'webhook secret=*** end'
+
+
+def test_redact_bot_token_without_env():
+    text = f'POST https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
+    assert redact(text) == 'POST https://api.telegram.org/bot***/sendMessage'
+
+
+def test_redact_dsn_password():
+    assert redact('connect postgres://bot:p@ss:w0rd@db:5432/itmo failed') == \
+        'connect postgres://bot:***@db:5432/itmo failed'
+    assert redact('host=db user=bot') == 'host=db user=bot'
+
+
+def test_secret_values_from_env(monkeypatch):
+    monkeypatch.setenv('TOKEN', BOT_TOKEN)
+    monkeypatch.setenv('DATABASE_PASSWORD', 'pass')
+    monkeypatch.setenv('WEBHOOK_SECRET', 'abc')
+    assert secret_values() == [BOT_TOKEN, 'pass']
+
+
+def make_record(msg, *args, name='updates', level=logging.INFO, **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_redacting_json_formatter(monkeypatch):
+    monkeypatch.setenv('DATABASE_PASSWORD', 'pass1234')
+    formatter = RedactingFormatter(JsonFormatter())
+    entry = json.loads(formatter.format(make_record("Нет связи с БД: %s", 'password=pass1234', update_id=7)))
+    assert entry['message'] == 'Нет связи с БД: password=***'
+    assert entry['update_id'] == 7
+    assert 'user_id' not in entry
+
+
+def test_sampling_keeps_warnings_and_other_loggers():
+    sampling = SamplingFilter(0.0, ['updates'])
+    assert not sampling.filter(make_record("Обновление обработано"))
+    assert sampling.filter(make_record("Обновление обработано", level=logging.WARNING))
+    assert sampling.filter(make_record("Бот запущен", name='main'))
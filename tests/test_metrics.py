@@ -0,0 +1,50 @@
+import pytest
+
+from metrics import BUCKETS, CounterFamily, Histogram, HistogramFamily, escape, render_histogram
+
+
+def test_observe_fills_buckets():
+    histogram = Histogram()
+    for value in (0.001, 0.003, 0.003, 20.0):
+        histogram.observe(value)
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(20.007)
+    assert histogram.counts[0] == 1
+    assert histogram.counts[BUCKETS.index(0.005)] == 2
+    assert histogram.counts[-1] == 1
+
+
+def test_quantile_by_bucket_bound():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) == 0.0
+    for value in [0.002] * 90 + [0.3] * 9 + [30.0]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.0025
+    assert histogram.quantile(0.95) == 0.5
+    assert histogram.quantile(1.0) == float('inf')
+
+
+def test_families_create_on_first_use():
+    latency = HistogramFamily()
+    latency['list'].observe(0.01)
+    assert latency['list'].count == 1
+    errors = CounterFamily()
+    assert errors['list'] == 0
+    assert 'list' not in errors
+
+
+def test_render_histogram_is_cumulative():
+    family = HistogramFamily()
+    family['a"b'].observe(0.002)
+    family['a"b'].observe(0.02)
+    lines = render_histogram('x_seconds', 'help', family, 'query')
+    assert lines[:2] == ['# HELP x_seconds help', '# TYPE x_seconds histogram']
+    assert 'x_seconds_bucket{query="a\\"b",le="0.001"} 0' in lines
+    assert 'x_seconds_bucket{query="a\\"b",le="0.0025"} 1' in lines
+    assert 'x_seconds_bucket{query="a\\"b",le="10"} 2' in lines
+    assert 'x_seconds_bucket{query="a\\"b",le="+Inf"} 2' in lines
+    assert lines[-1] == 'x_seconds_count{query="a\\"b"} 2'
+
+
+def test_escape():
+    assert escape('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
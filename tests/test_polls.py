@@ -0,0 +1,47 @@
+import asyncio
+
+from polls import MAX_OPTION_LENGTH, MAX_OPTIONS, VoteBuffer, parse_options, poll_card
+
+
+def test_parse_options_skips_blank_lines():
+    assert parse_options("  Да \n\n Нет\n") == ['Да', 'Нет']
+
+
+def test_parse_options_limits():
+    assert parse_options("Один") is None
+    assert parse_options("") is None
+    assert parse_options(None) is None
+    assert parse_options("\n".join(str(n) for n in range(MAX_OPTIONS + 1))) is None
+    assert len(parse_options("\n".join(str(n) for n in range(MAX_OPTIONS)))) == MAX_OPTIONS
+    assert parse_options("x" * 500 + "\nНет")[0] == "x" * MAX_OPTION_LENGTH
+
+
+POLL = {'question': 'Когда?', 'options': [(1, 'Утром'), (2, 'Вечером'), (3, 'Ночью')]}
+
+
+def test_poll_card_counts_and_percents():
+    assert poll_card(POLL, {1: 1, 2: 2}).splitlines() == [
+        '📊 Когда?', '', '1. Утром — 1 (33%)', '2. Вечером — 2 (67%)', '3. Ночью — 0 (0%)', '', 'Всего голосов: 3',
+    ]
+
+
+def test_poll_card_without_votes():
+    assert '1. Утром — 0 (0%)' in poll_card(POLL, {})
+    assert poll_card(POLL, {}).endswith('Всего голосов: 0')
+
+
+def test_vote_buffer_keeps_last_press_per_user():
+    async def scenario():
+        buffer = VoteBuffer(flush_interval=60)
+        buffer.record(1, 10, 1)
+        buffer.record(1, 10, 2)
+        buffer.record(1, 11, 1)
+        buffer.record(2, 10, 1)
+        pending = dict(buffer._pending)
+        buffer._flush_handle.cancel()
+        return buffer, pending
+
+    buffer, pending = asyncio.run(scenario())
+    assert pending == {(1, 10): 2, (1, 11): 1, (2, 10): 1}
+    assert buffer.recorded == 4
+    assert buffer.pending == 3
@@ -0,0 +1,52 @@
+from render import CardCache
+
+
+def key(event_id, version=1):
+    return ('public', event_id, version)
+
+
+def test_hit_and_miss_counted():
+    cache = CardCache(max_size=4)
+    assert cache.get(key(1)) is None
+    cache.put(key(1), 'card')
+    assert cache.get(key(1)) == 'card'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'cards': 1}
+
+
+def test_empty_stats():
+    assert CardCache(max_size=1).stats()['hit_ratio'] == 0.0
+
+
+def test_least_recently_used_evicted():
+    cache = CardCache(max_size=2)
+    cache.put(key(1), 'a')
+    cache.put(key(2), 'b')
+    cache.get(key(1))
+    cache.put(key(3), 'c')
+    assert cache.get(key(2)) is None
+    assert cache.get(key(1)) == 'a'
+    assert cache.get(key(3)) == 'c'
+    assert cache._keys_by_event == {1: {key(1)}, 3: {key(3)}}
+
+
+def test_forget_event_drops_every_variant():
+    cache = CardCache(max_size=10)
+    cache.put(key(1, 1), 'old')
+    cache.put(key(1, 2), 'new')
+    cache.put(('personal', 1, 2), 'own')
+    cache.put(key(2), 'other')
+    cache.forget_event(1)
+    assert cache.get(key(1, 1)) is None
+    assert cache.get(key(1, 2)) is None
+    assert cache.get(('personal', 1, 2)) is None
+    assert cache.get(key(2)) == 'other'
+    assert cache.stats()['cards'] == 1
+    cache.forget_event(42)
+
+
+def test_put_replaces_card():
+    cache = CardCache(max_size=2)
+    cache.put(key(1), 'a')
+    cache.put(key(1), 'b')
+    assert cache.get(key(1)) == 'b'
+    assert cache.stats()['cards'] == 1
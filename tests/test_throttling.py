@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import throttling
+from throttling import Limit, ThrottlingMiddleware, TokenBucket
+
+
+def test_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(Limit(rate=2, burst=3), now=0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert not bucket.take(0.25)
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+
+
+def test_bucket_never_exceeds_burst():
+    bucket = TokenBucket(Limit(rate=2, burst=2), now=0.0)
+    bucket.take(0.0)
+    assert bucket.is_full(0.5)
+    assert [bucket.take(100.0) for _ in range(3)] == [True, True, False]
+    assert not bucket.is_full(100.0)
+
+
+def test_prune_forgets_full_buckets(monkeypatch):
+    monkeypatch.setattr(throttling, 'MAX_BUCKETS', 2)
+    middleware = ThrottlingMiddleware(limit=None, default=Limit(rate=1, burst=1))
+    limit = middleware.default
+    assert middleware._allow(1, 'nav', limit, 0.0)
+    assert middleware._allow(2, 'nav', limit, 0.5)
+    assert middleware._allow(3, 'nav', limit, 1.2)
+    assert set(middleware._buckets) == {(2, 'nav'), (3, 'nav')}
+
+
+class FakeCallbackQuery:
+    def __init__(self, user_id, data, message_id=1):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.inline_message_id = None
+        self.message = SimpleNamespace(message_id=message_id)
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+
+def test_middleware_drops_duplicates_and_excess_presses():
+    async def scenario():
+        middleware = ThrottlingMiddleware(limit=lambda event: ('nav', None), default=Limit(rate=0.001, burst=2))
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(event, data):
+            handled.append(event.data)
+            await release.wait()
+
+        first = FakeCallbackQuery(1, 'e:n:1')
+        duplicate = FakeCallbackQuery(1, 'e:n:1')
+        task = asyncio.create_task(middleware(handler, first, {}))
+        await asyncio.sleep(0)
+        await middleware(handler, duplicate, {})
+        release.set()
+        await task
+
+        second = FakeCallbackQuery(1, 'e:n:2')
+        excess = FakeCallbackQuery(1, 'e:n:3')
+        await middleware(handler, second, {})
+        await middleware(handler, excess, {})
+        return handled, duplicate.answers, excess.answers
+
+    handled, duplicate_answers, excess_answers = asyncio.run(scenario())
+    assert handled == ['e:n:1', 'e:n:2']
+    assert duplicate_answers == [None]
+    assert excess_answers == ["Слишком много нажатий, подождите немного."]
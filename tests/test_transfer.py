@@ -0,0 +1,106 @@
+from datetime import datetime
+
+import pytest
+
+import transfer
+from transfer import ImportFileError, parse_events
+
+
+def test_csv_rows_become_records():
+    data = (
+        "title,description,date,location,url\n"
+        "Хакатон,Два дня,01.06.2030 10:00,Кронверкский 49,https://itmo.ru\n"
+        "\n"
+        "Лекция,,02.06.2030 18:30,,itmo.ru\n"
+    ).encode()
+    records, errors = parse_events(data)
+    assert errors == []
+    assert records == [
+        ('Хакатон', 'Два дня', datetime(2030, 6, 1, 10, 0), 'Кронверкский 49', 'https://itmo.ru'),
+        ('Лекция', '', datetime(2030, 6, 2, 18, 30), '', 'itmo.ru'),
+    ]
+
+
+def test_csv_semicolon_cp1251_and_extra_columns():
+    data = "event_id;Title;Date;URL\n7;Концерт;01.06.2030 19:00;https://itmo.ru\n".encode('cp1251')
+    records, errors = parse_events(data)
+    assert errors == []
+    assert records == [('Концерт', '', datetime(2030, 6, 1, 19, 0), '', 'https://itmo.ru')]
+
+
+def test_csv_errors_name_the_line():
+    data = (
+        "title,date,url\n"
+        ",01.06.2030 10:00,https://itmo.ru\n"
+        "Семинар,2030-06-01,https://itmo.ru\n"
+        "Семинар,01.06.2030 10:00,не ссылка\n"
+    ).encode()
+    records, errors = parse_events(data)
+    assert records == []
+    assert [line for line, _ in errors] == [2, 3, 4]
+    assert 'название' in errors[0][1]
+    assert 'дат' in errors[1][1]
+    assert 'ссылк' in errors[2][1]
+
+
+def test_csv_without_required_columns():
+    with pytest.raises(ImportFileError, match='date'):
+        parse_events(b"title,url\nX,https://itmo.ru\n")
+
+
+def test_empty_file():
+    with pytest.raises(ImportFileError):
+        parse_events(b"title,date,url\n")
+
+
+def test_size_and_row_limits(monkeypatch):
+    monkeypatch.setattr(transfer, 'MAX_IMPORT_BYTES', 10)
+    with pytest.raises(ImportFileError):
+        parse_events(b"title,date,url\n")
+    monkeypatch.setattr(transfer, 'MAX_IMPORT_BYTES', 1024 * 1024)
+    monkeypatch.setattr(transfer, 'MAX_IMPORT_ROWS', 2)
+    rows = "".join(f"E{n},01.06.2030 10:00,https://itmo.ru\n" for n in range(3))
+    with pytest.raises(ImportFileError):
+        parse_events(("title,date,url\n" + rows).encode())
+
+
+def test_ics_events():
+    data = (
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "BEGIN:VEVENT\r\n"
+        "SUMMARY:Meetup\\, Python\r\n"
+        "DESCRIPTION:Первая строка\\nвторая \r\n"
+        " строка\r\n"
+        "DTSTART;TZID=\"Europe/Moscow\":20300601T183000\r\n"
+        "LOCATION:Ломоносова 9\r\n"
+        "URL:https://itmo.ru/meetup\r\n"
+        "END:VEVENT\r\n"
+        "BEGIN:VEVENT\r\n"
+        "SUMMARY:Турнир\r\n"
+        "DTSTART;VALUE=DATE:20300602\r\n"
+        "URL:https://itmo.ru\r\n"
+        "END:VEVENT\r\n"
+        "END:VCALENDAR\r\n"
+    ).encode()
+    records, errors = parse_events(data)
+    assert errors == []
+    assert records == [
+        ('Meetup, Python', 'Первая строка\nвторая строка', datetime(2030, 6, 1, 18, 30), 'Ломоносова 9',
+         'https://itmo.ru/meetup'),
+        ('Турнир', '', datetime(2030, 6, 2, 0, 0), '', 'https://itmo.ru'),
+    ]
+
+
+def test_ics_errors_point_to_event_start():
+    data = (
+        "BEGIN:VCALENDAR\n"
+        "BEGIN:VEVENT\n"
+        "SUMMARY:Без даты\n"
+        "URL:https://itmo.ru\n"
+        "END:VEVENT\n"
+        "END:VCALENDAR\n"
+    ).encode()
+    records, errors = parse_events(data)
+    assert records == []
+    assert errors[0][0] == 2
@@ -0,0 +1,19 @@
+import pytest
+
+from workers import update_user_id
+
+
+@pytest.mark.parametrize('data, user_id', [
+    ({'update_id': 1, 'message': {'from': {'id': 42}, 'chat': {'id': -100}}}, 42),
+    ({'update_id': 2, 'callback_query': {'id': 'x', 'from': {'id': 7}}}, 7),
+    ({'update_id': 3, 'poll_answer': {'poll_id': 'p', 'user': {'id': 9}}}, 9),
+    ({'update_id': 4, 'channel_post': {'chat': {'id': -5}}}, -5),
+    ({'update_id': 5, 'my_chat_member': {'from': {'id': 11}, 'chat': {'id': 11}}}, 11),
+])
+def test_update_routed_by_user(data, user_id):
+    assert update_user_id(data) == user_id
+
+
+def test_update_without_user_falls_back_to_update_id():
+    assert update_user_id({'update_id': 8, 'poll': {'id': 'p', 'question': 'q'}}) == 8
+    assert update_user_id({}) == 0